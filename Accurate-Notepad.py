@@ -1,114 +1,1272 @@
 import sys
 import json
 import os
-from PyQt6.QtWidgets import (QApplication, QMainWindow, QTextEdit, QMenuBar, 
+import time
+import shutil
+import tempfile
+import threading
+import re
+import multiprocessing
+import codecs
+import locale
+import sqlite3
+from concurrent.futures import CancelledError
+from PyQt6.QtWidgets import (QApplication, QMainWindow, QTextEdit, QPlainTextEdit, QMenuBar, 
                             QFileDialog, QMessageBox, QToolBar, QStatusBar,
                             QVBoxLayout, QWidget, QTabWidget, QSplitter,
-                            QDialog, QLabel, QLineEdit, QPushButton)
-from PyQt6.QtGui import QIcon, QTextCursor, QSyntaxHighlighter, QTextCharFormat, QColor, QFont
-from PyQt6.QtCore import Qt, QRegularExpression
-import openai
-import requests
-from datetime import datetime
+                            QDialog, QLabel, QLineEdit, QPushButton, QProgressBar,
+                            QComboBox, QSpinBox, QCheckBox, QHBoxLayout, QListWidget, QListWidgetItem,
+                            QTableWidget, QTableWidgetItem, QPlainTextDocumentLayout)
+from PyQt6.QtGui import (QIcon, QTextCursor, QSyntaxHighlighter, QTextCharFormat, QColor, QFont,
+                         QTextLayout, QTextDocument, QPainter)
+from PyQt6.QtCore import (Qt, QRegularExpression, QObject, QTimer, QPoint, QRect, QSize, QEvent,
+                          QRunnable, QThreadPool, QFileSystemWatcher, pyqtSignal)
+from notepad_core import (LargeFileBuffer, RecoveryJournal, TextBuffer, TextSearch, TrigramIndex, EmbeddingIndex,
+                          ProcessPool, CompressedText, MemoryBudget, release_free_memory, utf16_length,
+                          decode_appended, line_diff, sniff_encoding, Session, Settings, profiler,
+                          LLMIntegration, LLMBatch, TelegramIntegration, TelegramQueue,
+                          InvoiceGenerator, BulkInvoiceEngine, InvoiceLedger)
 
-class CodeHighlighter(QSyntaxHighlighter):
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.highlighting_rules = []
-        
-        # Python syntax highlighting
-        keyword_format = QTextCharFormat()
-        keyword_format.setForeground(QColor(255, 100, 100))
-        keyword_format.setFontWeight(QFont.Weight.Bold)
-        keywords = [
+class Syntax:
+    # A highlighting grammar compiled into a single token pattern. Grammars
+    # are plain data, as in grammars/*.json:
+    #
+    #   name         shown to the user
+    #   extensions   file extensions it's used for, like ".c"
+    #   keywords     words highlighted as keywords
+    #   line_comment text that starts a comment running to the end of the line
+    #   strings      one-character string delimiters; backslash escapes
+    #   multiline    tokens that may span blocks, each {"begin", "end",
+    #                "format"} where format is "string" or "comment"
+    NORMAL = 0
+    
+    # Formats by name, shared by every language
+    formats = {}
+    
+    @classmethod
+    def shared_formats(cls):
+        if not cls.formats:
+            keyword_format = QTextCharFormat()
+            keyword_format.setForeground(QColor(255, 100, 100))
+            keyword_format.setFontWeight(QFont.Weight.Bold)
+            string_format = QTextCharFormat()
+            string_format.setForeground(QColor(100, 255, 100))
+            comment_format = QTextCharFormat()
+            comment_format.setForeground(QColor(150, 150, 150))
+            cls.formats.update(keyword=keyword_format, string=string_format, comment=comment_format)
+        return cls.formats
+    
+    def __init__(self, grammar):
+        self.name = grammar['name']
+        formats = self.shared_formats()
+        
+        # A single alternation tokenizes each block in one pass. Tokens that
+        # may span blocks come first, one capture group each, so they take
+        # precedence (triple quotes over plain strings); block states 1, 2...
+        # mean "inside multiline token 1, 2..."
+        alternatives = []
+        self.token_formats = {}  # capture group: format, for one-line tokens
+        self.multiline_formats = {}  # capture group/block state: format
+        self.multiline_end = {}  # block state: pattern of the closing text
+        for group, token in enumerate(grammar.get('multiline', []), 1):
+            alternatives.append('(' + QRegularExpression.escape(token['begin']) + ')')
+            self.multiline_formats[group] = formats[token['format']]
+            self.multiline_end[group] = QRegularExpression(QRegularExpression.escape(token['end']))
+            self.multiline_end[group].optimize()
+        
+        one_line = []
+        strings = [QRegularExpression.escape(quote) for quote in grammar.get('strings', [])]
+        if strings:
+            one_line.append(('|'.join(f'{quote}(?:[^{quote}\\\\]|\\\\.)*{quote}?' for quote in strings),
+                             'string'))
+        if grammar.get('line_comment'):
+            one_line.append((QRegularExpression.escape(grammar['line_comment']) + '.*', 'comment'))
+        if grammar.get('keywords'):
+            one_line.append((r'\b(?:' + '|'.join(map(QRegularExpression.escape, grammar['keywords'])) + r')\b', 'keyword'))
+        for pattern, name in one_line:
+            alternatives.append('(' + pattern + ')')
+            self.token_formats[len(alternatives)] = formats[name]
+        
+        self.token_pattern = None
+        if alternatives:
+            self.token_pattern = QRegularExpression('|'.join(alternatives))
+            self.token_pattern.optimize()
+    
+    def tokenize(self, text, block_length, state, set_format):
+        # Calls set_format(start, length, format) for every token in the
+        # block and returns the state to hand over to the next block
+        if self.token_pattern is None:
+            return self.NORMAL
+        offset = 0
+        if state in self.multiline_end:
+            offset = self.close_multiline(text, state, 0, 0, block_length, set_format)
+            if offset < 0:
+                return state
+        
+        while offset < block_length:
+            match = self.token_pattern.match(text, offset)
+            if not match.hasMatch():
+                break
+            
+            kind = match.lastCapturedIndex()
+            start = match.capturedStart()
+            offset = match.capturedEnd()
+            
+            if kind in self.multiline_end:
+                state = kind
+                offset = self.close_multiline(text, state, start, offset, block_length, set_format)
+                if offset < 0:
+                    return state
+            else:
+                set_format(start, offset - start, self.token_formats[kind])
+        
+        return self.NORMAL
+    
+    def close_multiline(self, text, state, start, search_from, block_length, set_format):
+        # Returns the offset just past the closing text, or -1 when the
+        # token runs on into the next block
+        match = self.multiline_end[state].match(text, search_from)
+        if match.hasMatch():
+            end = match.capturedEnd()
+            set_format(start, end - start, self.multiline_formats[state])
+            return end
+        
+        set_format(start, block_length - start, self.multiline_formats[state])
+        return -1
+
+class PythonSyntax(Syntax):
+    # Built in, so Python works without any grammar files
+    GRAMMAR = {
+        'name': 'Python',
+        'extensions': ['.py', '.pyw', '.pyi'],
+        'keywords': [
             'and', 'as', 'assert', 'break', 'class', 'continue', 'def', 'del',
             'elif', 'else', 'except', 'False', 'finally', 'for', 'from', 'global',
             'if', 'import', 'in', 'is', 'lambda', 'None', 'nonlocal', 'not',
             'or', 'pass', 'raise', 'return', 'True', 'try', 'while', 'with', 'yield'
-        ]
-        for word in keywords:
-            pattern = QRegularExpression(r'\b' + word + r'\b')
-            self.highlighting_rules.append((pattern, keyword_format))
-        
-        # Strings
-        string_format = QTextCharFormat()
-        string_format.setForeground(QColor(100, 255, 100))
-        self.highlighting_rules.append((QRegularExpression(r'\".*\"'), string_format))
-        self.highlighting_rules.append((QRegularExpression(r'\'.*\''), string_format))
-        
-        # Comments
-        comment_format = QTextCharFormat()
-        comment_format.setForeground(QColor(150, 150, 150))
-        self.highlighting_rules.append((QRegularExpression(r'#.*'), comment_format))
+        ],
+        'line_comment': '#',
+        'strings': ['"', "'"],
+        'multiline': [
+            {'begin': "'''", 'end': "'''", 'format': 'string'},
+            {'begin': '"""', 'end': '"""', 'format': 'string'},
+        ],
+    }
+    
+    def __init__(self):
+        super().__init__(self.GRAMMAR)
 
+class SyntaxRegistry:
+    # Picks a grammar by file extension. Grammars are read from the
+    # grammars folder next to this script and then the user's own, later
+    # files replacing earlier ones of the same name; each is compiled the
+    # first time a tab needs it and shared by every tab of that language.
+    PLAIN_TEXT = 'Plain Text'
+    
+    instance = None
+    
+    @classmethod
+    def shared(cls):
+        if cls.instance is None:
+            cls.instance = cls()
+        return cls.instance
+    
+    @staticmethod
+    def default_directories():
+        data_home = os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share')
+        return [os.path.join(os.path.dirname(os.path.abspath(__file__)), 'grammars'),
+                os.path.join(data_home, 'accurate-notepad', 'grammars')]
+    
+    def __init__(self, directories=None):
+        self.grammars = {}  # name: grammar
+        self.extensions = {}  # lower-case extension: grammar name
+        self.compiled = {}  # name: Syntax
+        self.add({'name': self.PLAIN_TEXT, 'extensions': ['.txt', '.log']})
+        self.add(PythonSyntax.GRAMMAR)
+        
+        if directories is None:
+            directories = self.default_directories()
+        for directory in directories:
+            try:
+                names = sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+            except OSError:
+                continue
+            for name in names:
+                try:
+                    with open(os.path.join(directory, name), 'r', encoding='utf-8') as f:
+                        self.add(json.load(f))
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    print(f"Error loading grammar {name}: {str(e)}")
+    
+    def add(self, grammar):
+        name = grammar['name']
+        self.grammars[name] = grammar
+        self.compiled.pop(name, None)
+        for extension in grammar.get('extensions', []):
+            self.extensions[extension.lower()] = name
+    
+    def get(self, name):
+        syntax = self.compiled.get(name)
+        if syntax is None:
+            syntax = self.compiled[name] = Syntax(self.grammars[name])
+        return syntax
+    
+    def for_path(self, path):
+        # New tabs start out as Python; files the registry doesn't know
+        # aren't highlighted
+        if not path:
+            return self.get('Python')
+        extension = os.path.splitext(path)[1].lower()
+        return self.get(self.extensions.get(extension, self.PLAIN_TEXT))
+
+class CodeHighlighter(QSyntaxHighlighter):
+    def __init__(self, parent=None, syntax=None):
+        super().__init__(parent)
+        self.syntax = syntax or SyntaxRegistry.shared().for_path(None)
+    
+    def set_syntax(self, syntax):
+        if syntax is not self.syntax:
+            self.syntax = syntax
+            self.rehighlight()
+    
+    @profiler.timed('highlighter.block')
     def highlightBlock(self, text):
-        for pattern, format in self.highlighting_rules:
-            match_iterator = pattern.globalMatch(text)
-            while match_iterator.hasNext():
-                match = match_iterator.next()
-                self.setFormat(match.capturedStart(), match.capturedLength(), format)
+        # QSyntaxHighlighter only moves on to re-highlight the next block
+        # when the state set here differs from the block's previous state
+        block_length = self.currentBlock().length() - 1
+        state = self.syntax.tokenize(text, block_length, self.previousBlockState(), self.setFormat)
+        self.setCurrentBlockState(state)
 
-class LLMIntegration:
-    def __init__(self, api_key=None):
-        self.api_key = api_key
-        self.model = "gpt-4"
+class LazyHighlighter(QObject):
+    # Documents above this many characters are highlighted lazily
+    THRESHOLD = 1024 * 1024
+    # Time budget of one idle-time slice, in milliseconds
+    SLICE_MS = 8
+    # Blocks re-highlighted synchronously after an edit before deferring
+    EDIT_LIMIT = 1000
+    
+    def __init__(self, editor, syntax=None):
+        super().__init__(editor)
+        self.editor = editor
+        self.document = editor.document()
+        self.syntax = syntax or SyntaxRegistry.shared().for_path(None)
+        self.highlighting = False
+        
+        # Everything before this cursor has been highlighted in document
+        # order; Qt keeps its position up to date across edits
+        self.done_cursor = QTextCursor(self.document)
+        self.done_cursor.setKeepPositionOnInsert(True)
+        
+        # Highlighted range that hasn't been relaid out yet. Every relayout
+        # costs about the same however small the range, so the background
+        # pass only flushes when the range scrolls into view or it finishes
+        self.pending_start = -1
+        self.pending_end = -1
+        
+        self.timer = QTimer(self)
+        self.timer.setInterval(0)
+        self.timer.timeout.connect(self.highlight_slice)
+        
+        self.scroll_timer = QTimer(self)
+        self.scroll_timer.setSingleShot(True)
+        self.scroll_timer.setInterval(50)
+        self.scroll_timer.timeout.connect(self.highlight_viewport)
+        
+        self.document.contentsChange.connect(self.on_contents_change)
+        self.editor.verticalScrollBar().valueChanged.connect(self.scroll_timer.start)
+        QTimer.singleShot(0, self.start)
+    
+    def start(self):
+        self.highlight_viewport()
+        self.timer.start()
+    
+    def set_syntax(self, syntax):
+        if syntax is not self.syntax:
+            self.syntax = syntax
+            self.done_cursor.setPosition(0)
+            self.start()
+    
+    def done_block_number(self):
+        return self.document.findBlock(self.done_cursor.position()).blockNumber()
+    
+    @profiler.timed('highlighter.lazy_blocks')
+    def highlight_blocks(self, block, stop_block_number, max_seconds=None, flush=True):
+        # Highlights from block up to stop_block_number (exclusive) and
+        # returns the first block that was not highlighted
+        if not block.isValid():
+            return block
+        deadline = time.perf_counter() + max_seconds if max_seconds is not None else None
+        first_position = block.position()
+        last_block = block
+        ranges = []
+        
+        def set_format(start, length, char_format):
+            format_range = QTextLayout.FormatRange()
+            format_range.start = start
+            format_range.length = length
+            format_range.format = char_format
+            ranges.append(format_range)
+        
+        while block.isValid() and block.blockNumber() < stop_block_number:
+            ranges.clear()
+            state = self.syntax.tokenize(block.text(), block.length() - 1,
+                                         block.previous().userState(), set_format)
+            block.setUserState(state)
+            block.layout().setFormats(ranges)
+            last_block = block
+            block = block.next()
+            
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+        
+        end_position = last_block.position() + last_block.length()
+        if self.pending_start < 0:
+            self.pending_start, self.pending_end = first_position, end_position
+        else:
+            self.pending_start = min(self.pending_start, first_position)
+            self.pending_end = max(self.pending_end, end_position)
+        if flush:
+            self.flush()
+        return block
+    
+    def flush(self):
+        if self.pending_start < 0:
+            return
+        end = min(self.pending_end, self.document.characterCount())
+        self.highlighting = True
+        try:
+            self.document.markContentsDirty(self.pending_start, end - self.pending_start)
+        finally:
+            self.highlighting = False
+        self.pending_start = self.pending_end = -1
+    
+    def highlight_viewport(self):
+        first = self.editor.cursorForPosition(QPoint(0, 0)).block()
+        bottom_right = QPoint(self.editor.viewport().width(), self.editor.viewport().height())
+        last = self.editor.cursorForPosition(bottom_right).block()
+        if last.blockNumber() >= self.done_block_number():
+            self.highlight_blocks(first, last.blockNumber() + 1)
+        elif self.pending_start <= last.position() and first.position() < self.pending_end:
+            self.flush()
+    
+    def highlight_slice(self):
+        block = self.document.findBlock(self.done_cursor.position())
+        block = self.highlight_blocks(block, self.document.blockCount(), self.SLICE_MS / 1000,
+                                      flush=False)
+        if block.isValid():
+            self.done_cursor.setPosition(block.position())
+        else:
+            self.done_cursor.movePosition(QTextCursor.MoveOperation.End)
+            self.timer.stop()
+            self.flush()
+    
+    def on_contents_change(self, position, chars_removed, chars_added):
+        if self.highlighting:
+            return
         
-    def set_api_key(self, api_key):
-        self.api_key = api_key
+        block = self.document.findBlock(position)
+        first_changed = block.blockNumber()
+        last_changed = self.document.findBlock(position + chars_added).blockNumber()
+        done = self.done_block_number()
+        if first_changed >= done:
+            # The background pass will get here; only fix up what is visible
+            self.highlight_viewport()
+            if not self.done_cursor.atEnd():
+                self.timer.start()
+            return
         
-    def query(self, prompt, max_tokens=150):
-        if not self.api_key:
-            return "Error: No API key configured"
+        # Re-highlight the edited blocks, then keep going only while the
+        # state handed to the next block keeps changing
+        while block.isValid() and block.blockNumber() < done:
+            if block.blockNumber() - first_changed > self.EDIT_LIMIT:
+                # Big paste or a freshly opened triple quote: leave the rest
+                # to the idle-time pass
+                self.done_cursor.setPosition(block.position())
+                self.timer.start()
+                break
             
-        try:
-            openai.api_key = self.api_key
-            response = openai.ChatCompletion.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=max_tokens
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            return f"Error: {str(e)}"
+            state_before = block.userState()
+            next_block = self.highlight_blocks(block, block.blockNumber() + 1, flush=False)
+            if block.blockNumber() >= last_changed and block.userState() == state_before:
+                break
+            block = next_block
+        self.flush()
 
-class TelegramIntegration:
-    def __init__(self, token=None, chat_id=None):
-        self.token = token
-        self.chat_id = chat_id
+class LineNumberArea(QWidget):
+    def __init__(self, editor):
+        super().__init__(editor)
+        self.editor = editor
+    
+    def sizeHint(self):
+        return QSize(self.editor.line_number_width(), 0)
+    
+    def paintEvent(self, event):
+        self.editor.paint_line_numbers(event)
+
+class CodeEditor(QPlainTextEdit):
+    # Tab editor. QPlainTextEdit lays text out block by block, so edits
+    # and scrolling don't touch the rest of a big document the way the
+    # rich-text QTextEdit layout does.
+    #
+    # QTextDocument can't drop only its oldest undo steps, so the whole
+    # undo history is cleared once it holds more than max_undo_chars
+    # characters of edited text; this many unless the window sets a limit
+    MAX_UNDO_CHARS = 32 * 1024 * 1024
+    # Rough bytes Qt keeps per character and per line (block) of a
+    # document, per highlighted line and per line laid out for display;
+    # see benchmarks/bench_memory.py
+    CHAR_BYTES = 3  # UTF-16 in the document, plus the text_buffer mirror
+    BLOCK_BYTES = 600
+    FORMAT_BYTES = 150
+    LAYOUT_BYTES = 1600
+    
+    undo_trimmed = pyqtSignal()
+    
+    def __init__(self):
+        super().__init__()
+        # Line number of the first block, for views onto part of a file
+        self.line_offset = 0
+        self.max_undo_chars = self.MAX_UNDO_CHARS
+        self.undo_chars = 0
+        self.undo_revision = self.document().revision()
+        # First and last block shown since the layout was last dropped;
+        # Qt keeps what it has laid out
+        self.laid_out = None
+        # Mirror of the text that background tasks can read; see text_snapshot
+        self.text_buffer = TextBuffer()
+        # The stacks can't be changed from inside the change signal
+        self.trim_timer = QTimer(self)
+        self.trim_timer.setSingleShot(True)
+        self.trim_timer.setInterval(0)
+        self.trim_timer.timeout.connect(self.trim_undo)
+        
+        self.line_number_area = LineNumberArea(self)
+        self.blockCountChanged.connect(self.update_line_number_width)
+        self.updateRequest.connect(self.update_line_number_area)
+        self.document().contentsChange.connect(self.on_contents_change)
+        self.verticalScrollBar().valueChanged.connect(self.note_laid_out)
+        self.update_line_number_width()
+    
+    def line_number_width(self):
+        digits = len(str(self.line_offset + max(1, self.blockCount())))
+        return 10 + self.fontMetrics().horizontalAdvance('9') * digits
+    
+    def update_line_number_width(self):
+        self.setViewportMargins(self.line_number_width(), 0, 0, 0)
+    
+    def update_line_number_area(self, rect, dy):
+        if dy:
+            self.line_number_area.scroll(0, dy)
+        else:
+            self.line_number_area.update(0, rect.y(), self.line_number_area.width(), rect.height())
+        if rect.contains(self.viewport().rect()):
+            self.update_line_number_width()
+    
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        rect = self.contentsRect()
+        self.line_number_area.setGeometry(QRect(rect.left(), rect.top(), self.line_number_width(), rect.height()))
+    
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() == QEvent.Type.FontChange:
+            self.update_line_number_width()
+    
+    def paint_line_numbers(self, event):
+        # Only the blocks inside the repainted strip are visited
+        painter = QPainter(self.line_number_area)
+        painter.fillRect(event.rect(), QColor(51, 0, 0))
+        painter.setPen(QColor(150, 150, 150))
+        painter.setFont(self.font())
+        width = self.line_number_area.width() - 5
+        height = self.fontMetrics().height()
+        
+        block = self.firstVisibleBlock()
+        top = round(self.blockBoundingGeometry(block).translated(self.contentOffset()).top())
+        while block.isValid() and top <= event.rect().bottom():
+            bottom = top + round(self.blockBoundingRect(block).height())
+            if block.isVisible() and bottom >= event.rect().top():
+                painter.drawText(0, top, width, height, Qt.AlignmentFlag.AlignRight,
+                                 str(self.line_offset + block.blockNumber() + 1))
+            top = bottom
+            block = block.next()
+        painter.end()
+    
+    def set_text(self, text):
+        # setPlainText, with the buffer started over from text instead of
+        # mirroring the change
+        buffer, self.text_buffer = self.text_buffer, None
+        self.setPlainText(text)
+        self.laid_out = None
+        if buffer is not None:
+            self.text_buffer = TextBuffer(text)
+    
+    def added_text(self, position, added):
+        # The text a contentsChange signal reports as added
+        document = self.document()
+        cursor = QTextCursor(document)
+        cursor.setPosition(position)
+        cursor.setPosition(min(position + added, document.characterCount() - 1),
+                           QTextCursor.MoveMode.KeepAnchor)
+        return cursor.selectedText().replace('\u2029', '\n')
+    
+    def text_snapshot(self):
+        # The text for a background task: an O(1) snapshot of the buffer,
+        # or a copy if the buffer is off or has somehow got out of step
+        buffer = self.text_buffer
+        if buffer is not None and buffer.utf16_length() == self.document().characterCount() - 1:
+            return buffer.snapshot()
+        return self.toPlainText()
+    
+    def on_contents_change(self, position, removed, added):
+        # Highlighting reports changes too but leaves the revision alone
+        document = self.document()
+        if document.revision() == self.undo_revision:
+            return
+        self.undo_revision = document.revision()
+        if self.text_buffer is not None:
+            try:
+                self.text_buffer.replace_utf16(position, removed, self.added_text(position, added))
+            except ValueError:
+                self.text_buffer = None  # text_snapshot copies from now on
         
-    def send_message(self, text):
-        if not self.token or not self.chat_id:
-            return False
-            
-        url = f"https://api.telegram.org/bot{self.token}/sendMessage"
-        params = {
-            'chat_id': self.chat_id,
-            'text': text
+        if not document.isUndoAvailable():
+            self.undo_chars = 0
+            return
+        
+        # Each undo step holds on to the text it removed or inserted
+        self.undo_chars += removed + added
+        if self.undo_chars > self.max_undo_chars:
+            self.trim_timer.start()
+    
+    def trim_undo(self):
+        self.document().clearUndoRedoStacks(QTextDocument.Stacks.UndoStack)
+        self.undo_chars = 0
+        self.undo_trimmed.emit()
+    
+    def note_laid_out(self):
+        # On scrolling; the estimate in memory_use goes by this span
+        first = self.firstVisibleBlock().blockNumber()
+        last = min(first + self.viewport().height() // max(1, self.fontMetrics().height()),
+                   self.blockCount() - 1)
+        if self.laid_out is not None:
+            first, last = min(first, self.laid_out[0]), max(last, self.laid_out[1])
+        self.laid_out = first, last
+    
+    def drop_layout(self):
+        # A new document layout lets go of the line and glyph data of every
+        # block; Qt lays out again only the blocks it shows
+        document = self.document()
+        document.setDocumentLayout(QPlainTextDocumentLayout(document))
+        self.laid_out = None
+    
+    def memory_use(self, highlighted=True):
+        # Estimated bytes held, by the parts MemoryBudget can take back
+        document = self.document()
+        blocks = document.blockCount()
+        layout = blocks * self.FORMAT_BYTES if highlighted else 0
+        if self.laid_out is not None:
+            layout += (self.laid_out[1] - self.laid_out[0] + 1) * self.LAYOUT_BYTES
+        return {
+            'layout': layout,
+            'undo': self.undo_chars * 2,  # UTF-16
+            'text': document.characterCount() * self.CHAR_BYTES + blocks * self.BLOCK_BYTES,
         }
+
+class LargeFileView(CodeEditor):
+    # Files above this size open read-only, paged in from a memory map
+    THRESHOLD = 64 * 1024 * 1024
+    # Number of pages kept in the editor at a time
+    WINDOW_PAGES = 3
+    
+    def __init__(self, path, syntax=None):
+        super().__init__()
+        self.buffer = LargeFileBuffer(path)
+        # Pages come and go, so there is no text to mirror
+        self.text_buffer = None
+        self.first_page = 0
+        self.last_page = -1
+        self.shifting = False
+        
+        self.setReadOnly(True)
+        self.setUndoRedoEnabled(False)
+        # Unwrapped lines keep the scroll bar value equal to the line number
+        self.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
+        self.verticalScrollBar().valueChanged.connect(self.on_scroll)
+        
+        self.load_window(0)
+        self.highlighter = LazyHighlighter(self, syntax)
+    
+    def load_window(self, first_page):
+        if not self.buffer.pages:
+            return
+        first_page = max(0, min(first_page, len(self.buffer.pages) - self.WINDOW_PAGES))
+        last_page = min(first_page + self.WINDOW_PAGES, len(self.buffer.pages)) - 1
+        if (first_page, last_page) == (self.first_page, self.last_page):
+            return
         
+        # Keep the same file line at the top of the viewport
+        top_line = self.buffer.pages[self.first_page][2] + self.verticalScrollBar().value()
+        
+        self.shifting = True
         try:
-            response = requests.post(url, params=params)
-            return response.status_code == 200
-        except Exception:
-            return False
+            self.first_page, self.last_page = first_page, last_page
+            self.line_offset = self.buffer.pages[first_page][2]
+            self.setPlainText(self.buffer.read_pages(first_page, last_page))
+            self.verticalScrollBar().setValue(top_line - self.buffer.pages[first_page][2])
+        finally:
+            self.shifting = False
+    
+    def on_scroll(self, value):
+        if self.shifting:
+            return
+        bar = self.verticalScrollBar()
+        if value >= bar.maximum() and self.last_page < len(self.buffer.pages) - 1:
+            self.load_window(self.first_page + 1)
+        elif value <= bar.minimum() and self.first_page > 0:
+            self.load_window(self.first_page - 1)
+    
+    def go_to_line(self, line):
+        self.load_window(self.buffer.page_for_line(line) - 1)
+        self.verticalScrollBar().setValue(line - self.buffer.pages[self.first_page][2])
+    
+    def refresh(self):
+        # The file changed on disk: page in what was appended, or start
+        # over if it was rewritten. A view scrolled to the end follows it.
+        bar = self.verticalScrollBar()
+        at_end = self.last_page == len(self.buffer.pages) - 1 and bar.value() >= bar.maximum()
+        top_line = self.line_offset + bar.value()
+        if not self.buffer.extend():
+            path = self.buffer.path
+            self.buffer.close()
+            self.buffer = LargeFileBuffer(path)
+        if not self.buffer.pages:
+            self.setPlainText("")
+            return
+        # Force the window to be read again
+        self.first_page, self.last_page = 0, -1
+        self.go_to_line(self.buffer.line_count if at_end else top_line)
+    
+    def release(self):
+        self.buffer.close()
+
+class FileTaskSignals(QObject):
+    # object rather than int: file sizes overflow a C int
+    progress = pyqtSignal(object, object)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+class FileTask(QRunnable):
+    # Files are read and written in chunks of this many bytes/characters
+    CHUNK_SIZE = 1024 * 1024
+    
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.signals = FileTaskSignals()
+        self.cancel_event = threading.Event()
+        # The window keeps a reference until the task reports back
+        self.setAutoDelete(False)
+    
+    def cancel(self):
+        self.cancel_event.set()
+    
+    def run(self):
+        try:
+            result = self.work()
+        except CancelledError:
+            # Its job in the process pool was cancelled, e.g. its tab closed
+            self.signals.cancelled.emit()
+            return
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+            return
+        if self.cancel_event.is_set():
+            self.signals.cancelled.emit()
+        else:
+            self.signals.finished.emit(result)
 
-class InvoiceGenerator:
-    def generate_invoice(self, client_name, items, total_amount):
-        invoice = f"""
-        INVOICE
-        Date: {datetime.now().strftime('%Y-%m-%d')}
-        Client: {client_name}
-        
-        ITEMS:
-        """
-        
-        for item in items:
-            invoice += f"{item['name']} - {item['quantity']} x ${item['price']:.2f} = ${item['quantity'] * item['price']:.2f}\n"
+class ReadFileTask(FileTask):
+    def __init__(self, path, encoding=None):
+        super().__init__(path)
+        self.encoding = encoding  # None: detected from the file
+        self.newline = None  # line ending found while detecting
+        self.size = None  # bytes read
+    
+    @profiler.timed('file.open')
+    def work(self):
+        if self.encoding is not None:
+            return self.read()
+        self.encoding, self.newline = sniff_encoding(self.path)
+        try:
+            return self.read()
+        except UnicodeDecodeError:
+            # Past the sample after all; latin-1 reads and saves any bytes
+            # back unchanged
+            self.encoding = 'latin-1'
+            return self.read()
+    
+    def read(self):
+        parts = []
+        with open(self.path, 'r', encoding=self.encoding) as file:
+            total = os.fstat(file.fileno()).st_size
+            while not self.cancel_event.is_set():
+                chunk = file.read(self.CHUNK_SIZE)
+                if not chunk:
+                    break
+                parts.append(chunk)
+                self.signals.progress.emit(file.buffer.tell(), total)
+            self.size = file.buffer.tell()
+        return ''.join(parts)
+
+class DiffReloadTask(ReadFileTask):
+    # Reads a file that changed on disk and works out, in the process pool,
+    # the line hunks that turn the editor's text (a string or a TextBuffer)
+    # into it
+    def __init__(self, path, old_text, pool, owner, encoding=None):
+        super().__init__(path, encoding)
+        self.old_text = old_text
+        self.pool = pool
+        self.owner = owner
+    
+    @profiler.timed('file.reload')
+    def work(self):
+        text = super().work()
+        try:
+            return self.pool.run(line_diff, self.old_text, text, priority=ProcessPool.BACKGROUND,
+                                 owner=self.owner, cancel_event=self.cancel_event)
+        finally:
+            self.old_text = None
+
+class SaveFileTask(FileTask):
+    # Writes text, a string or a TextBuffer, (or copies source_path) to a
+    # temporary file next to the target and swaps it in with os.replace, so
+    # a crash or a cancel never leaves a truncated file behind
+    def __init__(self, path, text=None, source_path=None, encoding=None, newline=None):
+        super().__init__(path)
+        self.text = text
+        self.source_path = source_path
+        self.encoding = encoding
+        self.newline = newline  # None: the platform's
+    
+    @profiler.timed('file.save')
+    def work(self):
+        directory, name = os.path.split(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+        try:
+            if self.source_path is not None:
+                with open(self.source_path, 'rb') as source, os.fdopen(fd, 'wb') as file:
+                    total = os.fstat(source.fileno()).st_size
+                    self.copy_chunks(source.read, file, total)
+            else:
+                with os.fdopen(fd, 'w', encoding=self.encoding, newline=self.newline) as file:
+                    text = self.text
+                    total = len(text)
+                    if isinstance(text, TextBuffer):
+                        chunks = self.join_pieces(text.chunks())
+                    else:
+                        chunks = (text[i:i + self.CHUNK_SIZE] for i in range(0, total, self.CHUNK_SIZE))
+                    self.copy_chunks(lambda size, chunks=chunks: next(chunks, ''), file, total)
             
-        invoice += f"\nTOTAL AMOUNT: ${total_amount:.2f}"
-        return invoice
+            if self.cancel_event.is_set():
+                os.remove(temp_path)
+                return None
+            
+            if os.path.exists(self.path):
+                shutil.copymode(self.path, temp_path)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return self.path
+    
+    def join_pieces(self, pieces):
+        # A TextBuffer's small pieces, joined into writes of about CHUNK_SIZE
+        parts, length = [], 0
+        for piece in pieces:
+            parts.append(piece)
+            length += len(piece)
+            if length >= self.CHUNK_SIZE:
+                yield ''.join(parts)
+                parts, length = [], 0
+        if parts:
+            yield ''.join(parts)
+    
+    def copy_chunks(self, read, file, total):
+        done = 0
+        while not self.cancel_event.is_set():
+            chunk = read(self.CHUNK_SIZE)
+            if not chunk:
+                break
+            file.write(chunk)
+            done += len(chunk)
+            self.signals.progress.emit(done, total)
+        file.flush()
+        os.fsync(file.fileno())
+
+class LLMTaskSignals(QObject):
+    chunk = pyqtSignal(str)
+    finished = pyqtSignal()
+
+class LLMQueryTask(QRunnable):
+    def __init__(self, llm, prompt, max_tokens=150, context=False):
+        super().__init__()
+        self.llm = llm
+        self.prompt = prompt
+        self.max_tokens = max_tokens
+        self.context = context
+        self.signals = LLMTaskSignals()
+        self.cancel_event = threading.Event()
+        self.setAutoDelete(False)
+    
+    def cancel(self):
+        self.cancel_event.set()
+    
+    def run(self):
+        stream = self.llm.stream_query(self.prompt, self.max_tokens, self.context)
+        try:
+            for piece in stream:
+                if self.cancel_event.is_set():
+                    break
+                self.signals.chunk.emit(piece)
+        finally:
+            stream.close()
+            self.signals.finished.emit()
+
+class LLMBatchSignals(FileTaskSignals):
+    result = pyqtSignal(str, str)
+
+class LLMBatchTask(FileTask):
+    def __init__(self, batch, items, total, output_dir=None):
+        super().__init__(output_dir or "LLM batch")
+        self.signals = LLMBatchSignals()
+        self.batch = batch
+        self.items = items
+        self.total = total
+        self.output_dir = output_dir
+        self.done = 0
+        self.lock = threading.Lock()
+    
+    def output_path(self, name):
+        return os.path.join(self.output_dir, re.sub(r'[^\w.-]+', '_', name) + '.txt')
+    
+    def on_result(self, name, response):
+        if self.output_dir:
+            with open(self.output_path(name), 'w') as f:
+                f.write(response)
+        else:
+            self.signals.result.emit(name, response)
+        with self.lock:
+            self.done += 1
+            self.signals.progress.emit(self.done, self.total)
+    
+    def work(self):
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+        self.batch.run(self.items, self.on_result, self.cancel_event)
+        return self.done
+
+class TelegramSignals(QObject):
+    done = pyqtSignal(bool, str)
+
+class BulkInvoiceTask(FileTask):
+    def __init__(self, engine, path):
+        super().__init__(path)
+        self.engine = engine
+    
+    def work(self):
+        return self.engine.run(self.path, self.signals.progress.emit, self.cancel_event)
+
+class LedgerReportTask(FileTask):
+    # The first report copies the ledger into memory; later ones only
+    # fetch what was added since
+    def __init__(self, ledger, start, end, client, limit):
+        super().__init__(ledger.path)
+        self.ledger = ledger
+        self.args = (start, end, client, limit)
+    
+    def work(self):
+        return self.ledger.report(*self.args)
+
+class SearchSignals(FileTaskSignals):
+    # Lists of (source, name, line, column, matched text, line text)
+    matches = pyqtSignal(list)
+
+class SearchTask(FileTask):
+    # Matches are sent in batches as they are found. Sources are
+    # (key, name, text, TextBuffer or LargeFileBuffer) tuples for open
+    # tabs, searched side by side in the process pool (huge files page by
+    # page here); a TrigramIndex searches a folder instead, with file paths
+    # as keys.
+    MAX_MATCHES = 10000
+    BATCH_SECONDS = 0.1
+    
+    def __init__(self, search, sources=(), index=None, pool=None):
+        super().__init__(index.directory if index else "search")
+        self.signals = SearchSignals()
+        self.search = search
+        self.sources = sources
+        self.index = index
+        self.pool = pool
+        self.batch = []
+        self.count = 0
+        self.last_emit = time.perf_counter()
+    
+    def add_matches(self, key, name, matches):
+        for line, column, matched, line_text in matches:
+            if self.cancel_event.is_set() or self.count >= self.MAX_MATCHES:
+                return False
+            self.batch.append((key, name, line, column, matched, line_text))
+            self.count += 1
+            if time.perf_counter() - self.last_emit > self.BATCH_SECONDS:
+                self.emit_batch()
+        return True
+    
+    def emit_batch(self):
+        if self.batch:
+            self.signals.matches.emit(self.batch)
+            self.batch = []
+        self.last_emit = time.perf_counter()
+    
+    def search_buffer(self, key, name, buffer):
+        # Huge files are searched page by page; pages end on line breaks
+        for page, (_, _, first_line) in enumerate(buffer.pages):
+            try:
+                text = buffer.read_pages(page, page)
+            except ValueError:
+                # The tab was closed and its map released
+                return
+            if not self.add_matches(key, name, self.search.matches(text, first_line)):
+                return
+    
+    def work(self):
+        if self.index:
+            self.index.update(self.cancel_event)
+            paths = self.index.candidates(self.search)
+            for done, path in enumerate(paths, 1):
+                try:
+                    encoding, _ = sniff_encoding(path)
+                    with open(path, 'r', encoding=encoding, errors='replace') as f:
+                        text = f.read()
+                except OSError:
+                    continue
+                if not self.add_matches(path, os.path.relpath(path, self.index.directory),
+                                        self.search.matches(text)):
+                    break
+                self.signals.progress.emit(done, len(paths))
+        else:
+            jobs = [source if isinstance(source, LargeFileBuffer)
+                    else self.pool.submit(self.search.find_all, source, self.MAX_MATCHES, owner=key)
+                    for key, name, source in self.sources]
+            try:
+                for done, ((key, name, _), job) in enumerate(zip(self.sources, jobs), 1):
+                    if isinstance(job, LargeFileBuffer):
+                        self.search_buffer(key, name, job)
+                    else:
+                        try:
+                            matches = job.result(self.cancel_event)
+                        except CancelledError:
+                            # Its tab was closed, or the whole search cancelled
+                            if self.cancel_event.is_set():
+                                break
+                            continue
+                        if not self.add_matches(key, name, matches):
+                            break
+                    self.signals.progress.emit(done, len(self.sources))
+            finally:
+                for job in jobs:
+                    if not isinstance(job, LargeFileBuffer):
+                        self.pool.cancel(job)
+        self.emit_batch()
+        return self.count
+
+class SemanticSearchTask(FileTask):
+    # Brings the embedding index up to date, then sends the chunks closest
+    # to the query as matches at the start of their first line
+    MAX_RESULTS = 20
+    
+    def __init__(self, index, query):
+        super().__init__(index.directory)
+        self.signals = SearchSignals()
+        self.index = index
+        self.query = query
+    
+    def work(self):
+        self.index.update_folders(self.cancel_event, self.signals.progress.emit)
+        if self.cancel_event.is_set():
+            return 0
+        matches = []
+        for key, line, text, _ in self.index.search(self.query, self.MAX_RESULTS):
+            first_line = text.lstrip('\n').split('\n', 1)[0]
+            line += len(text) - len(text.lstrip('\n'))
+            matches.append((key, os.path.basename(key), line, 0, '', first_line))
+        self.signals.matches.emit(matches)
+        return len(matches)
+
+class IndexTask(FileTask):
+    # Updates the embedding index from one file, or from every indexed
+    # folder when no file is given
+    def __init__(self, index, file_path=None):
+        super().__init__(file_path or index.directory)
+        self.index = index
+        self.file_path = file_path
+    
+    def work(self):
+        if self.file_path:
+            return int(self.index.update_file(self.file_path))
+        return self.index.update_folders(self.cancel_event, self.signals.progress.emit)
+
+class ReplaceAllTask(FileTask):
+    def __init__(self, search, replacement, text, pool, owner):
+        super().__init__("replace")
+        self.search = search
+        self.replacement = replacement
+        self.text = text
+        self.pool = pool
+        self.owner = owner
+    
+    def work(self):
+        return self.pool.run(self.search.replace_all, self.text, self.replacement,
+                             owner=self.owner, cancel_event=self.cancel_event)
+
+class CompressTask(FileTask):
+    # Compresses the text of a tab that is giving its memory back
+    def __init__(self, text):
+        super().__init__(None)
+        self.text = text
+    
+    def work(self):
+        return CompressedText(self.text)
+
+class AutosaveManager(QObject):
+    # Journals every edit of the tracked editors so unsaved work survives a
+    # crash or a close without saving. Edits are buffered and appended to
+    # disk every few seconds; a journal is compacted into a snapshot once
+    # its log gets large.
+    FLUSH_MS = 2000
+    
+    def __init__(self, directory=None, parent=None):
+        super().__init__(parent)
+        self.directory = directory or RecoveryJournal.default_directory()
+        self.journals = {}  # editor: RecoveryJournal
+        self.revisions = {}  # editor: document revision seen last
+        # Journals of editors whose text is kept elsewhere for a while
+        self.suspended = {}  # editor: RecoveryJournal
+        self.timer = QTimer(self)
+        self.timer.setInterval(self.FLUSH_MS)
+        self.timer.timeout.connect(self.flush_all)
+        self.timer.start()
+    
+    def track(self, editor, title, journal=None):
+        if journal is None:
+            journal = RecoveryJournal(self.directory)
+            if editor.document().isEmpty():
+                journal.reset_to_empty()
+        journal.meta['title'] = title
+        self.journals[editor] = journal
+        self.revisions[editor] = editor.document().revision()
+        editor.document().contentsChange.connect(
+            lambda position, removed, added: self.on_contents_change(editor, position, removed, added))
+    
+    def untrack(self, editor):
+        journal = self.journals.pop(editor, None) or self.suspended.pop(editor, None)
+        self.revisions.pop(editor, None)
+        if journal:
+            journal.discard()
+    
+    def suspend(self, editor):
+        # Stops journaling an editor that is about to be emptied; the
+        # journal keeps any unsaved edits on disk until resume()
+        journal = self.journals.pop(editor, None)
+        self.revisions.pop(editor, None)
+        if journal:
+            self.flush(editor, journal)
+            self.suspended[editor] = journal
+    
+    def resume(self, editor):
+        # Once the editor holds the journaled text again
+        journal = self.suspended.pop(editor, None)
+        if journal:
+            self.journals[editor] = journal
+            self.revisions[editor] = editor.document().revision()
+    
+    def set_file(self, editor, path, title, revision=None, encoding=None, newline=None):
+        # The editor matches the file on disk again, so its journal can
+        # start over; if it was edited while a save ran, rebase on a
+        # snapshot instead
+        journal = self.journals.get(editor)
+        if not journal:
+            return
+        journal.meta['title'] = title
+        if revision is None or revision == editor.document().revision():
+            journal.reset_to_file(path, encoding, newline)
+        else:
+            journal.meta.update(path=path, encoding=encoding, newline=newline)
+            journal.snapshot(editor.toPlainText())
+    
+    def on_contents_change(self, editor, position, removed, added):
+        journal = self.journals.get(editor)
+        document = editor.document()
+        # Highlighting also reports changes but leaves the revision alone
+        if journal is None or document.revision() == self.revisions[editor]:
+            return
+        self.revisions[editor] = document.revision()
+        journal.record(position, removed, editor.added_text(position, added))
+    
+    def flush_all(self):
+        for editor, journal in self.journals.items():
+            self.flush(editor, journal)
+    
+    def flush(self, editor, journal):
+        if not journal.pending:
+            return
+        try:
+            # Documents that started with unsaved text need that text as
+            # their base before any edits can be logged
+            if journal.meta['base'] is None or journal.flush():
+                journal.snapshot(editor.toPlainText())
+        except OSError as e:
+            print(f"Error writing recovery journal: {str(e)}")
+    
+    def discard_all(self, keep=()):
+        # The journals of editors in keep are written out instead, for the
+        # next start to recover
+        for editor, journal in [*self.journals.items(), *self.suspended.items()]:
+            if editor in keep:
+                self.flush(editor, journal)
+            else:
+                journal.discard()
+        self.journals.clear()
+        self.suspended.clear()
+        self.revisions.clear()
+
+class FileWatcher(QObject):
+    # Tells the window when open files change on disk. QFileSystemWatcher
+    # sits on inotify (or the platform's equivalent), so nothing is polled
+    # however many tabs are open; a burst of events for a file is reported
+    # once, at most every DELAY_MS.
+    DELAY_MS = 200
+    changed = pyqtSignal(str)
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.on_file_changed)
+        self.watcher.directoryChanged.connect(self.on_directory_changed)
+        self.counts = {}  # path: number of tabs showing it
+        self.missing = set()  # watched paths that don't exist right now
+        self.pending = set()
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(self.DELAY_MS)
+        self.timer.timeout.connect(self.emit_pending)
+    
+    def watch(self, path):
+        self.counts[path] = self.counts.get(path, 0) + 1
+        if self.counts[path] == 1:
+            self.add(path)
+    
+    def unwatch(self, path):
+        if path not in self.counts:
+            return
+        self.counts[path] -= 1
+        if self.counts[path]:
+            return
+        del self.counts[path]
+        self.pending.discard(path)
+        if path in self.missing:
+            self.missing.discard(path)
+            self.update_directory(os.path.dirname(path))
+        else:
+            self.watcher.removePath(path)
+    
+    def add(self, path):
+        if self.watcher.addPath(path):
+            return
+        # Gone, perhaps only for a moment while it's replaced: wait for it
+        # to show up in its folder again
+        self.missing.add(path)
+        self.update_directory(os.path.dirname(path))
+    
+    def update_directory(self, directory):
+        needed = any(os.path.dirname(path) == directory for path in self.missing)
+        if needed and directory not in self.watcher.directories():
+            self.watcher.addPath(directory)
+        elif not needed and directory in self.watcher.directories():
+            self.watcher.removePath(directory)
+    
+    def on_file_changed(self, path):
+        # Files replaced by rename or deleted are dropped by the watcher
+        if path not in self.watcher.files():
+            self.add(path)
+        self.queue(path)
+    
+    def on_directory_changed(self, directory):
+        for path in [path for path in self.missing if os.path.dirname(path) == directory]:
+            if os.path.exists(path) and self.watcher.addPath(path):
+                self.missing.discard(path)
+                self.queue(path)
+        self.update_directory(directory)
+    
+    def queue(self, path):
+        self.pending.add(path)
+        if not self.timer.isActive():
+            self.timer.start()
+    
+    def emit_pending(self):
+        pending, self.pending = self.pending, set()
+        for path in pending:
+            self.changed.emit(path)
+
+class Document:
+    # What the window knows about one tab, looked up by its editor widget
+    # so it stays right however tabs are moved or closed
+    __slots__ = ('path', 'encoding', 'newline', 'dirty', 'mtime', 'size', 'tail', 'highlighter',
+                 'unhighlighted', 'loaded', 'snapshot', 'last_active', 'position')
+    # Bytes kept from the end of the file, to tell an append from a rewrite
+    TAIL_SIZE = 256
+    
+    def __init__(self, path=None, encoding=None, highlighter=None):
+        self.path = path
+        self.encoding = encoding  # None: the platform default
+        self.newline = None  # line ending written on save; None: the platform's
+        self.dirty = False
+        self.mtime = None
+        self.size = None  # bytes of the file the editor holds
+        self.tail = b''
+        self.highlighter = highlighter
+        # Highlighting was dropped to save memory and is redone when shown
+        self.unhighlighted = False
+        # Unloaded tabs keep their editor but not its text, which is read
+        # from the file again or, if there is one, unpacked from snapshot
+        self.loaded = True
+        self.snapshot = None  # CompressedText
+        self.last_active = time.monotonic()
+        # (cursor, first visible line) to go back to once the text is loaded
+        self.position = None
+    
+    def set_path(self, path, size=None):
+        # size: how much of the file was read, if it may have grown since
+        self.path = path
+        try:
+            stat = os.stat(path)
+            self.mtime = stat.st_mtime_ns
+            self.size = stat.st_size if size is None else size
+            with open(path, 'rb') as f:
+                f.seek(max(0, self.size - self.TAIL_SIZE))
+                self.tail = f.read(self.size - f.tell())
+        except OSError:
+            self.mtime = self.size = None
+            self.tail = b''
 
 class AccurateNotepad(QMainWindow):
+    # Seconds a clean tab stays in the background before its text is unloaded
+    UNLOAD_AFTER = 10 * 60
+    # Bigger appends to an open file are read in the background
+    MAX_APPEND = 4 * 1024 * 1024
+    
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Accurate Notepad")
@@ -119,7 +1277,7 @@ class AccurateNotepad(QMainWindow):
             QMainWindow {
                 background-color: #330000;
             }
-            QTextEdit {
+            QTextEdit, QPlainTextEdit {
                 background-color: #1a0000;
                 color: #ffffff;
                 font-family: Consolas;
@@ -161,15 +1319,54 @@ class AccurateNotepad(QMainWindow):
         self.tabs = QTabWidget()
         self.tabs.setTabsClosable(True)
         self.tabs.tabCloseRequested.connect(self.close_tab)
+        self.tabs.currentChanged.connect(self.tab_changed)
         self.setCentralWidget(self.tabs)
         
         # Initialize modules
-        self.llm = LLMIntegration()
+        self.embeddings = EmbeddingIndex()
+        self.llm = LLMIntegration(index=self.embeddings)
         self.telegram = TelegramIntegration()
+        self.telegram_signals = TelegramSignals()
+        self.telegram_signals.done.connect(self.telegram_sent)
+        self.telegram_queue = TelegramQueue(self.telegram, on_done=self.telegram_signals.done.emit)
         self.invoice_generator = InvoiceGenerator()
+        # CPU-heavy work on texts, in spawned processes rather than forks
+        # of the running Qt process
+        self.process_pool = ProcessPool(mp_context=multiprocessing.get_context('spawn'))
+        self.ledger = InvoiceLedger()
+        self.invoice_report = None  # last report shown, for Open as Tab
+        
+        # LLM queries still streaming, mapped to their response tab
+        self.llm_tasks = {}
         
         # File management
-        self.current_files = {}  # tab index: filepath
+        self.documents = {}  # editor widget: Document
+        self.syntaxes = SyntaxRegistry.shared()
+        self.active_editor = None
+        self.reloading = {}  # editor widget: callbacks waiting for its text
+        self.unload_timer = QTimer(self)
+        self.unload_timer.setInterval(60 * 1000)
+        self.unload_timer.timeout.connect(self.unload_idle_tabs)
+        self.unload_timer.start()
+        
+        # Open tabs are kept within a memory budget; see check_memory
+        self.memory_budget = MemoryBudget()
+        self.undo_limit = CodeEditor.MAX_UNDO_CHARS  # characters, per tab
+        self.compressing = {}  # editor widget: CompressTask
+        self.memory_timer = QTimer(self)
+        self.memory_timer.setInterval(5 * 1000)
+        self.memory_timer.timeout.connect(self.check_memory)
+        self.memory_timer.start()
+        
+        # Find and replace
+        self.find_dialog = None
+        self.search_task = None
+        self.search_indexes = {}  # folder: TrigramIndex
+        self.index_tasks = []  # saved files being added to self.embeddings
+        
+        # Open files that change on disk are updated in place
+        self.watcher = FileWatcher(self)
+        self.watcher.changed.connect(self.file_changed_on_disk)
         
         # Create menu bar
         self.create_menu_bar()
@@ -180,21 +1377,56 @@ class AccurateNotepad(QMainWindow):
         # Status bar
         self.status_bar = QStatusBar()
         self.setStatusBar(self.status_bar)
+        self.encoding_label = QLabel()
+        self.status_bar.addPermanentWidget(self.encoding_label)
+        self.memory_label = QLabel()
+        self.status_bar.addPermanentWidget(self.memory_label)
+        
+        # Timings of hot paths, shown while profiling is on
+        self.profile_label = QLabel()
+        self.profile_label.hide()
+        self.status_bar.addPermanentWidget(self.profile_label)
+        self.profile_timer = QTimer(self)
+        self.profile_timer.setInterval(1000)
+        self.profile_timer.timeout.connect(self.update_profile_label)
+        
+        # Background file I/O
+        self.file_tasks = []
+        self.io_progress = QProgressBar()
+        self.io_progress.setRange(0, 1000)
+        self.io_progress.setMaximumWidth(200)
+        self.io_progress.hide()
+        self.status_bar.addPermanentWidget(self.io_progress)
+        self.io_cancel_button = QPushButton("Cancel")
+        self.io_cancel_button.clicked.connect(self.cancel_file_tasks)
+        self.io_cancel_button.hide()
+        self.status_bar.addPermanentWidget(self.io_cancel_button)
+        
+        # Unsaved edits are journaled for crash recovery
+        self.autosave = AutosaveManager(parent=self)
+        
+        # Reopen the tabs of the last session, or start with an empty one
+        if not self.restore_session():
+            self.add_new_tab()
         
-        # Add first tab
-        self.add_new_tab()
+        # Settings are read once and written shortly after they change
+        self.settings = Settings()
+        self.settings_timer = QTimer(self)
+        self.settings_timer.setSingleShot(True)
+        self.settings_timer.setInterval(500)
+        self.settings_timer.timeout.connect(self.write_settings)
+        self.load_settings()
+        self.profiling_action.setChecked(self.settings['profiling'])
+        self.llm_context_action.setChecked(self.settings['llm_context'])
+        if self.settings.changed:
+            self.save_settings()  # moved over from an old notepad_settings.json
         
-        # Settings
-        self.settings = {
-            'llm_api_key': None,
-            'telegram_token': None,
-            'telegram_chat_id': None,
-            'theme': 'red',
-            'font_size': 12
-        }
+        # Resend messages that were still queued or failed last time
+        if self.telegram.token and self.telegram.chat_id and self.telegram_queue.retry_journal():
+            self.status_bar.showMessage("Retrying unsent Telegram messages...", 3000)
         
-        # Load settings if they exist
-        self.load_settings()
+        # Bring back tabs left unsaved at exit or by a crash
+        self.recover_tabs()
     
     def create_menu_bar(self):
         menu_bar = QMenuBar()
@@ -214,6 +1446,9 @@ class AccurateNotepad(QMainWindow):
         save_as_action = file_menu.addAction("Save As")
         save_as_action.triggered.connect(self.save_file_as)
         
+        encoding_action = file_menu.addAction("Encoding...")
+        encoding_action.triggered.connect(self.encoding_dialog)
+        
         file_menu.addSeparator()
         
         exit_action = file_menu.addAction("Exit")
@@ -239,6 +1474,12 @@ class AccurateNotepad(QMainWindow):
         paste_action = edit_menu.addAction("Paste")
         paste_action.triggered.connect(self.paste)
         
+        edit_menu.addSeparator()
+        
+        find_action = edit_menu.addAction("Find and Replace...")
+        find_action.setShortcut("Ctrl+F")
+        find_action.triggered.connect(self.find_replace_dialog)
+        
         # View menu
         view_menu = menu_bar.addMenu("View")
         
@@ -248,15 +1489,40 @@ class AccurateNotepad(QMainWindow):
         zoom_out_action = view_menu.addAction("Zoom Out")
         zoom_out_action.triggered.connect(self.zoom_out)
         
+        view_menu.addSeparator()
+        
+        self.profiling_action = view_menu.addAction("Performance HUD")
+        self.profiling_action.setCheckable(True)
+        self.profiling_action.toggled.connect(self.set_profiling)
+        
+        export_timings_action = view_menu.addAction("Export Timings...")
+        export_timings_action.triggered.connect(self.export_timings)
+        
         # Tools menu
         tools_menu = menu_bar.addMenu("Tools")
         
         llm_query_action = tools_menu.addAction("LLM Query")
         llm_query_action.triggered.connect(self.llm_query)
         
+        llm_batch_action = tools_menu.addAction("LLM Batch...")
+        llm_batch_action.triggered.connect(self.llm_batch_dialog)
+        
+        index_folder_action = tools_menu.addAction("Index Folder for LLM Context...")
+        index_folder_action.triggered.connect(self.index_folder)
+        
+        self.llm_context_action = tools_menu.addAction("Use Notes as LLM Context")
+        self.llm_context_action.setCheckable(True)
+        self.llm_context_action.toggled.connect(self.set_llm_context)
+        
         generate_invoice_action = tools_menu.addAction("Generate Invoice")
         generate_invoice_action.triggered.connect(self.generate_invoice_dialog)
         
+        bulk_invoices_action = tools_menu.addAction("Bulk Invoices...")
+        bulk_invoices_action.triggered.connect(self.bulk_invoices)
+        
+        invoice_report_action = tools_menu.addAction("Invoice Report...")
+        invoice_report_action.triggered.connect(self.invoice_report_dialog)
+        
         send_to_telegram_action = tools_menu.addAction("Send to Telegram")
         send_to_telegram_action.triggered.connect(self.send_to_telegram)
         
@@ -269,6 +1535,9 @@ class AccurateNotepad(QMainWindow):
         configure_telegram_action = settings_menu.addAction("Configure Telegram")
         configure_telegram_action.triggered.connect(self.configure_telegram)
         
+        memory_limits_action = settings_menu.addAction("Memory Limits...")
+        memory_limits_action.triggered.connect(self.configure_memory)
+        
         # Help menu
         help_menu = menu_bar.addMenu("Help")
         
@@ -307,29 +1576,411 @@ class AccurateNotepad(QMainWindow):
         llm_action = toolbar.addAction(QIcon.fromTheme("system-run"), "LLM Query")
         llm_action.triggered.connect(self.llm_query)
     
-    def add_new_tab(self, content="", title="Untitled"):
-        text_edit = QTextEdit()
-        text_edit.setAcceptRichText(False)
-        
-        # Set syntax highlighter
-        highlighter = CodeHighlighter(text_edit.document())
-        
-        index = self.tabs.addTab(text_edit, title)
+    def add_new_tab(self, content="", title="Untitled", path=None):
+        # path only picks the highlighting; see file_opened
+        text_edit = self.add_editor(title)
+        document = self.documents[text_edit]
+        index = self.tabs.indexOf(text_edit)
         self.tabs.setCurrentIndex(index)
         
+        document.highlighter = self.set_editor_text(text_edit, content, self.syntaxes.for_path(path))
+        self.autosave.track(text_edit, title)
+        return index
+    
+    def add_editor(self, title):
+        # Adds an empty tab without selecting it
+        text_edit = CodeEditor()
+        text_edit.max_undo_chars = self.undo_limit
+        text_edit.undo_trimmed.connect(
+            lambda: self.status_bar.showMessage("Undo history cleared to limit memory use", 3000))
+        document = Document()
+        self.documents[text_edit] = document
+        text_edit.document().modificationChanged.connect(
+            lambda modified: setattr(document, 'dirty', modified))
+        self.tabs.addTab(text_edit, title)
+        return text_edit
+    
+    def set_editor_text(self, editor, content, syntax=None):
+        # Returns the syntax highlighter; big documents are highlighted
+        # viewport first and then in idle-time slices instead of all up front
+        if len(content) > LazyHighlighter.THRESHOLD:
+            editor.set_text(content)
+            return LazyHighlighter(editor, syntax)
+        highlighter = CodeHighlighter(editor.document(), syntax)
         if content:
-            text_edit.setPlainText(content)
+            editor.set_text(content)
+        return highlighter
+    
+    def add_highlighter(self, editor, syntax=None):
+        # For text already in the editor, as when a tab that gave up its
+        # highlighting is shown again
+        if editor.document().characterCount() > LazyHighlighter.THRESHOLD:
+            return LazyHighlighter(editor, syntax)
+        return CodeHighlighter(editor.document(), syntax)
+    
+    def remove_highlighter(self, editor, document, clear_formats=True):
+        # clear_formats=False when the text is about to go anyway
+        highlighter, document.highlighter = document.highlighter, None
+        if highlighter is None:
+            return
+        if isinstance(highlighter, LazyHighlighter):
+            highlighter.timer.stop()
+            highlighter.scroll_timer.stop()
+            highlighter.deleteLater()
+            if not clear_formats:
+                return
+            # A QSyntaxHighlighter clears every block's formats, in C++,
+            # when it lets go of its document; a throwaway one does that
+            # for the lazy highlighter
+            highlighter = CodeHighlighter(editor.document())
+        highlighter.setDocument(None)
+        highlighter.deleteLater()
+    
+    def editor_text(self, editor):
+        # Unloaded tabs are compressed or clean, so their snapshot or their
+        # file holds their text
+        document = self.documents.get(editor)
+        if document and not document.loaded:
+            if document.snapshot is not None:
+                return str(document.snapshot)
+            try:
+                with open(document.path, 'r', encoding=document.encoding) as f:
+                    return f.read()
+            except OSError:
+                return ""
+        return editor.text_snapshot()
+    
+    def tab_changed(self, index):
+        now = time.monotonic()
+        if self.active_editor in self.documents:
+            self.documents[self.active_editor].last_active = now
+        self.active_editor = self.tabs.widget(index)
+        task = self.compressing.pop(self.active_editor, None)
+        if task:
+            task.cancel()
+        
+        document = self.documents.get(self.active_editor)
+        if document and not document.loaded and document.snapshot is not None:
+            self.restore_tab(self.active_editor)
+        elif document and not document.loaded and self.active_editor not in self.reloading:
+            try:
+                large = os.path.getsize(document.path) > LargeFileView.THRESHOLD
+            except OSError:
+                large = False  # reloading reports the error
+            if large:
+                self.open_large_tab(self.active_editor)
+            else:
+                self.reload_tab(self.active_editor)
+        elif document and document.loaded and document.unhighlighted:
+            document.unhighlighted = False
+            document.highlighter = self.add_highlighter(self.active_editor,
+                                                        self.syntaxes.for_path(document.path))
+        self.update_encoding_label()
+        self.update_memory_label()
+    
+    def editor_position(self, editor):
+        if isinstance(editor, LargeFileView):
+            return 0, editor.line_offset + editor.verticalScrollBar().value()
+        return editor.textCursor().position(), editor.verticalScrollBar().value()
+    
+    def restore_position(self, editor, position):
+        cursor_position, line = position
+        if isinstance(editor, LargeFileView):
+            editor.go_to_line(line)
+            return
+        cursor = editor.textCursor()
+        cursor.setPosition(min(cursor_position, editor.document().characterCount() - 1))
+        editor.setTextCursor(cursor)
+        editor.verticalScrollBar().setValue(line)
+    
+    def open_large_tab(self, editor):
+        # A session tab whose file is now too big for an editor is swapped
+        # for a read-only LargeFileView in the same place
+        document = self.documents[editor]
+        try:
+            view = LargeFileView(document.path, self.syntaxes.for_path(document.path))
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Could not open file: {str(e)}")
+            return
+        self.documents[view] = Document(encoding=view.buffer.encoding, highlighter=view.highlighter)
+        self.set_document_path(view, document.path)
+        if document.position:
+            self.restore_position(view, document.position)
+        
+        index = self.tabs.indexOf(editor)
+        self.tabs.blockSignals(True)
+        self.tabs.insertTab(index, view, os.path.basename(document.path) + " [read-only]")
+        self.tabs.setCurrentIndex(index)
+        self.tabs.blockSignals(False)
+        self.active_editor = view
+        self.close_tab(index + 1)
+    
+    def unload_idle_tabs(self):
+        # Clean tabs that sat in the background long enough give up their
+        # text and highlighting until they are selected again
+        now = time.monotonic()
+        unloaded = False
+        for editor, document in self.documents.items():
+            if (editor is self.active_editor or not document.loaded or document.dirty
+                    or not document.path or isinstance(editor, LargeFileView)
+                    or now - document.last_active < self.UNLOAD_AFTER):
+                continue
+            self.autosave.untrack(editor)
+            self.remove_highlighter(editor, document, clear_formats=False)
+            document.position = self.editor_position(editor)
+            editor.setPlainText("")
+            document.loaded = False
+            unloaded = True
+        if unloaded:
+            release_free_memory()
+    
+    def tab_memory(self, editor, document):
+        # Estimated bytes a tab holds, by the parts MemoryBudget knows
+        if not document.loaded:
+            return {'text': document.snapshot.nbytes() if document.snapshot is not None else 0}
+        return editor.memory_use(document.highlighter is not None)
+    
+    def check_memory(self):
+        # Over budget, the least recently used background tabs give memory
+        # back. None is compressed while file tasks run, as a save or a
+        # reload may still land in its editor.
+        usage, tabs = 0, []
+        for editor, document in self.documents.items():
+            parts = self.tab_memory(editor, document)
+            usage += sum(parts.values())
+            if (editor is self.active_editor or not document.loaded or isinstance(editor, LargeFileView)
+                    or editor in self.compressing or editor in self.reloading):
+                continue
+            if self.file_tasks:
+                parts = dict(parts, text=0)
+            tabs.append((editor, document.last_active, parts))
+        
+        steps = self.memory_budget.plan(usage, tabs)
+        for editor, part in steps:
+            if part == 'layout':
+                document = self.documents[editor]
+                if document.highlighter is not None:
+                    self.remove_highlighter(editor, document)
+                    document.unhighlighted = True
+                editor.drop_layout()
+            elif part == 'undo':
+                editor.trim_undo()
+            else:
+                self.compress_tab(editor)
+        if steps and not self.compressing:
+            release_free_memory()
+        self.update_memory_label()
+    
+    def compress_tab(self, editor):
+        # The text is compressed in the background; the result is thrown
+        # away if the tab is shown or edited meanwhile
+        task = CompressTask(editor.text_snapshot())
+        revision = editor.document().revision()
+        self.compressing[editor] = task
+        task.signals.finished.connect(lambda snapshot: self.tab_compressed(editor, task, snapshot, revision))
+        for signal in (task.signals.failed, task.signals.cancelled):
+            signal.connect(lambda *args: self.tab_compressed(editor, task, None, revision))
+        QThreadPool.globalInstance().start(task)
+    
+    def tab_compressed(self, editor, task, snapshot, revision):
+        # snapshot is None if compressing failed or was cancelled
+        if self.compressing.get(editor) is not task:
+            return
+        del self.compressing[editor]
+        document = self.documents.get(editor)
+        if (snapshot is None or document is None or editor is self.active_editor or not document.loaded
+                or self.file_tasks or editor.document().revision() != revision):
+            return
         
-        return index
+        # The journal keeps any unsaved edits on disk meanwhile
+        self.autosave.suspend(editor)
+        self.remove_highlighter(editor, document, clear_formats=False)
+        document.position = self.editor_position(editor)
+        document.snapshot = snapshot
+        document.loaded = False
+        # Emptying the document reports a modification, but not its undoing
+        dirty = document.dirty
+        editor.set_text("")
+        editor.document().setModified(dirty)
+        document.dirty = dirty
+        if not self.compressing:
+            release_free_memory()
+        self.update_memory_label()
+    
+    @profiler.timed('tab.restore')
+    def restore_tab(self, editor):
+        # Unpacks a compressed tab, unsaved edits and all
+        document = self.documents[editor]
+        snapshot, document.snapshot = document.snapshot, None
+        dirty = document.dirty
+        document.highlighter = self.set_editor_text(editor, str(snapshot), self.syntaxes.for_path(document.path))
+        document.unhighlighted = False
+        editor.document().setModified(dirty)
+        document.dirty = dirty
+        document.loaded = True
+        if document.position:
+            self.restore_position(editor, document.position)
+            document.position = None
+        self.autosave.resume(editor)
+    
+    def update_memory_label(self):
+        mb = 1024 * 1024
+        costs = []
+        for editor, document in self.documents.items():
+            title = self.tabs.tabText(self.tabs.indexOf(editor))
+            if document.snapshot is not None:
+                title += " (compressed)"
+            elif not document.loaded:
+                title += " (unloaded)"
+            costs.append((sum(self.tab_memory(editor, document).values()), title))
+        usage = sum(cost for cost, title in costs)
+        self.memory_label.setText(f"Memory: {usage / mb:.0f} / {self.memory_budget.limit / mb:.0f} MB")
+        # The ten costliest tabs
+        self.memory_label.setToolTip("\n".join(
+            f"{title}: {cost / mb:.1f} MB" for cost, title in sorted(costs, reverse=True)[:10]))
+    
+    def reload_tab(self, editor, on_loaded=None):
+        # on_loaded is called once the text is back
+        if self.documents[editor].snapshot is not None:
+            self.restore_tab(editor)
+            if on_loaded:
+                on_loaded()
+            return
+        if editor in self.reloading:
+            if on_loaded:
+                self.reloading[editor].append(on_loaded)
+            return
+        self.reloading[editor] = [on_loaded] if on_loaded else []
+        document = self.documents[editor]
+        editor.setReadOnly(True)
+        
+        def loaded(content):
+            callbacks = self.reloading.pop(editor, [])
+            if editor not in self.documents:
+                return
+            editor.setReadOnly(False)
+            document.highlighter = self.set_editor_text(editor, content,
+                                                        self.syntaxes.for_path(document.path))
+            document.unhighlighted = False
+            document.set_path(document.path, task.size)
+            document.loaded = True
+            if document.position:
+                self.restore_position(editor, document.position)
+                document.position = None
+            title = self.tabs.tabText(self.tabs.indexOf(editor))
+            self.autosave.track(editor, title)
+            self.autosave.set_file(editor, document.path, title,
+                                   encoding=document.encoding, newline=document.newline)
+            for callback in callbacks:
+                callback()
+        
+        task = ReadFileTask(document.path, document.encoding)
+        task.signals.failed.connect(lambda error: self.reloading.pop(editor, None))
+        task.signals.cancelled.connect(lambda: self.reloading.pop(editor, None))
+        self.status_bar.showMessage(f"Loading {document.path}...")
+        self.start_file_task(task, loaded, "Could not reload file")
     
     def close_tab(self, index):
         if self.tabs.count() == 1:
             self.add_new_tab()
         
-        if index in self.current_files:
-            del self.current_files[index]
+        widget = self.tabs.widget(index)
+        document = self.documents.pop(widget, None)
+        if document and document.path:
+            self.watcher.unwatch(document.path)
+        if isinstance(widget, LargeFileView):
+            widget.release()
+        self.autosave.untrack(widget)
+        self.process_pool.cancel_owner(widget)
+        task = self.compressing.pop(widget, None)
+        if task:
+            task.cancel()
+        for task, editor in self.llm_tasks.items():
+            if editor is widget:
+                task.cancel()
         
         self.tabs.removeTab(index)
+        widget.deleteLater()
+    
+    def restore_session(self):
+        # Returns False if there was nothing to restore. Only the active tab
+        # reads its file now; the others are empty until first shown.
+        session = Session()
+        if not session.load():
+            return False
+        
+        active = None
+        for i, tab in enumerate(session.tabs):
+            if not os.path.isfile(tab['path']):
+                continue
+            editor = self.add_editor(os.path.basename(tab['path']))
+            document = self.documents[editor]
+            document.path = tab['path']
+            document.encoding, document.newline = tab['encoding'], tab['newline']
+            document.position = (tab['cursor'], tab['scroll'])
+            document.loaded = False
+            self.watcher.watch(tab['path'])
+            if active is None or i <= session.active:
+                active = editor
+        if active is None:
+            return False
+        
+        # The first tab added became current while it was still blank
+        if self.tabs.currentWidget() is active:
+            self.tab_changed(self.tabs.currentIndex())
+        else:
+            self.tabs.setCurrentWidget(active)
+        return True
+    
+    def save_session(self):
+        # Tabs without a file come back from their recovery journals if
+        # they hold unsaved edits, and edited files over their copy here
+        session = Session()
+        for i in range(self.tabs.count()):
+            editor = self.tabs.widget(i)
+            document = self.documents.get(editor)
+            if not document or not document.path:
+                continue
+            if i <= self.tabs.currentIndex():
+                session.active = len(session.tabs)
+            if document.loaded:
+                position = self.editor_position(editor)
+            else:
+                position = document.position or (0, 0)
+            session.tabs.append(Session.tab(document.path, document.encoding, document.newline, *position))
+        try:
+            session.save()
+        except OSError as e:
+            print(f"Error saving session: {str(e)}")
+    
+    def recover_tabs(self):
+        recovered = 0
+        for journal, text in RecoveryJournal.recover(self.autosave.directory):
+            # Unsaved edits win over the copy of the file restored from the session
+            for editor, document in list(self.documents.items()):
+                if journal.meta['path'] and document.path == journal.meta['path'] and not document.loaded:
+                    self.close_tab(self.tabs.indexOf(editor))
+            index = self.add_new_tab(text, journal.meta['title'] or "Untitled", journal.meta['path'])
+            editor = self.tabs.widget(index)
+            if journal.meta['path']:
+                self.set_document_path(editor, journal.meta['path'])
+                document = self.documents[editor]
+                if 'encoding' in journal.meta:
+                    document.encoding, document.newline = journal.meta['encoding'], journal.meta['newline']
+                else:
+                    try:
+                        document.encoding, document.newline = sniff_encoding(journal.meta['path'])
+                    except OSError:
+                        pass
+            editor.document().setModified(True)
+            # Continue the old journal, rebased on the recovered text
+            self.autosave.untrack(editor)
+            journal.snapshot(text)
+            self.autosave.track(editor, journal.meta['title'], journal)
+            recovered += 1
+        
+        if recovered:
+            self.status_bar.showMessage(f"Recovered {recovered} unsaved tab(s)", 5000)
     
     def get_current_editor(self):
         return self.tabs.currentWidget()
@@ -339,32 +1990,57 @@ class AccurateNotepad(QMainWindow):
                                                   "Text Files (*.txt);;Python Files (*.py);;All Files (*)")
         
         if file_path:
-            try:
-                with open(file_path, 'r') as file:
-                    content = file.read()
-                    
-                    index = self.add_new_tab(content, os.path.basename(file_path))
-                    self.current_files[index] = file_path
-                    
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Could not open file: {str(e)}")
+            self.open_path(file_path)
+    
+    def open_path(self, file_path, on_opened=None):
+        # on_opened is called with the new tab's editor once it's loaded
+        try:
+            if os.path.getsize(file_path) > LargeFileView.THRESHOLD:
+                # Huge files are paged in from a memory map, read-only
+                view = LargeFileView(file_path, self.syntaxes.for_path(file_path))
+                self.documents[view] = Document(encoding=view.buffer.encoding, highlighter=view.highlighter)
+                self.set_document_path(view, file_path)
+                index = self.tabs.addTab(view, os.path.basename(file_path) + " [read-only]")
+                self.tabs.setCurrentIndex(index)
+                if on_opened:
+                    on_opened(view)
+                return
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Could not open file: {str(e)}")
+            return
+        
+        def opened(content):
+            index = self.file_opened(file_path, content, task.size, task.encoding, task.newline)
+            if on_opened:
+                on_opened(self.tabs.widget(index))
+        
+        task = ReadFileTask(file_path)
+        self.status_bar.showMessage(f"Opening {file_path}...")
+        self.start_file_task(task, opened, "Could not open file")
+    
+    def file_opened(self, file_path, content, size=None, encoding=None, newline=None):
+        index = self.add_new_tab(content, os.path.basename(file_path), file_path)
+        document = self.documents[self.tabs.widget(index)]
+        document.encoding, document.newline = encoding, newline
+        self.update_encoding_label()
+        self.set_document_path(self.tabs.widget(index), file_path, size)
+        self.autosave.set_file(self.tabs.widget(index), file_path, os.path.basename(file_path),
+                               encoding=encoding, newline=newline)
+        self.status_bar.showMessage(f"File opened: {file_path}", 3000)
+        return index
     
     def save_file(self):
-        current_index = self.tabs.currentIndex()
         current_editor = self.get_current_editor()
         
         if not current_editor:
             return
-            
-        if current_index in self.current_files:
-            file_path = self.current_files[current_index]
-            try:
-                with open(file_path, 'w') as file:
-                    file.write(current_editor.toPlainText())
-                    
-                self.status_bar.showMessage(f"File saved: {file_path}", 3000)
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Could not save file: {str(e)}")
+        
+        if isinstance(current_editor, LargeFileView):
+            self.status_bar.showMessage("Large files are opened read-only; use Save As to copy", 3000)
+            return
+        
+        if self.documents[current_editor].path:
+            self.write_file(current_editor, self.documents[current_editor].path)
         else:
             self.save_file_as()
     
@@ -372,22 +2048,283 @@ class AccurateNotepad(QMainWindow):
         current_editor = self.get_current_editor()
         if not current_editor:
             return
-            
+        
         file_path, _ = QFileDialog.getSaveFileName(self, "Save File", "", 
                                                   "Text Files (*.txt);;Python Files (*.py);;All Files (*)")
         
         if file_path:
-            try:
-                with open(file_path, 'w') as file:
-                    file.write(current_editor.toPlainText())
-                    
-                current_index = self.tabs.currentIndex()
-                self.current_files[current_index] = file_path
-                self.tabs.setTabText(current_index, os.path.basename(file_path))
-                
-                self.status_bar.showMessage(f"File saved: {file_path}", 3000)
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Could not save file: {str(e)}")
+            self.write_file(current_editor, file_path)
+    
+    def write_file(self, editor, file_path):
+        document = self.documents[editor]
+        if not document.loaded:
+            self.status_bar.showMessage("The file is still loading", 3000)
+            return
+        
+        if isinstance(editor, LargeFileView):
+            # Copy the mapped file instead of the loaded pages
+            task = SaveFileTask(file_path, source_path=editor.buffer.path)
+        else:
+            task = SaveFileTask(file_path, text=editor.text_snapshot(), encoding=document.encoding,
+                                newline=document.newline)
+        revision = editor.document().revision()
+        
+        self.status_bar.showMessage(f"Saving {file_path}...")
+        self.start_file_task(task, lambda path: self.file_saved(editor, path, revision), "Could not save file")
+    
+    def file_saved(self, editor, file_path, revision=None):
+        if isinstance(editor, LargeFileView):
+            self.status_bar.showMessage(f"File copied: {file_path}", 3000)
+            return
+        
+        # The tab may have moved or been closed while the save was running
+        document = self.documents.get(editor)
+        if document:
+            self.set_document_path(editor, file_path)
+            # Save As may have changed the language
+            if document.highlighter:
+                document.highlighter.set_syntax(self.syntaxes.for_path(file_path))
+            self.tabs.setTabText(self.tabs.indexOf(editor), os.path.basename(file_path))
+            self.autosave.set_file(editor, file_path, os.path.basename(file_path), revision,
+                                   document.encoding, document.newline)
+            if revision == editor.document().revision():
+                editor.document().setModified(False)
+            if self.settings['llm_context'] or self.embeddings.covers(file_path):
+                self.index_saved_file(file_path)
+        
+        self.status_bar.showMessage(f"File saved: {file_path}", 3000)
+    
+    def index_saved_file(self, file_path):
+        # Quietly, unlike the tasks behind the progress bar
+        task = IndexTask(self.embeddings, file_path)
+        self.index_tasks.append(task)
+        for signal in (task.signals.finished, task.signals.failed, task.signals.cancelled):
+            signal.connect(lambda *args: self.index_tasks.remove(task))
+        QThreadPool.globalInstance().start(task)
+    
+    def update_encoding_label(self):
+        document = self.documents.get(self.get_current_editor())
+        if document is None:
+            return
+        encoding = document.encoding or locale.getpreferredencoding(False)
+        newline = {'\r\n': "CRLF", '\r': "CR", '\n': "LF"}.get(document.newline or os.linesep)
+        self.encoding_label.setText(f"{encoding.upper()}  {newline}")
+    
+    def encoding_dialog(self):
+        editor = self.get_current_editor()
+        document = self.documents.get(editor)
+        if document is None:
+            return
+        
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Encoding")
+        dialog.setModal(True)
+        
+        layout = QVBoxLayout()
+        
+        layout.addWidget(QLabel("Encoding:"))
+        encoding_combo = QComboBox()
+        encoding_combo.setEditable(True)
+        encoding_combo.addItems(["utf-8", "utf-8-sig", "utf-16", "utf-16-le", "utf-16-be",
+                                 "cp1252", "latin-1"])
+        encoding_combo.setCurrentText(document.encoding or locale.getpreferredencoding(False))
+        layout.addWidget(encoding_combo)
+        
+        layout.addWidget(QLabel("Line endings:"))
+        newline_combo = QComboBox()
+        newlines = ['\n', '\r\n', '\r']
+        newline_combo.addItems(["LF (Unix)", "CRLF (Windows)", "CR (classic Mac)"])
+        newline_combo.setCurrentIndex(newlines.index(document.newline or os.linesep))
+        layout.addWidget(newline_combo)
+        
+        # Reopening reads the file again in the chosen encoding; saving
+        # writes the tab in it
+        buttons = QHBoxLayout()
+        reopen_btn = QPushButton("Reopen")
+        reopen_btn.setEnabled(bool(document.path) and not isinstance(editor, LargeFileView))
+        reopen_btn.clicked.connect(lambda: self.set_encoding(
+            editor, encoding_combo.currentText(), newlines[newline_combo.currentIndex()], True, dialog))
+        buttons.addWidget(reopen_btn)
+        save_btn = QPushButton("Use for Saving")
+        save_btn.setEnabled(not isinstance(editor, LargeFileView))
+        save_btn.clicked.connect(lambda: self.set_encoding(
+            editor, encoding_combo.currentText(), newlines[newline_combo.currentIndex()], False, dialog))
+        buttons.addWidget(save_btn)
+        layout.addLayout(buttons)
+        
+        dialog.setLayout(layout)
+        dialog.exec()
+    
+    def set_encoding(self, editor, encoding, newline, reopen, dialog):
+        document = self.documents.get(editor)
+        if document is None:
+            return
+        try:
+            encoding = codecs.lookup(encoding.strip()).name
+        except LookupError:
+            QMessageBox.warning(self, "Encoding", f"Unknown encoding: {encoding}")
+            return
+        if reopen and document.dirty:
+            QMessageBox.warning(self, "Encoding", "Save or undo your changes before reopening")
+            return
+        
+        document.encoding, document.newline = encoding, newline
+        if reopen:
+            self.reload_changed(editor)
+        elif document.path:
+            # The file on disk no longer matches what a save would write
+            editor.document().setModified(True)
+        self.update_encoding_label()
+        dialog.close()
+    
+    def set_document_path(self, editor, path, size=None):
+        document = self.documents[editor]
+        if path != document.path:
+            if document.path:
+                self.watcher.unwatch(document.path)
+            self.watcher.watch(path)
+        document.set_path(path, size)
+    
+    def file_changed_on_disk(self, path):
+        saving = any(isinstance(task, SaveFileTask) and task.path == path for task in self.file_tasks)
+        for editor, document in list(self.documents.items()):
+            if document.path != path or saving or editor in self.reloading:
+                continue
+            if not os.path.exists(path):
+                self.status_bar.showMessage(f"{os.path.basename(path)} was deleted or moved on disk", 5000)
+                continue
+            if isinstance(editor, LargeFileView):
+                editor.refresh()
+                continue
+            # Unloaded tabs read the file again when they're shown; a clean
+            # compressed one drops its copy so it does too
+            if not document.loaded:
+                if document.snapshot is not None and not document.dirty:
+                    document.snapshot = None
+                    self.autosave.untrack(editor)
+                continue
+            
+            stat = os.stat(path)
+            if (stat.st_mtime_ns, stat.st_size) == (document.mtime, document.size):
+                continue  # our own save
+            if document.dirty:
+                self.status_bar.showMessage(
+                    f"{os.path.basename(path)} changed on disk; keeping your unsaved edits", 5000)
+                continue
+            if not self.append_from_disk(editor, document, stat.st_size):
+                self.reload_changed(editor)
+    
+    def append_from_disk(self, editor, document, size):
+        # Files that only grew, like logs, get the new bytes added at the end
+        # instead of being read again. Returns False if that won't do.
+        if document.size is None or not document.size < size <= document.size + self.MAX_APPEND:
+            return False
+        try:
+            with open(document.path, 'rb') as f:
+                f.seek(document.size - len(document.tail))
+                data = f.read(size - f.tell())
+        except OSError:
+            return False
+        tail, data = data[:len(document.tail)], data[len(document.tail):]
+        # A '\r' at the end was read as a newline, so '\n' can't simply follow
+        if tail != document.tail or b'\r' in tail[-4:]:
+            return False
+        text, used = decode_appended(data, document.encoding)
+        
+        bar = editor.verticalScrollBar()
+        at_end = bar.value() >= bar.maximum()
+        cursor = QTextCursor(editor.document())
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.insertText(text)
+        if at_end:
+            bar.setValue(bar.maximum())
+        self.file_reloaded(editor, document.size + used)
+        return True
+    
+    def reload_changed(self, editor):
+        # Applies only the lines that changed, so the cursor, scroll
+        # position and undo history outside them are kept
+        document = self.documents[editor]
+        revision = editor.document().revision()
+        task = DiffReloadTask(document.path, editor.text_snapshot(), self.process_pool, editor, document.encoding)
+        self.reloading[editor] = []
+        
+        def loaded(hunks):
+            callbacks = self.reloading.pop(editor, [])
+            # Left alone if the user started typing in the meantime
+            if (editor in self.documents and not document.dirty
+                    and editor.document().revision() == revision):
+                self.apply_hunks(editor, hunks)
+                self.file_reloaded(editor, task.size)
+                # Changes made while it was read were skipped above
+                self.watcher.queue(document.path)
+            elif editor in self.documents:
+                self.status_bar.showMessage(
+                    f"{os.path.basename(document.path)} changed on disk; keeping your unsaved edits", 5000)
+            for callback in callbacks:
+                callback()
+        
+        for signal in (task.signals.failed, task.signals.cancelled):
+            signal.connect(lambda *args: self.reloading.pop(editor, None))
+        self.start_file_task(task, loaded, "Could not reload file")
+    
+    def apply_hunks(self, editor, hunks):
+        document = editor.document()
+        
+        def line_position(line):
+            block = document.findBlockByNumber(line)
+            return block.position() if block.isValid() else document.characterCount() - 1
+        
+        cursor = QTextCursor(document)
+        cursor.beginEditBlock()
+        # Back to front, so earlier line numbers stay valid
+        for first, end, text in reversed(hunks):
+            cursor.setPosition(line_position(first))
+            cursor.setPosition(line_position(end), QTextCursor.MoveMode.KeepAnchor)
+            if text:
+                cursor.insertText(text)
+            else:
+                cursor.removeSelectedText()
+        cursor.endEditBlock()
+    
+    def file_reloaded(self, editor, size):
+        document = self.documents[editor]
+        editor.document().setModified(False)
+        self.set_document_path(editor, document.path, size)
+        self.autosave.set_file(editor, document.path, self.tabs.tabText(self.tabs.indexOf(editor)),
+                               encoding=document.encoding, newline=document.newline)
+        self.status_bar.showMessage(f"Reloaded {os.path.basename(document.path)} from disk", 3000)
+    
+    def start_file_task(self, task, on_finished, error_message):
+        self.file_tasks.append(task)
+        task.signals.progress.connect(self.show_file_progress)
+        task.signals.finished.connect(on_finished)
+        task.signals.failed.connect(
+            lambda error: QMessageBox.critical(self, "Error", f"{error_message}: {error}"))
+        task.signals.cancelled.connect(
+            lambda: self.status_bar.showMessage(f"Cancelled: {task.path}", 3000))
+        for signal in (task.signals.finished, task.signals.failed, task.signals.cancelled):
+            signal.connect(lambda *args: self.finish_file_task(task))
+        
+        self.io_progress.setValue(0)
+        self.io_progress.show()
+        self.io_cancel_button.show()
+        QThreadPool.globalInstance().start(task)
+    
+    def finish_file_task(self, task):
+        if task in self.file_tasks:
+            self.file_tasks.remove(task)
+        if not self.file_tasks:
+            self.io_progress.hide()
+            self.io_cancel_button.hide()
+    
+    def show_file_progress(self, done, total):
+        if total:
+            self.io_progress.setValue(int(done * 1000 / total))
+    
+    def cancel_file_tasks(self):
+        for task in self.file_tasks:
+            task.cancel()
     
     def undo(self):
         current_editor = self.get_current_editor()
@@ -414,6 +2351,242 @@ class AccurateNotepad(QMainWindow):
         if current_editor:
             current_editor.paste()
     
+    def find_replace_dialog(self):
+        # The dialog stays open next to the editor and keeps its results
+        if self.find_dialog is None:
+            self.find_dialog = self.create_find_dialog()
+        self.find_dialog.show()
+        self.find_dialog.raise_()
+        self.find_dialog.activateWindow()
+    
+    def create_find_dialog(self):
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Find and Replace")
+        
+        layout = QVBoxLayout()
+        
+        layout.addWidget(QLabel("Find:"))
+        self.find_edit = QLineEdit()
+        self.find_edit.returnPressed.connect(self.find_next)
+        layout.addWidget(self.find_edit)
+        
+        layout.addWidget(QLabel("Replace with:"))
+        self.replace_edit = QLineEdit()
+        layout.addWidget(self.replace_edit)
+        
+        self.regex_check = QCheckBox("Regular expression")
+        layout.addWidget(self.regex_check)
+        self.case_check = QCheckBox("Match case")
+        layout.addWidget(self.case_check)
+        
+        layout.addWidget(QLabel("Search in:"))
+        self.scope_combo = QComboBox()
+        self.scope_combo.addItems(["Current tab", "All tabs", "Folder...", "Indexed notes, by meaning"])
+        layout.addWidget(self.scope_combo)
+        
+        buttons = QHBoxLayout()
+        for label, slot in (("Find Next", self.find_next), ("Find All", self.find_all),
+                            ("Replace", self.replace_next), ("Replace All", self.replace_all)):
+            button = QPushButton(label)
+            button.clicked.connect(slot)
+            buttons.addWidget(button)
+        layout.addLayout(buttons)
+        
+        # Matches from Find All; activate one to jump to it
+        self.find_results = QListWidget()
+        self.find_results.itemActivated.connect(self.go_to_match)
+        layout.addWidget(self.find_results)
+        
+        dialog.setLayout(layout)
+        return dialog
+    
+    def current_search(self):
+        query = self.find_edit.text()
+        if not query:
+            return None
+        try:
+            return TextSearch(query, self.regex_check.isChecked(), self.case_check.isChecked())
+        except re.error as e:
+            QMessageBox.warning(self.find_dialog, "Find", f"Invalid regular expression: {str(e)}")
+            return None
+    
+    def find_next(self):
+        editor = self.get_current_editor()
+        search = self.current_search()
+        if not editor or not search:
+            return
+        
+        options = QRegularExpression.PatternOption.MultilineOption
+        if not self.case_check.isChecked():
+            options |= QRegularExpression.PatternOption.CaseInsensitiveOption
+        expression = QRegularExpression(search.pattern.pattern, options)
+        document = editor.document()
+        found = document.find(expression, editor.textCursor())
+        if found.isNull():
+            # Wrap around to the top
+            found = document.find(expression, 0)
+        if found.isNull():
+            self.status_bar.showMessage(f"Not found: {search.query}", 3000)
+            return
+        editor.setTextCursor(found)
+        editor.ensureCursorVisible()
+    
+    def replace_next(self):
+        editor = self.get_current_editor()
+        search = self.current_search()
+        if not editor or not search:
+            return
+        if isinstance(editor, LargeFileView):
+            self.status_bar.showMessage("Large files are opened read-only", 3000)
+            return
+        
+        cursor = editor.textCursor()
+        match = search.pattern.fullmatch(cursor.selectedText().replace('\u2029', '\n'))
+        if cursor.hasSelection() and match:
+            cursor.insertText(search.expand(match, self.replace_edit.text()))
+        self.find_next()
+    
+    def replace_all(self):
+        search = self.current_search()
+        if not search:
+            return
+        
+        scope = self.scope_combo.currentIndex()
+        if scope == 0:
+            editors = [self.get_current_editor()]
+        elif scope == 1:
+            editors = [self.tabs.widget(i) for i in range(self.tabs.count())]
+        else:
+            self.status_bar.showMessage("Replace All works on open tabs", 3000)
+            return
+        
+        # The new text is worked out in the background and applied in one go
+        replacement = self.replace_edit.text()
+        for editor in editors:
+            if not editor or isinstance(editor, LargeFileView):
+                continue
+            if not self.documents[editor].loaded:
+                self.reload_tab(editor, lambda editor=editor: self.replace_all_in(editor, search, replacement))
+                continue
+            self.replace_all_in(editor, search, replacement)
+    
+    def replace_all_in(self, editor, search, replacement):
+        if editor not in self.documents:
+            return
+        revision = editor.document().revision()
+        task = ReplaceAllTask(search, replacement, editor.text_snapshot(), self.process_pool, editor)
+        self.start_file_task(task, lambda result: self.apply_replace_all(editor, revision, result),
+                             "Replace failed")
+    
+    def apply_replace_all(self, editor, revision, result):
+        if editor not in self.documents:
+            return
+        if result is None:
+            self.status_bar.showMessage("No matches to replace", 3000)
+            return
+        if editor.document().revision() != revision:
+            self.status_bar.showMessage("The document changed while replacing; nothing was replaced", 3000)
+            return
+        
+        start, end, text, count = result
+        cursor = QTextCursor(editor.document())
+        # One edit block, so a single undo reverts every replacement
+        cursor.beginEditBlock()
+        cursor.setPosition(start)
+        cursor.setPosition(end, QTextCursor.MoveMode.KeepAnchor)
+        cursor.insertText(text)
+        cursor.endEditBlock()
+        self.status_bar.showMessage(f"Replaced {count} matches", 3000)
+    
+    def find_all(self):
+        scope = self.scope_combo.currentIndex()
+        if scope == 3:
+            query = self.find_edit.text().strip()
+            if query:
+                self.start_search(SemanticSearchTask(self.embeddings, query))
+            return
+        
+        search = self.current_search()
+        if not search:
+            return
+        
+        if scope == 2:
+            directory = QFileDialog.getExistingDirectory(self.find_dialog, "Search Folder")
+            if not directory:
+                return
+            # Indexes stay loaded, so repeat searches only restat the tree
+            if directory not in self.search_indexes:
+                self.search_indexes[directory] = TrigramIndex(directory)
+            task = SearchTask(search, index=self.search_indexes[directory])
+        else:
+            if scope == 0:
+                editors = [self.get_current_editor()]
+            else:
+                editors = [self.tabs.widget(i) for i in range(self.tabs.count())]
+            sources = []
+            for editor in editors:
+                if not editor:
+                    continue
+                name = self.tabs.tabText(self.tabs.indexOf(editor))
+                sources.append((editor, name, editor.buffer if isinstance(editor, LargeFileView)
+                                else self.editor_text(editor)))
+            task = SearchTask(search, sources, pool=self.process_pool)
+        self.start_search(task)
+    
+    def start_search(self, task):
+        if self.search_task:
+            self.search_task.cancel()
+        self.search_task = task
+        self.find_results.clear()
+        task.signals.matches.connect(lambda matches: self.add_find_results(task, matches))
+        self.start_file_task(task,
+                             lambda count: self.status_bar.showMessage(f"{count} matches", 3000),
+                             "Search failed")
+    
+    def add_find_results(self, task, matches):
+        if task is not self.search_task:
+            return
+        for key, name, line, column, matched, line_text in matches:
+            item = QListWidgetItem(f"{name}:{line + 1}: {line_text.strip()[:200]}")
+            item.setData(Qt.ItemDataRole.UserRole, (key, line, column, matched, line_text))
+            self.find_results.addItem(item)
+    
+    def go_to_match(self, item):
+        key, line, column, matched, line_text = item.data(Qt.ItemDataRole.UserRole)
+        if isinstance(key, str):
+            # A file from a folder search; open it unless it already is
+            for editor, document in self.documents.items():
+                if document.path == key:
+                    key = editor
+                    break
+            else:
+                self.open_path(key, lambda editor: self.select_match(editor, line, column, matched, line_text))
+                return
+        elif key not in self.documents:
+            self.status_bar.showMessage("That tab has been closed", 3000)
+            return
+        self.select_match(key, line, column, matched, line_text)
+    
+    def select_match(self, editor, line, column, matched, line_text):
+        if not self.documents[editor].loaded:
+            self.reload_tab(editor, lambda: self.select_match(editor, line, column, matched, line_text))
+        self.tabs.setCurrentWidget(editor)
+        if not self.documents[editor].loaded:
+            return
+        if isinstance(editor, LargeFileView):
+            editor.go_to_line(line)
+            line -= editor.buffer.pages[editor.first_page][2]
+        
+        block = editor.document().findBlockByNumber(line)
+        if not block.isValid():
+            return
+        start = block.position() + utf16_length(line_text[:column])
+        cursor = editor.textCursor()
+        cursor.setPosition(start)
+        cursor.setPosition(start + utf16_length(matched), QTextCursor.MoveMode.KeepAnchor)
+        editor.setTextCursor(cursor)
+        editor.ensureCursorVisible()
+    
     def zoom_in(self):
         current_editor = self.get_current_editor()
         if current_editor:
@@ -432,21 +2605,134 @@ class AccurateNotepad(QMainWindow):
         current_editor = self.get_current_editor()
         if not current_editor:
             return
-            
+        
         selected_text = current_editor.textCursor().selectedText()
         if not selected_text:
             QMessageBox.information(self, "Info", "Please select some text to query the LLM")
             return
-            
+        
         if not self.settings['llm_api_key']:
             self.configure_llm()
             if not self.settings['llm_api_key']:
                 return
-                
-        response = self.llm.query(selected_text)
         
-        # Add response in a new tab
-        self.add_new_tab(response, "LLM Response")
+        # Add response in a new tab and stream tokens into it as they arrive
+        self.add_new_tab("", "LLM Response")
+        editor = self.get_current_editor()
+        
+        task = LLMQueryTask(self.llm, selected_text, context=self.settings['llm_context'])
+        self.llm_tasks[task] = editor
+        task.signals.chunk.connect(lambda text: self.append_llm_chunk(editor, text))
+        task.signals.finished.connect(lambda: self.finish_llm_task(task))
+        self.status_bar.showMessage("Waiting for LLM response...")
+        QThreadPool.globalInstance().start(task)
+    
+    def append_llm_chunk(self, editor, text):
+        if editor not in self.documents:
+            return
+        cursor = QTextCursor(editor.document())
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.insertText(text)
+    
+    def finish_llm_task(self, task):
+        self.llm_tasks.pop(task, None)
+        if not self.llm_tasks:
+            self.status_bar.showMessage("LLM response complete", 3000)
+    
+    def index_folder(self):
+        directory = QFileDialog.getExistingDirectory(self, "Index Folder")
+        if not directory:
+            return
+        self.embeddings.add_folder(directory)
+        self.status_bar.showMessage(f"Indexing {directory}...")
+        self.start_file_task(IndexTask(self.embeddings),
+                             lambda count: self.status_bar.showMessage(f"Indexed {count} changed files", 3000),
+                             "Indexing failed")
+    
+    def set_llm_context(self, enabled):
+        if self.settings['llm_context'] != enabled:
+            self.settings['llm_context'] = enabled
+            self.save_settings()
+    
+    def llm_batch_dialog(self):
+        if not self.settings['llm_api_key']:
+            self.configure_llm()
+            if not self.settings['llm_api_key']:
+                return
+        
+        dialog = QDialog(self)
+        dialog.setWindowTitle("LLM Batch")
+        dialog.setModal(True)
+        
+        layout = QVBoxLayout()
+        
+        # Prompt template
+        layout.addWidget(QLabel("Prompt template ({text} is replaced by each input):"))
+        template_edit = QTextEdit()
+        template_edit.setPlainText("Summarize the following text:\n\n{text}")
+        layout.addWidget(template_edit)
+        
+        # Inputs
+        layout.addWidget(QLabel("Apply to:"))
+        source_combo = QComboBox()
+        source_combo.addItems(["All open tabs", "Paragraphs of current tab", "Files in a folder..."])
+        layout.addWidget(source_combo)
+        
+        # Results
+        layout.addWidget(QLabel("Write results to:"))
+        output_combo = QComboBox()
+        output_combo.addItems(["New tabs", "A folder..."])
+        layout.addWidget(output_combo)
+        
+        layout.addWidget(QLabel("Concurrent requests:"))
+        workers_spin = QSpinBox()
+        workers_spin.setRange(1, 32)
+        workers_spin.setValue(4)
+        layout.addWidget(workers_spin)
+        
+        run_btn = QPushButton("Run")
+        run_btn.clicked.connect(lambda: self.run_llm_batch(
+            template_edit.toPlainText(),
+            source_combo.currentIndex(),
+            output_combo.currentIndex(),
+            workers_spin.value(),
+            dialog
+        ))
+        layout.addWidget(run_btn)
+        
+        dialog.setLayout(layout)
+        dialog.exec()
+    
+    def run_llm_batch(self, template, source, output, max_workers, dialog):
+        # Editor contents are collected here on the GUI thread; folder
+        # inputs are read by the batch as it goes
+        if source == 0:
+            items = [(self.tabs.tabText(i), str(self.editor_text(self.tabs.widget(i))))
+                     for i in range(self.tabs.count())]
+        elif source == 1:
+            items = LLMBatch.paragraphs(str(self.editor_text(self.get_current_editor())))
+        else:
+            directory = QFileDialog.getExistingDirectory(dialog, "Input Folder")
+            if not directory:
+                return
+            paths = LLMBatch.directory_files(directory)
+            items = LLMBatch.read_files(directory, paths)
+        total = len(paths) if source == 2 else len(items)
+        
+        output_dir = None
+        if output == 1:
+            output_dir = QFileDialog.getExistingDirectory(dialog, "Output Folder")
+            if not output_dir:
+                return
+        
+        batch = LLMBatch(self.llm, template, max_workers=max_workers, context=self.settings['llm_context'])
+        task = LLMBatchTask(batch, items, total, output_dir)
+        task.signals.result.connect(lambda name, response: self.add_new_tab(response, f"LLM: {name}"))
+        self.start_file_task(task,
+                             lambda done: self.status_bar.showMessage(f"LLM batch finished: {done} results", 3000),
+                             "LLM batch failed")
+        self.status_bar.showMessage(f"LLM batch: {total} inputs...")
+        dialog.close()
     
     def generate_invoice_dialog(self):
         dialog = QDialog(self)
@@ -497,33 +2783,138 @@ class AccurateNotepad(QMainWindow):
             dialog.close()
         except Exception as e:
             QMessageBox.critical(dialog, "Error", f"Invalid input format: {str(e)}")
+            return
+        
+        try:
+            self.ledger.record([(client_name, items)])
+        except (OSError, sqlite3.Error) as e:
+            self.status_bar.showMessage(f"Could not add the invoice to the ledger: {str(e)}", 5000)
+    
+    def bulk_invoices(self):
+        input_path, _ = QFileDialog.getOpenFileName(self, "Line Items", "",
+                                                   "Line Items (*.csv *.json *.jsonl);;All Files (*)")
+        if not input_path:
+            return
+        output_dir = QFileDialog.getExistingDirectory(self, "Invoice Folder")
+        if not output_dir:
+            return
+        
+        # Spawned workers rather than forks of the running Qt process
+        engine = BulkInvoiceEngine(output_dir, mp_context=multiprocessing.get_context('spawn'), ledger=self.ledger)
+        self.status_bar.showMessage(f"Generating invoices from {input_path}...")
+        self.start_file_task(BulkInvoiceTask(engine, input_path),
+                             lambda count: self.status_bar.showMessage(
+                                 f"Wrote {count} invoices to {output_dir}", 5000),
+                             "Could not generate invoices")
+    
+    def invoice_report_dialog(self):
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Invoice Report")
+        dialog.resize(600, 500)
+        
+        layout = QVBoxLayout()
+        
+        # Filters; empty ones don't restrict the report
+        filters = QHBoxLayout()
+        start_edit = QLineEdit()
+        start_edit.setPlaceholderText("From YYYY-MM-DD")
+        end_edit = QLineEdit()
+        end_edit.setPlaceholderText("To YYYY-MM-DD")
+        client_edit = QLineEdit()
+        client_edit.setPlaceholderText("Client")
+        show_btn = QPushButton("Show")
+        for widget in (start_edit, end_edit, client_edit, show_btn):
+            filters.addWidget(widget)
+        layout.addLayout(filters)
+        
+        summary_label = QLabel()
+        layout.addWidget(summary_label)
+        
+        views = QTabWidget()
+        tables = []
+        for title, headers in (("Clients", ["Client", "Invoices", "Total"]),
+                               ("Months", ["Month", "Invoices", "Revenue"]),
+                               ("Items", ["Item", "Quantity", "Total"])):
+            table = QTableWidget(0, 3)
+            table.setHorizontalHeaderLabels(headers)
+            table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+            table.horizontalHeader().setStretchLastSection(True)
+            table.verticalHeader().hide()
+            views.addTab(table, title)
+            tables.append(table)
+        layout.addWidget(views)
+        
+        open_btn = QPushButton("Open as Tab")
+        open_btn.clicked.connect(self.open_invoice_report)
+        layout.addWidget(open_btn)
+        
+        def refresh():
+            self.run_invoice_report(start_edit.text().strip() or None, end_edit.text().strip() or None,
+                                    client_edit.text().strip() or None, summary_label, tables)
+        show_btn.clicked.connect(refresh)
+        for edit in (start_edit, end_edit, client_edit):
+            edit.returnPressed.connect(refresh)
+        refresh()
+        
+        dialog.setLayout(layout)
+        dialog.exec()
+    
+    def run_invoice_report(self, start, end, client, summary_label, tables):
+        summary_label.setText("Loading...")
+        task = LedgerReportTask(self.ledger, start, end, client, 100)
+        self.start_file_task(task, lambda report: self.show_invoice_report(report, summary_label, tables),
+                             "Could not build the report")
+    
+    def show_invoice_report(self, report, summary_label, tables):
+        self.invoice_report = report
+        summary_label.setText(f"{report['invoices']} invoices, {InvoiceLedger.money(report['revenue'])}")
+        numbers = Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+        for table, rows in zip(tables, (report['clients'], report['months'], report['items'])):
+            table.setRowCount(len(rows))
+            for row, (name, count, total) in enumerate(rows):
+                for column, value in enumerate((name, str(count), InvoiceLedger.money(total))):
+                    item = QTableWidgetItem(value)
+                    if column:
+                        item.setTextAlignment(numbers)
+                    table.setItem(row, column, item)
+            table.resizeColumnsToContents()
+    
+    def open_invoice_report(self):
+        if self.invoice_report:
+            self.add_new_tab(InvoiceLedger.format_report(self.invoice_report), "Invoice Report")
     
     def send_to_telegram(self):
         current_editor = self.get_current_editor()
         if not current_editor:
             return
-            
+        
         selected_text = current_editor.textCursor().selectedText()
         if not selected_text:
-            selected_text = current_editor.toPlainText()
-            
+            selected_text = str(self.editor_text(current_editor))
+        
         if not selected_text:
             QMessageBox.information(self, "Info", "No text to send")
             return
-            
+        
         if not self.settings['telegram_token'] or not self.settings['telegram_chat_id']:
             self.configure_telegram()
             if not self.settings['telegram_token'] or not self.settings['telegram_chat_id']:
                 return
-                
+        
         self.telegram.token = self.settings['telegram_token']
         self.telegram.chat_id = self.settings['telegram_chat_id']
         
-        success = self.telegram.send_message(selected_text)
+        # Earlier failures go out first, then the new message
+        self.telegram_queue.retry_journal()
+        # QTextEdit selections use paragraph separators for line breaks
+        self.telegram_queue.send(selected_text.replace('\u2029', '\n'))
+        self.status_bar.showMessage("Sending to Telegram...")
+    
+    def telegram_sent(self, success, job_id):
         if success:
-            QMessageBox.information(self, "Success", "Message sent to Telegram")
+            self.status_bar.showMessage("Message sent to Telegram", 3000)
         else:
-            QMessageBox.critical(self, "Error", "Failed to send message to Telegram")
+            self.status_bar.showMessage("Failed to send message to Telegram; it is kept for retry", 5000)
     
     def configure_llm(self):
         dialog = QDialog(self)
@@ -588,6 +2979,96 @@ class AccurateNotepad(QMainWindow):
         dialog.setLayout(layout)
         dialog.exec()
     
+    def configure_memory(self):
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Memory Limits")
+        dialog.setModal(True)
+        
+        layout = QVBoxLayout()
+        
+        layout.addWidget(QLabel("Memory for all open tabs (MB):"))
+        budget_spin = QSpinBox()
+        budget_spin.setRange(64, 1024 * 1024)
+        budget_spin.setValue(self.settings['memory_budget_mb'])
+        layout.addWidget(budget_spin)
+        
+        layout.addWidget(QLabel("Undo history per tab (MB):"))
+        undo_spin = QSpinBox()
+        undo_spin.setRange(1, 64 * 1024)
+        undo_spin.setValue(self.settings['undo_limit_mb'])
+        layout.addWidget(undo_spin)
+        
+        save_btn = QPushButton("Save")
+        save_btn.clicked.connect(lambda: self.save_memory_config(
+            budget_spin.value(),
+            undo_spin.value(),
+            dialog
+        ))
+        layout.addWidget(save_btn)
+        
+        dialog.setLayout(layout)
+        dialog.exec()
+    
+    def save_memory_config(self, budget_mb, undo_mb, dialog):
+        self.settings['memory_budget_mb'] = budget_mb
+        self.settings['undo_limit_mb'] = undo_mb
+        self.save_settings()
+        self.apply_memory_limits()
+        dialog.close()
+        QMessageBox.information(self, "Success", "Memory limits saved")
+    
+    def apply_memory_limits(self):
+        self.memory_budget.limit = self.settings['memory_budget_mb'] * 1024 * 1024
+        # Undo steps hold UTF-16 text, two bytes a character
+        self.undo_limit = self.settings['undo_limit_mb'] * 1024 * 1024 // 2
+        for editor in self.documents:
+            editor.max_undo_chars = self.undo_limit
+            if editor.undo_chars > self.undo_limit:
+                editor.trim_undo()
+        self.check_memory()
+    
+    def set_profiling(self, enabled):
+        profiler.enabled = enabled
+        self.profile_label.setVisible(enabled)
+        if enabled:
+            self.profile_timer.start()
+            self.update_profile_label()
+        else:
+            self.profile_timer.stop()
+        if self.settings['profiling'] != enabled:
+            self.settings['profiling'] = enabled
+            self.save_settings()
+    
+    def update_profile_label(self):
+        summary = profiler.summary()
+        if not summary:
+            self.profile_label.setText("Profiling: no timings yet")
+            return
+        # The three hot paths that took the most time overall
+        busiest = sorted(summary.items(), key=lambda item: item[1]['total_ms'], reverse=True)[:3]
+        self.profile_label.setText("  ".join(
+            f"{name} p95 {stats['p95_ms']:.2f} ms" for name, stats in busiest))
+        self.profile_label.setToolTip("\n".join(
+            f"{name}: {stats['count']} x, mean {stats['mean_ms']:.3f} ms, p50 {stats['p50_ms']:.3f}, "
+            f"p95 {stats['p95_ms']:.3f}, p99 {stats['p99_ms']:.3f}, max {stats['max_ms']:.3f}"
+            for name, stats in summary.items()))
+    
+    def export_timings(self):
+        file_path, selected = QFileDialog.getSaveFileName(
+            self, "Export Timings", "timings.json",
+            "Timing histograms (*.json);;Chrome trace (*.json)")
+        if not file_path:
+            return
+        try:
+            if selected.startswith("Chrome"):
+                profiler.export_chrome_trace(file_path)
+            else:
+                profiler.export_json(file_path)
+        except OSError as e:
+            QMessageBox.critical(self, "Error", f"Could not export timings: {str(e)}")
+            return
+        self.status_bar.showMessage(f"Timings exported: {file_path}", 3000)
+    
     def save_telegram_config(self, token, chat_id, dialog):
         self.settings['telegram_token'] = token.strip()
         self.settings['telegram_chat_id'] = chat_id.strip()
@@ -596,25 +3077,34 @@ class AccurateNotepad(QMainWindow):
         QMessageBox.information(self, "Success", "Telegram configuration saved")
     
     def load_settings(self):
-        try:
-            if os.path.exists('notepad_settings.json'):
-                with open('notepad_settings.json', 'r') as f:
-                    self.settings = json.load(f)
-                    
-                # Update modules with loaded settings
-                self.llm.set_api_key(self.settings.get('llm_api_key', ''))
-                self.telegram.token = self.settings.get('telegram_token', '')
-                self.telegram.chat_id = self.settings.get('telegram_chat_id', '')
-        except Exception:
-            pass  # Use default settings if loading fails
+        # Update modules with loaded settings
+        self.llm.set_api_key(self.settings['llm_api_key'])
+        self.telegram.token = self.settings['telegram_token']
+        self.telegram.chat_id = self.settings['telegram_chat_id']
+        self.apply_memory_limits()
     
     def save_settings(self):
+        # Several changes in a row are written once
+        self.settings_timer.start()
+    
+    def write_settings(self):
+        self.settings_timer.stop()
         try:
-            with open('notepad_settings.json', 'w') as f:
-                json.dump(self.settings, f)
-        except Exception as e:
+            self.settings.save()
+        except OSError as e:
             print(f"Error saving settings: {str(e)}")
     
+    def closeEvent(self, event):
+        if self.settings.changed:
+            self.write_settings()
+        self.save_session()
+        self.ledger.close()
+        self.process_pool.shutdown()
+        # Unsaved tabs come back from their journals on the next start
+        self.autosave.discard_all(keep={editor for editor, document in self.documents.items()
+                                        if document.dirty})
+        super().closeEvent(event)
+    
     def show_about(self):
         QMessageBox.about(self, "About Accurate Notepad",
                          "Accurate Notepad\n\n"
@@ -629,4 +3119,7 @@ if __name__ == "__main__":
     app = QApplication(sys.argv)
     notepad = AccurateNotepad()
     notepad.show()
-    sys.exit(app.exec())
\ No newline at end of file
+    exit_code = app.exec()
+    # Let saves that are still running finish replacing their files
+    QThreadPool.globalInstance().waitForDone()
+    sys.exit(exit_code)
\ No newline at end of file
@@ -0,0 +1,28 @@
+import importlib
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "Accurate-Notepad.py")
+
+# Benchmarks run headless unless a platform is chosen explicitly
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def load_core():
+    # The Qt-free part of the app
+    return importlib.import_module("notepad_core")
+
+
+def load_app():
+    # The script name has a dash in it, so it can't be imported normally
+    if "accurate_notepad" in sys.modules:
+        return sys.modules["accurate_notepad"]
+    spec = importlib.util.spec_from_file_location("accurate_notepad", APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["accurate_notepad"] = module
+    spec.loader.exec_module(module)
+    return module
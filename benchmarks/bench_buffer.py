@@ -0,0 +1,101 @@
+"""Time the TextBuffer piece table against whole-string text handling.
+
+Edits and line lookups are timed on the buffer alone, next to splicing a
+Python string. Saving is timed through a CodeEditor: a snapshot of its
+buffer streamed to disk against toPlainText() written out, as saves did
+before, with the Python memory each path allocates on top of the text.
+
+Usage: python benchmarks/bench_buffer.py [megabytes ...]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from _app import load_app, load_core
+from bench_editor import make_text
+
+EDITS = 2000
+
+
+def time_edits(buffer, text):
+    rng = random.Random(0)
+    positions = [rng.randrange(len(text)) for _ in range(EDITS)]
+    
+    start = time.perf_counter()
+    for position in positions:
+        buffer.insert(position, "x")
+    insert = (time.perf_counter() - start) / EDITS
+    start = time.perf_counter()
+    for position in positions:
+        buffer.delete(position, 1)
+    delete = (time.perf_counter() - start) / EDITS
+    start = time.perf_counter()
+    for position in positions[:200]:
+        text = text[:position] + "x" + text[position:]
+    splice = (time.perf_counter() - start) / 200
+    
+    lines = [rng.randrange(buffer.line_count) for _ in range(EDITS)]
+    start = time.perf_counter()
+    for line in lines:
+        buffer.line_start(line)
+    lookup = (time.perf_counter() - start) / EDITS
+    return insert, delete, splice, lookup
+
+
+def save(app, path, text):
+    # Returns seconds spent on the GUI thread and in the save itself
+    start = time.perf_counter()
+    text = text()
+    grab = time.perf_counter() - start
+    app.SaveFileTask(path, text=text).work()
+    return grab, time.perf_counter() - start - grab
+
+
+def peak_memory(function):
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+
+def main():
+    from PyQt6.QtWidgets import QApplication
+    qt_app = QApplication.instance() or QApplication(sys.argv[:1])
+    app = load_app()
+    core = load_core()
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1, 10, 50]
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "saved.py")
+        for megabytes in sizes:
+            text = make_text(megabytes)
+            start = time.perf_counter()
+            buffer = core.TextBuffer(text)
+            build = time.perf_counter() - start
+            insert, delete, splice, lookup = time_edits(buffer, text)
+            
+            editor = app.CodeEditor()
+            editor.set_text(text)
+            del text
+            streamed = save(app, path, editor.text_snapshot)
+            copied = save(app, path, editor.toPlainText)
+            streamed_memory = peak_memory(lambda: save(app, path, editor.text_snapshot))
+            copied_memory = peak_memory(lambda: save(app, path, editor.toPlainText))
+            editor.deleteLater()
+            qt_app.processEvents()
+            
+            print(f"{megabytes:>5} MB  build {build * 1000:7.2f} ms  insert {insert * 1e6:6.1f} us  "
+                  f"delete {delete * 1e6:6.1f} us  (string splice {splice * 1e6:8.1f} us)  "
+                  f"line lookup {lookup * 1e6:5.1f} us")
+            for name, (grab, write), memory in (("snapshot", streamed, streamed_memory),
+                                                ("toPlainText", copied, copied_memory)):
+                print(f"        save via {name:<12} GUI thread {grab * 1000:8.3f} ms  "
+                      f"write {write * 1000:8.1f} ms  peak +{memory:6.1f} MB", flush=True)
+
+
+if __name__ == "__main__":
+    main()
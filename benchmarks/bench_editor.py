@@ -0,0 +1,154 @@
+"""Time typing and scrolling in the tab editor on large synthetic files.
+
+Files up to LargeFileView.THRESHOLD load into a CodeEditor like any tab;
+bigger ones are written to a temporary file and paged in by a
+LargeFileView, as File > Open does. Each figure covers one edit or one
+page of scrolling plus a synchronous repaint; idle-time highlighting is
+paused while measuring.
+
+Usage: python benchmarks/bench_editor.py [--compare] [megabytes ...]
+
+--compare adds QTextEdit, the widget tabs used before, for files up to
+10 MB.
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from _app import load_app
+from bench_highlighter import SAMPLE
+
+STEPS = 50
+COMPARE_LIMIT_MB = 10
+
+
+def make_text(megabytes):
+    return SAMPLE * (megabytes * 1024 * 1024 // len(SAMPLE) + 1)
+
+
+def write_file(megabytes):
+    fd, path = tempfile.mkstemp(suffix=".py")
+    with os.fdopen(fd, "w") as f:
+        for _ in range(megabytes * 1024 * 1024 // len(SAMPLE) + 1):
+            f.write(SAMPLE)
+    return path
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return statistics.median(samples) * 1000, samples[int(len(samples) * 0.95)] * 1000
+
+
+def time_keystrokes(editor):
+    cursor = editor.textCursor()
+    cursor.setPosition(editor.document().characterCount() // 2)
+    editor.setTextCursor(cursor)
+    editor.ensureCursorVisible()
+    samples = []
+    for _ in range(STEPS):
+        start = time.perf_counter()
+        editor.textCursor().insertText("x")
+        editor.repaint()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def time_scrolling(editor):
+    bar = editor.verticalScrollBar()
+    bar.setValue(0)
+    samples = []
+    for _ in range(STEPS):
+        start = time.perf_counter()
+        bar.setValue(bar.value() + bar.pageStep())
+        editor.repaint()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def pause_highlighting(editor):
+    for child in editor.children():
+        timer = getattr(child, "timer", None)
+        if timer is not None:
+            timer.stop()
+
+
+def run_editor(qt_app, name, editor, megabytes):
+    app = load_app()
+    text = make_text(megabytes)
+    editor.resize(900, 700)
+    editor.show()
+
+    # Same setup as AccurateNotepad.set_editor_text
+    start = time.perf_counter()
+    if len(text) > app.LazyHighlighter.THRESHOLD:
+        editor.setPlainText(text)
+        app.LazyHighlighter(editor)
+    else:
+        app.CodeHighlighter(editor.document())
+        editor.setPlainText(text)
+    qt_app.processEvents()
+    load = time.perf_counter() - start
+    del text
+
+    pause_highlighting(editor)
+    report(name, megabytes, load, time_keystrokes(editor), time_scrolling(editor))
+    editor.close()
+    editor.deleteLater()
+    qt_app.processEvents()
+
+
+def run_large_file(qt_app, megabytes):
+    app = load_app()
+    path = write_file(megabytes)
+    try:
+        start = time.perf_counter()
+        view = app.LargeFileView(path)
+        view.resize(900, 700)
+        view.show()
+        qt_app.processEvents()
+        load = time.perf_counter() - start
+
+        pause_highlighting(view)
+        report("LargeFileView", megabytes, load, None, time_scrolling(view))
+        view.release()
+        view.close()
+        view.deleteLater()
+        qt_app.processEvents()
+    finally:
+        os.remove(path)
+
+
+def report(name, megabytes, load, keystrokes, scrolls):
+    if keystrokes:
+        median, p95 = percentiles(keystrokes)
+        typing = f"keystroke {median:8.3f} ms (p95 {p95:8.3f})"
+    else:
+        typing = f"{'read-only':>34}"
+    median, p95 = percentiles(scrolls)
+    print(f"{megabytes:>5} MB  {name:<14} load {load:8.2f} s  {typing}  "
+          f"scroll frame {median:8.3f} ms (p95 {p95:8.3f})", flush=True)
+
+
+def main():
+    from PyQt6.QtWidgets import QApplication, QTextEdit
+    qt_app = QApplication.instance() or QApplication(sys.argv[:1])
+    app = load_app()
+
+    args = sys.argv[1:]
+    compare = "--compare" in args
+    sizes = [int(arg) for arg in args if arg != "--compare"] or [1, 10, 50, 100, 500]
+    for megabytes in sizes:
+        if megabytes * 1024 * 1024 > app.LargeFileView.THRESHOLD:
+            run_large_file(qt_app, megabytes)
+            continue
+        run_editor(qt_app, "CodeEditor", app.CodeEditor(), megabytes)
+        if compare and megabytes <= COMPARE_LIMIT_MB:
+            editor = QTextEdit()
+            editor.setAcceptRichText(False)
+            run_editor(qt_app, "QTextEdit", editor, megabytes)
+
+
+if __name__ == "__main__":
+    main()
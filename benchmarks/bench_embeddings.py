@@ -0,0 +1,92 @@
+"""Time building and searching the EmbeddingIndex on synthetic notes.
+
+A folder of notes is written from random English-like words, indexed
+from scratch, then updated again with nothing changed (a restat of every
+file). Searches are timed as the index does them, one matrix-vector
+product over the memory-mapped vectors, next to scoring each chunk in a
+Python loop.
+
+Usage: python benchmarks/bench_embeddings.py [megabytes ...]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from _app import load_core
+
+FILE_SIZE = 16 * 1024
+QUERIES = 20
+WORDS = ("garden tomato water soil invoice client payment bicycle chain rain oven bread flour "
+         "meeting agenda budget travel train ticket server deploy backup python editor font "
+         "letter family holiday doctor appointment recipe salt pepper river mountain").split()
+
+
+def write_notes(directory, megabytes):
+    rng = random.Random(0)
+    for number in range(megabytes * 1024 * 1024 // FILE_SIZE):
+        lines = []
+        size = 0
+        while size < FILE_SIZE:
+            line = " ".join(rng.choice(WORDS) for _ in range(rng.randrange(4, 16))) + "\n"
+            lines.append(line)
+            size += len(line)
+        with open(os.path.join(directory, f"note{number:05d}.txt"), "w") as f:
+            f.write("".join(lines))
+
+
+def loop_search(index, query):
+    # Scores chunk by chunk, as a search without the vectorized product would
+    vectors, _, _, live = index.open_maps()
+    target = index.embed([query])[0].tolist()
+    best = (-1.0, -1)
+    for row in range(len(vectors)):
+        if live[row]:
+            score = sum(a * b for a, b in zip(vectors[row].tolist(), target))
+            best = max(best, (score, row))
+    return best
+
+
+def main():
+    core = load_core()
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1, 10, 50]
+    rng = random.Random(1)
+    queries = [" ".join(rng.sample(WORDS, 3)) for _ in range(QUERIES)]
+    
+    for megabytes in sizes:
+        with tempfile.TemporaryDirectory() as workdir:
+            notes = os.path.join(workdir, "notes")
+            os.makedirs(notes)
+            write_notes(notes, megabytes)
+            index = core.EmbeddingIndex(os.path.join(workdir, "index"))
+            index.add_folder(notes)
+            
+            start = time.perf_counter()
+            files = index.update_folders()
+            build = time.perf_counter() - start
+            start = time.perf_counter()
+            index.update_folders()
+            restat = time.perf_counter() - start
+            rows = index.meta["rows"]
+            
+            samples = []
+            for query in queries:
+                start = time.perf_counter()
+                index.search(query, 5)
+                samples.append(time.perf_counter() - start)
+            vectorized = statistics.median(samples)
+            start = time.perf_counter()
+            for query in queries[:3]:
+                loop_search(index, query)
+            loop = (time.perf_counter() - start) / 3
+            
+            print(f"{megabytes:>5} MB  {files:5} files {rows:6} chunks  build {build:6.2f} s "
+                  f"({megabytes / build:5.1f} MB/s)  unchanged update {restat * 1000:7.1f} ms  "
+                  f"search {vectorized * 1000:7.2f} ms  (Python loop {loop * 1000:8.1f} ms)", flush=True)
+            index.close_maps()
+
+
+if __name__ == "__main__":
+    main()
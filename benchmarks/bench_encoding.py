@@ -0,0 +1,107 @@
+"""Time opening and saving Latin-1 and UTF-16 files.
+
+Each fixture is written in chunks, then measured in a fresh process so
+its peak RSS is its own. Files up to LargeFileView.THRESHOLD are read
+like a tab (encoding sniffed from a sample, then decoded in chunks) and
+saved back through SaveFileTask; bigger ones are indexed and decoded
+page by page from a memory map, as LargeFileView does. The saved or
+decoded result is checked against the original bytes. Mapped pages count
+towards peak RSS but are page cache the kernel can drop.
+
+Usage: python benchmarks/bench_encoding.py [megabytes ...]
+"""
+import hashlib
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from _app import load_app, load_core
+
+ENCODINGS = ["latin-1", "utf-16"]
+LINE = "Café crème brûlée £{:>8} ½ prêt-à-porter\r\n"
+
+
+def write_fixture(path, encoding, megabytes):
+    # Returns the SHA-256 of the file
+    digest = hashlib.sha256()
+    encoder = None
+    with open(path, "wb") as f:
+        written = 0
+        number = 0
+        while written < megabytes * 1024 * 1024:
+            text = "".join(LINE.format(number + i) for i in range(10_000))
+            number += 10_000
+            data = text.encode(encoding)
+            if encoder is not None and encoding == "utf-16":
+                data = data[2:]  # only the first chunk gets a byte order mark
+            encoder = encoding
+            f.write(data)
+            digest.update(data)
+            written += len(data)
+    return digest.hexdigest()
+
+
+def measure(path, expected):
+    core = load_core()
+    app = load_app()
+    start = time.perf_counter()
+    encoding, newline = core.sniff_encoding(path)
+    sniff = time.perf_counter() - start
+
+    if os.path.getsize(path) <= app.LargeFileView.THRESHOLD:
+        task = app.ReadFileTask(path)
+        start = time.perf_counter()
+        text = task.work()
+        load = time.perf_counter() - start
+
+        target = path + ".saved"
+        save_task = app.SaveFileTask(target, text=text, encoding=task.encoding, newline=task.newline)
+        start = time.perf_counter()
+        save_task.work()
+        save = time.perf_counter() - start
+        with open(target, "rb") as f:
+            same = hashlib.sha256(f.read()).hexdigest() == expected
+        os.remove(target)
+        mode = "tab"
+    else:
+        start = time.perf_counter()
+        buffer = core.LargeFileBuffer(path)
+        digest = hashlib.sha256()
+        if buffer.bom_size:
+            digest.update(buffer.data[:buffer.bom_size])
+        for page in range(len(buffer.pages)):
+            digest.update(buffer.read_pages(page, page).encode(buffer.codec))
+        load = time.perf_counter() - start
+        save = None
+        same = digest.hexdigest() == expected
+        buffer.close()
+        mode = "paged"
+
+    megabytes = os.path.getsize(path) / 1024 / 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    save = f"{save:6.2f} s" if save is not None else f"{'-':>8}"
+    print(f"{megabytes:7.0f} MB  {encoding:<9} {mode:<5}  sniff {sniff * 1000:6.2f} ms  "
+          f"load {load:7.2f} s ({megabytes / load:6.1f} MB/s)  save {save}  "
+          f"round trip {'ok' if same else 'FAILED'}  peak RSS {peak:6.0f} MB", flush=True)
+
+
+def main():
+    if sys.argv[1:2] == ["--measure"]:
+        measure(sys.argv[2], sys.argv[3])
+        return
+
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10, 50, 200]
+    with tempfile.TemporaryDirectory() as workdir:
+        for megabytes in sizes:
+            for encoding in ENCODINGS:
+                path = os.path.join(workdir, f"{encoding}-{megabytes}.txt")
+                expected = write_fixture(path, encoding, megabytes)
+                subprocess.run([sys.executable, __file__, "--measure", path, expected], check=True)
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Time CodeHighlighter on large synthetic Python files.
+
+Usage: python benchmarks/bench_highlighter.py [lines ...]
+"""
+import sys
+import time
+
+from _app import load_app
+
+SAMPLE = '''\
+class Widget(object):
+    """Docstring that spans
+    more than one line."""
+
+    def render(self, items, limit=None):
+        # Render every item that passes the filter
+        for item in items:
+            if item is None or not item.visible:
+                continue
+            yield "%s: %s" % (item.name, 'ok' if item.valid else 'bad')
+        return None
+
+'''
+
+
+def make_source(lines):
+    sample_lines = SAMPLE.count("\n")
+    return SAMPLE * (lines // sample_lines + 1)
+
+
+def run(qt_app, lines):
+    from PyQt6.QtGui import QTextCursor
+    app = load_app()
+
+    # Same editor as AccurateNotepad.add_new_tab
+    editor = app.CodeEditor()
+    document = editor.document()
+    document.setPlainText(make_source(lines))
+    app.CodeHighlighter(document)  # owned by the document
+
+    # Attaching a highlighter queues a full pass for the event loop
+    start = time.perf_counter()
+    qt_app.processEvents()
+    full = time.perf_counter() - start
+    block_count = document.blockCount()
+
+    # A keystroke in the middle of the file only touches its own block
+    sample_lines = SAMPLE.count("\n")
+    middle = block_count // 2 // sample_lines * sample_lines
+    cursor = QTextCursor(document.findBlockByNumber(middle))
+    start = time.perf_counter()
+    cursor.insertText("x")
+    keystroke = time.perf_counter() - start
+
+    # Opening a triple quote re-highlights until the block states settle
+    start = time.perf_counter()
+    cursor.insertText('"""')
+    reopen = time.perf_counter() - start
+
+    print(f"{block_count:>9} lines  full {full * 1000:9.1f} ms "
+          f"({block_count / full:,.0f} lines/s)  "
+          f"keystroke {keystroke * 1000:7.3f} ms  "
+          f"open triple quote {reopen * 1000:9.1f} ms")
+
+
+def main():
+    from PyQt6.QtWidgets import QApplication
+    qt_app = QApplication.instance() or QApplication(sys.argv[:1])
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 50_000, 200_000]
+    for lines in sizes:
+        run(qt_app, lines)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Time BulkInvoiceEngine on a synthetic CSV of line items.
+
+Usage: python benchmarks/bench_invoices.py [clients] [items per client]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from _app import load_core
+
+
+def write_csv(path, clients, items):
+    with open(path, "w", newline="") as f:
+        f.write("client,name,quantity,price\n")
+        for client in range(clients):
+            f.writelines(f"Client {client},Item {item},{item % 5 + 1},{item * 1.25 + 3:.2f}\n"
+                         for item in range(items))
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    items = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    core = load_core()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        source = os.path.join(workdir, "items.csv")
+        write_csv(source, clients, items)
+
+        for workers in sorted({1, os.cpu_count() or 1}):
+            output_dir = os.path.join(workdir, f"out{workers}")
+            engine = core.BulkInvoiceEngine(output_dir, max_workers=workers)
+            start = time.perf_counter()
+            count = engine.run(source)
+            elapsed = time.perf_counter() - start
+            print(f"{count} invoices x {items} items  {workers:>2} workers  "
+                  f"{elapsed:6.2f} s  {count / elapsed:10,.0f} invoices/s")
+
+
+if __name__ == "__main__":
+    main()
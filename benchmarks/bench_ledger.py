@@ -0,0 +1,92 @@
+"""Time InvoiceLedger recording and reports on synthetic invoices.
+
+Invoices spread over three years are recorded in batches, as bulk runs
+do. Reports are timed over everything, one year and one client, and next
+to the same totals from GROUP BY queries in SQLite. The first report,
+which copies the ledger into memory, is shown separately.
+
+Usage: python benchmarks/bench_ledger.py [invoices] [items per invoice]
+"""
+import datetime
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from _app import load_core
+
+BATCH = 1000
+CLIENTS = 2000
+PRODUCTS = 500
+RUNS = 10
+
+SQL_REPORT = [
+    "SELECT client, COUNT(*), SUM(total) FROM invoices WHERE {where} GROUP BY client",
+    "SELECT substr(date, 1, 7), COUNT(*), SUM(total) FROM invoices WHERE {where} GROUP BY 1",
+    "SELECT product, SUM(quantity), SUM(quantity * price) FROM items "
+    "WHERE invoice IN (SELECT id FROM invoices WHERE {where}) GROUP BY product",
+]
+
+
+def record(ledger, invoices, items):
+    rng = random.Random(0)
+    first_day = datetime.date(2022, 1, 1)
+    for done in range(0, invoices, BATCH):
+        date = (first_day + datetime.timedelta(days=done * 1095 // invoices)).isoformat()
+        batch = [(f"Client {rng.randrange(CLIENTS)}",
+                  [{"name": f"Item {rng.randrange(PRODUCTS)}", "quantity": rng.randrange(1, 10),
+                    "price": rng.randrange(100, 10000) / 100} for _ in range(items)])
+                 for _ in range(min(BATCH, invoices - done))]
+        ledger.record(batch, date)
+
+
+def median_ms(function):
+    samples = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def sql_report(connection, where, params):
+    for query in SQL_REPORT:
+        connection.execute(query.format(where=where), params).fetchall()
+
+
+def main():
+    invoices = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    items = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    core = load_core()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        ledger = core.InvoiceLedger(os.path.join(workdir, "ledger.sqlite3"))
+        start = time.perf_counter()
+        record(ledger, invoices, items)
+        elapsed = time.perf_counter() - start
+        print(f"record {invoices} invoices x {items} items  {elapsed:6.2f} s  "
+              f"{invoices / elapsed:10,.0f} invoices/s  {os.path.getsize(ledger.path) / 2 ** 20:6.1f} MB")
+
+        start = time.perf_counter()
+        ledger.report()
+        print(f"first report (loads the columns)  {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+        connection = ledger.connect()
+        client_id = connection.execute("SELECT id FROM clients WHERE name = 'Client 5'").fetchone()[0]
+        cases = [
+            ("all invoices", {}, "1", ()),
+            ("one year", {"start": "2023-01-01", "end": "2023-12-31"},
+             "date BETWEEN ? AND ?", ("2023-01-01", "2023-12-31")),
+            ("one client", {"client": "Client 5"}, "client = ?", (client_id,)),
+        ]
+        for name, filters, where, params in cases:
+            vectorized = median_ms(lambda: ledger.report(**filters))
+            grouped = median_ms(lambda: sql_report(connection, where, params))
+            print(f"report {name:<14} {vectorized:8.1f} ms  (SQLite GROUP BY {grouped:8.1f} ms)", flush=True)
+        ledger.close()
+
+
+if __name__ == "__main__":
+    main()
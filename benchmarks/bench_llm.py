@@ -0,0 +1,46 @@
+"""Time LLMIntegration round trips against a local OpenAI stub.
+
+Usage: python benchmarks/bench_llm.py [queries]
+"""
+import sys
+import tempfile
+import time
+
+from _app import load_core
+from stubs import OpenAIStubHandler, base_url, start_server
+
+
+def main():
+    queries = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    core = load_core()
+    server = start_server(OpenAIStubHandler)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        llm = core.LLMIntegration("stub-key", cache=core.LLMCache(cache_dir))
+        llm.api_base = base_url(server) + "/v1"
+
+        first_tokens = []
+        start = time.perf_counter()
+        for i in range(queries):
+            sent = time.perf_counter()
+            stream = llm.stream_query(f"prompt {i}")
+            next(stream)
+            first_tokens.append(time.perf_counter() - sent)
+            for _ in stream:
+                pass
+        cold = (time.perf_counter() - start) / queries
+
+        start = time.perf_counter()
+        for i in range(queries):
+            llm.query(f"prompt {i}")
+        cached = (time.perf_counter() - start) / queries
+
+    server.shutdown()
+    print(f"{queries} queries  streamed {cold * 1000:8.2f} ms/query  "
+          f"first token {sum(first_tokens) / queries * 1000:6.2f} ms  "
+          f"cached {cached * 1000:6.3f} ms/query  "
+          f"stub requests {len(server.requests)}")
+
+
+if __name__ == "__main__":
+    main()
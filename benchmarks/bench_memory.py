@@ -0,0 +1,97 @@
+"""Measure what open tabs cost and what the memory budget gets back.
+
+Opens a window with TABS tabs of the given size, each scrolled through
+once so Qt lays it out and highlights it, and prints the window's
+estimate of what the tabs hold next to the process's resident memory
+(Linux only). The budget is then lowered until every background tab has
+given its memory back, and the time to compress the tabs and to restore
+one on selection is reported.
+
+Usage: python benchmarks/bench_memory.py [--tabs N] [megabytes per tab]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from _app import load_app
+from bench_highlighter import SAMPLE
+
+
+def rss_mb():
+    # Resident memory now, not the peak resource.getrusage reports
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        return None
+
+
+def report(label, window):
+    usage = sum(sum(window.tab_memory(editor, document).values())
+                for editor, document in window.documents.items())
+    rss = rss_mb()
+    resident = f"{rss:8.0f} MB resident" if rss is not None else ""
+    print(f"  {label:<22} {usage / (1024 * 1024):8.0f} MB estimated {resident}", flush=True)
+
+
+def scroll_through(qt_app, editor):
+    bar = editor.verticalScrollBar()
+    for value in range(0, bar.maximum() + 1, bar.pageStep()):
+        bar.setValue(value)
+        editor.repaint()
+    qt_app.processEvents()
+
+
+def main():
+    from PyQt6.QtCore import QThreadPool
+    from PyQt6.QtWidgets import QApplication
+    qt_app = QApplication.instance() or QApplication(sys.argv[:1])
+    app = load_app()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tabs", type=int, default=8)
+    parser.add_argument("megabytes", type=int, nargs="?", default=4)
+    args = parser.parse_args()
+    text = SAMPLE * (args.megabytes * 1024 * 1024 // len(SAMPLE) + 1)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in ("XDG_STATE_HOME", "XDG_CONFIG_HOME", "XDG_CACHE_HOME", "XDG_DATA_HOME"):
+            os.environ[name] = os.path.join(workdir, name)
+        print(f"{args.tabs} tabs of {args.megabytes} MB")
+        report("empty window", app.AccurateNotepad())
+
+        window = app.AccurateNotepad()
+        window.resize(900, 700)
+        window.show()
+        window.memory_timer.stop()
+        for i in range(args.tabs):
+            window.add_new_tab(text, f"tab{i}.py", f"tab{i}.py")
+            scroll_through(qt_app, window.get_current_editor())
+        window.add_new_tab()
+        qt_app.processEvents()
+        report("all tabs laid out", window)
+
+        # Everything in the background has to go
+        start = time.perf_counter()
+        window.memory_budget.limit = 1
+        window.check_memory()
+        QThreadPool.globalInstance().waitForDone()
+        qt_app.processEvents()
+        compressed = time.perf_counter() - start
+        report("background compressed", window)
+
+        editor = window.tabs.widget(1)
+        start = time.perf_counter()
+        window.tabs.setCurrentWidget(editor)
+        restored = time.perf_counter() - start
+        sizes = [document.snapshot.nbytes() for document in window.documents.values() if document.snapshot]
+        print(f"  compress {len(sizes)} tabs {compressed * 1000:10.1f} ms, "
+              f"{sum(sizes) / len(sizes) / 1024:.0f} KB each")
+        print(f"  restore one tab      {restored * 1000:10.1f} ms")
+        window.autosave.discard_all()
+
+
+if __name__ == "__main__":
+    main()
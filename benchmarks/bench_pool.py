@@ -0,0 +1,82 @@
+"""Time the ProcessPool against running the same text jobs in a thread.
+
+Replace All runs over several tabs of text: first one after another in
+a background thread, as it ran before, then as pool jobs with one worker
+and with one per core. While each runs, the main thread
+ticks a 1 ms timer, as the GUI thread would, and the longest gap between
+ticks is reported: work in a thread competes with it for the GIL.
+Sending one large text to a worker is timed through shared memory and
+pickled.
+
+Usage: python benchmarks/bench_pool.py [tabs] [megabytes per tab]
+"""
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+from _app import load_core
+
+LINE = "The quick brown fox jumps over the lazy dog; def handler(event): return event.value\n"
+
+
+def longest_stall(function):
+    # Runs function in a thread while this one ticks; returns (seconds,
+    # longest gap between ticks in ms)
+    thread = threading.Thread(target=function)
+    start = last = time.perf_counter()
+    thread.start()
+    gap = 0.0
+    while thread.is_alive():
+        time.sleep(0.001)
+        now = time.perf_counter()
+        gap = max(gap, now - last)
+        last = now
+    return time.perf_counter() - start, gap * 1000
+
+
+def main():
+    tabs = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    megabytes = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    core = load_core()
+    texts = [LINE * (megabytes * 1024 * 1024 // len(LINE)) for _ in range(tabs)]
+    search = core.TextSearch(r"\bevent\b", regex=True)
+    context = multiprocessing.get_context("spawn")
+
+    def in_thread():
+        for text in texts:
+            search.replace_all(text, "message")
+
+    elapsed, stall = longest_stall(in_thread)
+    print(f"{tabs} tabs x {megabytes} MB  thread            {elapsed:6.2f} s  "
+          f"main thread stalled up to {stall:7.1f} ms", flush=True)
+
+    for workers in sorted({1, os.cpu_count() or 1}):
+        pool = core.ProcessPool(workers, mp_context=context)
+        pool.run(len, "x" * pool.INLINE_SIZE)  # start a worker first
+
+        def in_pool():
+            jobs = [pool.submit(search.replace_all, text, "message") for text in texts]
+            for job in jobs:
+                job.result()
+
+        elapsed, stall = longest_stall(in_pool)
+        print(f"{tabs} tabs x {megabytes} MB  pool, {workers:>2} workers  {elapsed:6.2f} s  "
+              f"main thread stalled up to {stall:7.1f} ms", flush=True)
+        pool.shutdown()
+
+    pool = core.ProcessPool(1, mp_context=context)
+    text = "".join(texts)
+    pool.run(len, "x" * pool.INLINE_SIZE)
+    for name, shared_size in (("shared memory", pool.SHARED_SIZE), ("pickled", len(text) + 1)):
+        pool.SHARED_SIZE = shared_size
+        start = time.perf_counter()
+        pool.run(len, text)
+        print(f"send {len(text) / 2 ** 20:.0f} MB to a worker, {name:<13} "
+              f"{(time.perf_counter() - start) * 1000:8.1f} ms", flush=True)
+    pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
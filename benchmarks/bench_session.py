@@ -0,0 +1,64 @@
+"""Time starting the window with many tabs remembered from the last session.
+
+Restored tabs stay empty until first shown, so only the active one reads
+its file at startup. The comparison opens every file up front, as a
+restore without lazy tabs would.
+
+Usage: python benchmarks/bench_session.py [tabs] [kilobytes per file]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from _app import load_app, load_core
+from bench_highlighter import SAMPLE
+
+
+def main():
+    from PyQt6.QtWidgets import QApplication
+    qt_app = QApplication.instance() or QApplication(sys.argv[:1])
+    app = load_app()
+    core = load_core()
+    tabs = int(sys.argv[1]) if len(sys.argv) > 1 else 150
+    kilobytes = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ["XDG_STATE_HOME"] = os.path.join(workdir, "state")
+        os.environ["XDG_CONFIG_HOME"] = os.path.join(workdir, "config")
+        session = core.Session()
+        text = SAMPLE * (kilobytes * 1024 // len(SAMPLE) + 1)
+        for i in range(tabs):
+            path = os.path.join(workdir, f"file{i}.py")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+            session.tabs.append(core.Session.tab(path, "utf-8", "\n"))
+        session.active = tabs // 2
+        session.save()
+
+        start = time.perf_counter()
+        window = app.AccurateNotepad()
+        window.show()
+        qt_app.processEvents()
+        lazy = time.perf_counter() - start
+        window.autosave.discard_all()
+        window.close()
+
+        os.remove(os.path.join(session.directory, session.FILE))
+        start = time.perf_counter()
+        window = app.AccurateNotepad()
+        for tab in session.tabs:
+            with open(tab["path"], "r", encoding="utf-8") as f:
+                window.file_opened(tab["path"], f.read(), encoding="utf-8", newline="\n")
+        window.show()
+        qt_app.processEvents()
+        eager = time.perf_counter() - start
+        window.autosave.discard_all()
+
+    print(f"{tabs} tabs of {kilobytes} KB")
+    print(f"  lazy restore      {lazy * 1000:8.1f} ms")
+    print(f"  open every file   {eager * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Time interpreter startup for the headless CLI and the GUI module.
+
+Fails (exit status 1) if importing notepad_core pulls in Qt, openai,
+requests or numpy, so heavy imports can't creep back into headless runs.
+
+Usage: python benchmarks/bench_startup.py [runs]
+"""
+import statistics
+import subprocess
+import sys
+import time
+
+from _app import APP_PATH, ROOT
+
+HEAVY_MODULES = ["PyQt6", "openai", "requests", "numpy"]
+
+CASES = {
+    "python -c pass": ["-c", "pass"],
+    "import notepad_core": ["-c", "import notepad_core"],
+    "notepad_core.py --help": ["notepad_core.py", "--help"],
+    "import GUI module": ["-c", "import importlib.util as u; s = u.spec_from_file_location('app', %r); "
+                                "s.loader.exec_module(u.module_from_spec(s))" % APP_PATH],
+}
+
+
+def time_command(args, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def heavy_imports():
+    code = ("import sys, notepad_core; "
+            "print(' '.join(m for m in %r if m in sys.modules))" % HEAVY_MODULES)
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True,
+                            capture_output=True, text=True)
+    return result.stdout.split()
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for name, args in CASES.items():
+        print(f"{name:<26} {time_command(args, runs) * 1000:8.1f} ms (median of {runs})")
+
+    loaded = heavy_imports()
+    if loaded:
+        print(f"FAIL: importing notepad_core loads {', '.join(loaded)}")
+        sys.exit(1)
+    print("ok: notepad_core imports no Qt, openai, requests or numpy")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""Run the benchmark suite and compare it with a stored baseline.
+
+Every scenario runs in a fresh headless process, a few times over; the
+median of each figure is kept along with the process's peak RSS. LLM and
+Telegram round trips go to the local stubs in stubs.py, with client-side
+rate limiting off, so they measure the app's own overhead.
+
+Usage: python benchmarks/bench_suite.py [--repeat N] [--tolerance 0.25]
+                                        [--baseline FILE] [--save-baseline]
+                                        [--output FILE] [scenario ...]
+
+Exits with status 1 if any figure is worse than the baseline by more than
+the tolerance. Baselines depend on the machine: record one with
+--save-baseline before comparing on new hardware.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from _app import load_app, load_core
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def qt_app():
+    from PyQt6.QtWidgets import QApplication
+    return QApplication.instance() or QApplication(sys.argv[:1])
+
+
+def scenario_highlighter():
+    from bench_highlighter import make_source
+    from PyQt6.QtGui import QTextDocument
+    app = load_app()
+    qt = qt_app()
+    document = QTextDocument()
+    document.setPlainText(make_source(20_000))
+    start = time.perf_counter()
+    app.CodeHighlighter(document)
+    qt.processEvents()
+    elapsed = time.perf_counter() - start
+    return {"highlighter lines/s": (document.blockCount() / elapsed, "lines/s", "higher")}
+
+
+def scenario_load():
+    from bench_editor import make_text
+    app = load_app()
+    qt = qt_app()
+    window = app.AccurateNotepad()
+    results = {}
+    for megabytes in (1, 10):
+        text = make_text(megabytes)
+        start = time.perf_counter()
+        window.add_new_tab(text, "bench.py", "bench.py")
+        qt.processEvents()
+        results[f"add_new_tab {megabytes} MB"] = ((time.perf_counter() - start) * 1000, "ms", "lower")
+    window.autosave.discard_all()
+    return results
+
+
+def scenario_save():
+    from bench_editor import make_text
+    app = load_app()
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for megabytes in (1, 10):
+            task = app.SaveFileTask(os.path.join(workdir, "saved.py"), text=make_text(megabytes))
+            start = time.perf_counter()
+            task.work()
+            results[f"save {megabytes} MB"] = ((time.perf_counter() - start) * 1000, "ms", "lower")
+    return results
+
+
+def scenario_invoices():
+    core = load_core()
+    generator = core.InvoiceGenerator()
+    items = [{"name": f"Item {i}", "quantity": i % 5 + 1, "price": i * 1.25 + 3} for i in range(10)]
+    total = sum(item["quantity"] * item["price"] for item in items)
+    count = 20_000
+    start = time.perf_counter()
+    for i in range(count):
+        generator.generate_invoice(f"Client {i}", items, total)
+    elapsed = time.perf_counter() - start
+    return {"invoices/s": (count / elapsed, "invoices/s", "higher")}
+
+
+def scenario_llm():
+    from stubs import OpenAIStubHandler, base_url, start_server
+    core = load_core()
+    OpenAIStubHandler.token_delay = 0
+    server = start_server(OpenAIStubHandler)
+    queries = 30
+    with tempfile.TemporaryDirectory() as cache_dir:
+        llm = core.LLMIntegration("stub-key", cache=core.LLMCache(cache_dir))
+        llm.api_base = base_url(server) + "/v1"
+        llm.complete("warm up")
+        start = time.perf_counter()
+        for i in range(queries):
+            llm.complete(f"prompt {i}")
+        complete = (time.perf_counter() - start) / queries
+        start = time.perf_counter()
+        for i in range(queries):
+            "".join(llm.stream_query(f"stream {i}"))
+        stream = (time.perf_counter() - start) / queries
+    server.shutdown()
+    return {"llm complete round trip": (complete * 1000, "ms", "lower"),
+            "llm stream round trip": (stream * 1000, "ms", "lower")}
+
+
+def scenario_telegram():
+    from stubs import TelegramStubHandler, base_url, start_server
+    core = load_core()
+    server = start_server(TelegramStubHandler)
+    telegram = core.TelegramIntegration("stub-token", "42")
+    telegram.api_url = base_url(server)
+    telegram.CHAT_INTERVAL = telegram.GLOBAL_INTERVAL = 0
+    messages = 50
+    telegram.send_message("warm up")
+    start = time.perf_counter()
+    for i in range(messages):
+        telegram.send_message(f"message {i}")
+    elapsed = (time.perf_counter() - start) / messages
+    server.shutdown()
+    return {"telegram round trip": (elapsed * 1000, "ms", "lower")}
+
+
+SCENARIOS = {
+    "highlighter": scenario_highlighter,
+    "load": scenario_load,
+    "save": scenario_save,
+    "invoices": scenario_invoices,
+    "llm": scenario_llm,
+    "telegram": scenario_telegram,
+}
+
+
+def run_scenario(name, repeat):
+    # Returns {figure: {"value", "unit", "better"}} with medians over the runs
+    # Each run gets empty config, state, cache and data folders, so user
+    # settings, recovery journals and caches don't affect the figures
+    runs = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as home:
+            env = dict(os.environ, QT_QPA_PLATFORM="offscreen",
+                       XDG_CONFIG_HOME=os.path.join(home, "config"),
+                       XDG_STATE_HOME=os.path.join(home, "state"),
+                       XDG_CACHE_HOME=os.path.join(home, "cache"),
+                       XDG_DATA_HOME=os.path.join(home, "data"))
+            result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", name],
+                                    check=True, capture_output=True, text=True, env=env)
+        runs.append(json.loads(result.stdout.splitlines()[-1]))
+    figures = {}
+    for figure, (_, unit, better) in runs[0].items():
+        figures[figure] = {"value": statistics.median(run[figure][0] for run in runs),
+                           "unit": unit, "better": better}
+    return figures
+
+
+def compare(results, baseline, tolerance):
+    # Prints one line per figure; returns the number of regressions
+    regressions = 0
+    print(f"{'figure':<34} {'baseline':>12} {'current':>12}  change")
+    for figure, current in results.items():
+        old = baseline.get(figure)
+        value = f"{current['value']:12.2f}"
+        if old is None or not old["value"]:
+            print(f"{figure:<34} {'-':>12} {value}  (new)")
+            continue
+        change = current["value"] / old["value"] - 1
+        worse = -change if current["better"] == "higher" else change
+        status = ""
+        if worse > tolerance:
+            status = "  REGRESSION"
+            regressions += 1
+        print(f"{figure:<34} {old['value']:12.2f} {value}  {change:+7.1%} {current['unit']}{status}")
+    return regressions
+
+
+def main():
+    if sys.argv[1:2] == ["--child"]:
+        figures = SCENARIOS[sys.argv[2]]()
+        figures[f"{sys.argv[2]} peak RSS"] = (peak_rss_mb(), "MB", "lower")
+        print(json.dumps(figures))
+        return
+
+    parser = argparse.ArgumentParser(description="Run the benchmark suite")
+    parser.add_argument("scenarios", nargs="*", help=f"any of {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown before a figure counts as a regression")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario: {name}")
+
+    results = {}
+    for name in args.scenarios or SCENARIOS:
+        results.update(run_scenario(name, args.repeat))
+
+    try:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    except FileNotFoundError:
+        baseline = {}
+    regressions = compare(results, baseline, args.tolerance)
+
+    record = {"machine": f"{platform.node()} {platform.machine()} {platform.python_version()}",
+              "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(record, f, indent=2)
+    if args.save_baseline:
+        # Scenarios that weren't run keep their old figures
+        record["results"] = dict(baseline, **results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(record, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif regressions:
+        print(f"{regressions} figure(s) regressed by more than {args.tolerance:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
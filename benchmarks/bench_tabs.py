@@ -0,0 +1,47 @@
+"""Time attaching highlighters to many small tabs.
+
+Tabs get their grammar from the SyntaxRegistry, which compiles each
+language once; the comparison compiles a fresh Syntax for every tab, as
+tabs did before the registry.
+
+Usage: python benchmarks/bench_tabs.py [tabs]
+"""
+import sys
+import time
+
+from _app import load_app
+
+EXTENSIONS = [".py", ".c", ".js", ".sh", ".json", ".txt"]
+
+
+def attach(tabs, make_syntax):
+    from PyQt6.QtGui import QTextDocument
+    app = load_app()
+    documents = []
+    start = time.perf_counter()
+    for i in range(tabs):
+        document = QTextDocument()
+        document.setPlainText("x = 1\n")
+        app.CodeHighlighter(document, make_syntax(f"tab{i}{EXTENSIONS[i % len(EXTENSIONS)]}"))
+        documents.append(document)
+    return time.perf_counter() - start
+
+
+def main():
+    from PyQt6.QtWidgets import QApplication
+    QApplication.instance() or QApplication(sys.argv[:1])
+    app = load_app()
+    tabs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    # Warm up Qt's text layout machinery first
+    attach(len(EXTENSIONS), app.SyntaxRegistry().for_path)
+    registry = app.SyntaxRegistry()
+    shared = attach(tabs, registry.for_path)
+    fresh = attach(tabs, lambda path: app.Syntax(registry.grammars[registry.for_path(path).name]))
+    print(f"{tabs} tabs, {len(registry.compiled)} languages")
+    print(f"  shared grammars   {shared * 1000:8.1f} ms")
+    print(f"  compiled per tab  {fresh * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
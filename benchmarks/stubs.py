@@ -0,0 +1,98 @@
+"""Local stand-ins for the HTTP services the app talks to."""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class OpenAIStubHandler(BaseHTTPRequestHandler):
+    # Answers /v1/chat/completions like the OpenAI API, streaming the reply
+    # as server-sent events when asked to
+    reply_words = ["This", " is", " a", " stubbed", " response", "."] * 20
+    token_delay = 0.002
+    # Every nth request is rejected with 429 Too Many Requests (0: never)
+    rate_limit_every = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        self.server.requests.append(request)
+
+        if self.rate_limit_every and len(self.server.requests) % self.rate_limit_every == 0:
+            body = json.dumps({"error": {"message": "Rate limit reached", "type": "requests"}}).encode()
+            self.send_response(429)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        if request.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for word in self.reply_words:
+                time.sleep(self.token_delay)
+                chunk = {"object": "chat.completion.chunk",
+                         "choices": [{"index": 0, "delta": {"content": word}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            return
+
+        body = json.dumps({
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant",
+                                                 "content": "".join(self.reply_words)}}],
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TelegramStubHandler(BaseHTTPRequestHandler):
+    # Answers /bot<token>/sendMessage like the Bot API
+    rate_limit_every = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode())
+        self.server.requests.append({key: values[0] for key, values in form.items()})
+
+        if self.rate_limit_every and len(self.server.requests) % self.rate_limit_every == 0:
+            status, reply = 429, {"ok": False, "error_code": 429,
+                                  "parameters": {"retry_after": 0.01}}
+        elif len(form.get("text", [""])[0]) > 4096:
+            status, reply = 400, {"ok": False, "error_code": 400,
+                                  "description": "Bad Request: message is too long"}
+        else:
+            status, reply = 200, {"ok": True, "result": {"message_id": len(self.server.requests)}}
+
+        body = json.dumps(reply).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_server(handler):
+    # Serves on a free local port from a daemon thread; returns the server
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def base_url(server):
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}"
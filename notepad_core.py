@@ -0,0 +1,2717 @@
+"""Headless core of Accurate Notepad.
+
+Everything here runs without Qt, so scripted jobs can use it directly or
+through the command line:
+
+    python3 notepad_core.py invoices items.csv invoices/ --record
+    python3 notepad_core.py ledger --from 2024-01-01 --to 2024-12-31
+    python3 notepad_core.py llm-batch --template "Summarize: {text}" --dir notes/
+    python3 notepad_core.py telegram report.txt
+    python3 notepad_core.py convert in.txt out.txt --from-encoding latin-1
+
+openai, requests and numpy are only imported once a feature needs them.
+"""
+import argparse
+import array
+import base64
+import bisect
+import codecs
+import csv
+import ctypes
+import difflib
+import functools
+import hashlib
+import heapq
+import itertools
+import json
+import locale
+import mmap
+import os
+import queue
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import (ThreadPoolExecutor, ProcessPoolExecutor, CancelledError, wait,
+                                FIRST_COMPLETED)
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from multiprocessing import shared_memory
+
+class Profiler:
+    # Optional timing of hot paths. Each span is added to a histogram for
+    # its name (power-of-two microsecond buckets) and kept, up to the last
+    # MAX_EVENTS, for Chrome's trace viewer (chrome://tracing or Perfetto).
+    # While disabled, timed functions cost one extra call and a flag check.
+    MAX_EVENTS = 100000
+    BUCKETS = 32  # bucket i counts spans shorter than 2**i microseconds
+    
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.clear()
+    
+    def clear(self):
+        with self.lock:
+            self.stats = {}  # name: [count, total ns, max ns, bucket counts]
+            self.events = deque(maxlen=self.MAX_EVENTS)  # (name, start ns, duration ns, thread)
+            self.origin = time.perf_counter_ns()
+    
+    def timed(self, name):
+        # Decorator; generator functions are timed until they finish
+        def decorate(function):
+            # CO_GENERATOR; inspect would add to startup time
+            if function.__code__.co_flags & 0x20:
+                @functools.wraps(function)
+                def generator_wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return (yield from function(*args, **kwargs))
+                    start = time.perf_counter_ns()
+                    try:
+                        return (yield from function(*args, **kwargs))
+                    finally:
+                        self.record(name, start, time.perf_counter_ns() - start)
+                return generator_wrapper
+            
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter_ns()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.record(name, start, time.perf_counter_ns() - start)
+            return wrapper
+        return decorate
+    
+    def record(self, name, start, duration):
+        bucket = min((duration // 1000).bit_length(), self.BUCKETS - 1)
+        thread = threading.get_ident()
+        with self.lock:
+            stat = self.stats.get(name)
+            if stat is None:
+                stat = self.stats[name] = [0, 0, 0, [0] * self.BUCKETS]
+            stat[0] += 1
+            stat[1] += duration
+            stat[2] = max(stat[2], duration)
+            stat[3][bucket] += 1
+            self.events.append((name, start, duration, thread))
+    
+    @staticmethod
+    def percentile(buckets, count, fraction):
+        # Upper bound of the bucket holding that share of the spans, in ms
+        seen = 0
+        for bucket, bucket_count in enumerate(buckets):
+            seen += bucket_count
+            if seen >= count * fraction:
+                return 2 ** bucket / 1000
+        return 2 ** len(buckets) / 1000
+    
+    def summary(self):
+        with self.lock:
+            stats = {name: (count, total, longest, list(buckets))
+                     for name, (count, total, longest, buckets) in self.stats.items()}
+        return {name: {
+            'count': count,
+            'total_ms': total / 1e6,
+            'mean_ms': total / count / 1e6,
+            'max_ms': longest / 1e6,
+            'p50_ms': min(self.percentile(buckets, count, 0.5), longest / 1e6),
+            'p95_ms': min(self.percentile(buckets, count, 0.95), longest / 1e6),
+            'p99_ms': min(self.percentile(buckets, count, 0.99), longest / 1e6),
+            # Upper bound in microseconds: number of spans
+            'histogram_us': {2 ** bucket: n for bucket, n in enumerate(buckets) if n},
+        } for name, (count, total, longest, buckets) in sorted(stats.items())}
+    
+    def export_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=2)
+    
+    def export_chrome_trace(self, path):
+        with self.lock:
+            events = list(self.events)
+        pid = os.getpid()
+        trace = [{'name': name, 'ph': 'X', 'pid': pid, 'tid': thread,
+                  'ts': (start - self.origin) / 1000, 'dur': duration / 1000}
+                 for name, start, duration, thread in events]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+
+# Shared by everything in the process; see AccurateNotepad.set_profiling
+# and the --profile option
+profiler = Profiler()
+
+# UTF-32-LE's mark starts with UTF-16-LE's, so it's tried first
+BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+]
+
+def detect_encoding(sample):
+    # Guesses a file's encoding and line ending from its first bytes and
+    # returns (encoding, newline); newline is None if the sample has no
+    # line break. Files with a byte order mark get the codec that reads and
+    # writes it back (utf-8-sig, or utf-16/utf-32 in native byte order);
+    # the other byte order keeps the mark as a U+FEFF character. Text that
+    # isn't UTF-8 or UTF-16 falls back to cp1252, or latin-1 which takes
+    # any bytes.
+    native = 'le' if sys.byteorder == 'little' else 'be'
+    candidates = []
+    for bom, codec in BOMS:
+        if sample.startswith(bom):
+            if codec == 'utf-8':
+                candidates.append('utf-8-sig')
+            elif codec.endswith(native):
+                candidates.append(codec[:-3])
+            else:
+                candidates.append(codec)
+            break
+    else:
+        # UTF-16 without a mark: mostly ASCII text has a zero in every
+        # other byte
+        even_zeros = sample[0::2].count(0)
+        odd_zeros = sample[1::2].count(0)
+        if odd_zeros > len(sample) // 4 and even_zeros < odd_zeros // 8:
+            candidates.append('utf-16-le')
+        elif even_zeros > len(sample) // 4 and odd_zeros < even_zeros // 8:
+            candidates.append('utf-16-be')
+        candidates.extend(['utf-8', 'cp1252'])
+    
+    for encoding in candidates:
+        try:
+            # The sample may end in the middle of a character
+            text = codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        encoding = 'latin-1'
+        text = sample.decode(encoding)
+    
+    crlf = text.count('\r\n')
+    counts = {'\r\n': crlf, '\r': text.count('\r') - crlf, '\n': text.count('\n') - crlf}
+    newline = max(counts, key=counts.get)
+    return encoding, newline if counts[newline] else None
+
+def sniff_encoding(path, sample_size=64 * 1024):
+    # detect_encoding() on the start of a file, however big it is
+    with open(path, 'rb') as f:
+        return detect_encoding(f.read(sample_size))
+
+class LargeFileBuffer:
+    # Files are split into pages of roughly this many bytes, each ending
+    # on a line boundary so it can be decoded on its own
+    PAGE_SIZE = 1024 * 1024
+    TAIL_SIZE = 256
+    
+    def __init__(self, path, encoding=None):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.data = self.map()
+        
+        if encoding is None:
+            encoding, _ = detect_encoding(self.data[:64 * 1024])
+        self.encoding = encoding
+        # Pages are decoded without a byte order mark, which is skipped
+        self.codec = {'utf-8-sig': 'utf-8'}.get(encoding, encoding)
+        if encoding in ('utf-16', 'utf-32'):
+            self.codec = encoding + ('-le' if sys.byteorder == 'little' else '-be')
+        self.bom_size = 0 if encoding == self.codec else len('\ufeff'.encode(self.codec))
+        self.newline = '\n'.encode(self.codec)
+        
+        # Line offsets are indexed once, one entry per page:
+        # (start byte, end byte, number of the page's first line)
+        self.pages = []
+        self.line_count = 0
+        self.index_pages(self.bom_size)
+        # A copy of the last bytes, to tell an append from a rewrite
+        self.tail = bytes(self.data[-self.TAIL_SIZE:])
+    
+    def map(self):
+        try:
+            return mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped
+            return b''
+    
+    def index_pages(self, start):
+        size = len(self.data)
+        unit = len(self.newline)
+        while start < size:
+            end = self.find_newline(start, max(start, min(start + self.PAGE_SIZE, size) - unit))
+            end = size if end < 0 else end + unit
+            self.pages.append((start, end, self.line_count))
+            self.line_count += self.count_newlines(start, end)
+            start = end
+        self.page_lines = [first_line for _, _, first_line in self.pages]
+    
+    def find_newline(self, start, position):
+        # The first line break at or after position; for UTF-16 and UTF-32
+        # only matches on whole characters count
+        unit = len(self.newline)
+        position -= (position - start) % unit
+        end = self.data.find(self.newline, position)
+        while end >= 0 and (end - start) % unit:
+            end = self.data.find(self.newline, end + 1)
+        return end
+    
+    def count_newlines(self, start, end):
+        if len(self.newline) == 1:
+            return self.data[start:end].count(self.newline)
+        # Count whole code units so no pair of characters can fake one
+        units = array.array('H' if len(self.newline) == 2 else 'I')
+        units.frombytes(self.data[start:end - (end - start) % units.itemsize])
+        if not self.codec.endswith('le' if sys.byteorder == 'little' else 'be'):
+            units.byteswap()
+        return units.count(ord('\n'))
+    
+    def extend(self):
+        # Maps and indexes bytes appended to the file since it was opened.
+        # Returns False if the file was replaced, shrunk or rewritten, in
+        # which case it has to be opened again.
+        try:
+            if os.stat(self.path).st_ino != os.fstat(self.file.fileno()).st_ino:
+                return False
+        except OSError:
+            return False
+        data = self.map()
+        size = len(self.data)
+        if len(data) < size or data[size - len(self.tail):size] != self.tail:
+            if isinstance(data, mmap.mmap):
+                data.close()
+            return False
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.data = data
+        self.tail = bytes(data[-self.TAIL_SIZE:])
+        
+        # The last page may not have ended on a line boundary
+        start = self.bom_size
+        if self.pages:
+            start, _, self.line_count = self.pages.pop()
+        self.index_pages(start)
+        return True
+    
+    def page_for_line(self, line):
+        return max(0, bisect.bisect_right(self.page_lines, line) - 1)
+    
+    def read_pages(self, first, last):
+        start = self.pages[first][0]
+        end = self.pages[last][1]
+        return self.data[start:end].decode(self.codec, errors='replace')
+    
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+class RecoveryJournal:
+    # Unsaved edits of one document, kept as an append-only log of
+    # [position, chars removed, inserted text] on top of a base: nothing
+    # (an empty document), the file as last saved, or a snapshot written
+    # when the log is compacted. Positions count UTF-16 code units, as Qt
+    # reports them.
+    COMPACT_BYTES = 1024 * 1024
+    
+    def __init__(self, directory=None, doc_id=None):
+        if directory is None:
+            directory = self.default_directory()
+        self.directory = directory
+        self.doc_id = doc_id or uuid.uuid4().hex
+        # encoding and newline: the file's, for reading it as the base
+        # and for saving the recovered text the same way
+        self.meta = {'title': None, 'path': None, 'base': None, 'encoding': None, 'newline': None}
+        self.pending = []
+        self.log_bytes = 0
+    
+    @staticmethod
+    def default_directory():
+        state_home = os.environ.get('XDG_STATE_HOME') or os.path.expanduser('~/.local/state')
+        return os.path.join(state_home, 'accurate-notepad', 'recovery')
+    
+    def file_path(self, suffix):
+        return os.path.join(self.directory, f"{self.doc_id}.{suffix}")
+    
+    def write_meta(self):
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self.file_path('json.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f)
+        os.replace(temp_path, self.file_path('json'))
+    
+    def reset_to_empty(self):
+        self.discard()
+        self.meta.update(path=None, base='empty', encoding=None, newline=None)
+    
+    def reset_to_file(self, path, encoding=None, newline=None):
+        # The document matches the file on disk again (just opened or
+        # saved); size and mtime tell later whether the file still does
+        stat = os.stat(path)
+        self.discard()
+        self.meta.update(path=path, base='file', size=stat.st_size, mtime=stat.st_mtime_ns,
+                         encoding=encoding, newline=newline)
+    
+    def record(self, position, removed, text):
+        self.pending.append([position, removed, text])
+    
+    def flush(self):
+        # Appends the recorded edits to the log; returns True once the log
+        # is big enough to be worth compacting
+        if not self.pending:
+            return False
+        if not self.log_bytes:
+            self.write_meta()
+        data = ''.join(json.dumps(edit) + '\n' for edit in self.pending).encode('utf-8')
+        with open(self.file_path('log'), 'ab') as f:
+            f.write(data)
+        self.pending.clear()
+        self.log_bytes += len(data)
+        return self.log_bytes > self.COMPACT_BYTES
+    
+    def snapshot(self, text):
+        # Compaction: the full text becomes the new base and the log starts
+        # over. Also needed before the first flush when base is None.
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self.file_path('snapshot.tmp')
+        with open(temp_path, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+        os.replace(temp_path, self.file_path('snapshot'))
+        self.meta['base'] = 'snapshot'
+        self.write_meta()
+        with open(self.file_path('log'), 'wb'):
+            pass
+        self.pending.clear()
+        self.log_bytes = 0
+    
+    def discard(self):
+        for suffix in ('json', 'log', 'snapshot'):
+            try:
+                os.remove(self.file_path(suffix))
+            except FileNotFoundError:
+                pass
+        self.pending.clear()
+        self.log_bytes = 0
+    
+    def read_base(self):
+        base = self.meta.get('base')
+        if base == 'empty':
+            return ''
+        if base == 'snapshot':
+            with open(self.file_path('snapshot'), 'r', encoding='utf-8', newline='') as f:
+                return f.read()
+        if base == 'file':
+            stat = os.stat(self.meta['path'])
+            if (stat.st_size, stat.st_mtime_ns) != (self.meta['size'], self.meta['mtime']):
+                raise ValueError(f"{self.meta['path']} changed since the journal was started")
+            if 'encoding' in self.meta:
+                encoding = self.meta['encoding']
+            else:
+                # Journals from before encodings were recorded
+                encoding = sniff_encoding(self.meta['path'])[0]
+            with open(self.meta['path'], 'r', encoding=encoding) as f:
+                return f.read()
+        raise ValueError(f"unknown journal base {base!r}")
+    
+    def replay(self):
+        # Rebuilds the text from the base and the logged edits. Edits are
+        # applied to UTF-16 data so positions line up with Qt's; a line cut
+        # short by a crash ends the replay.
+        data = bytearray(self.read_base().encode('utf-16-le', 'surrogatepass'))
+        try:
+            with open(self.file_path('log'), 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        position, removed, text = json.loads(line)
+                    except ValueError:
+                        break
+                    data[position * 2:(position + removed) * 2] = text.encode('utf-16-le', 'surrogatepass')
+        except FileNotFoundError:
+            pass
+        return data.decode('utf-16-le', 'surrogatepass')
+    
+    @classmethod
+    def recover(cls, directory=None):
+        # Yields (journal, text) for every document left behind with
+        # unsaved edits, by a crash or at exit. Journals that can't be
+        # replayed are dropped, except those whose file didn't decode:
+        # they are kept for a later try rather than losing the edits.
+        if directory is None:
+            directory = cls.default_directory()
+        try:
+            names = sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+        except FileNotFoundError:
+            return
+        for name in names:
+            journal = cls(directory, name[:-len('.json')])
+            try:
+                with open(journal.file_path('json'), 'r', encoding='utf-8') as f:
+                    journal.meta = json.load(f)
+                text = journal.replay()
+            except UnicodeDecodeError as e:
+                print(f"Could not read the file under recovery journal {journal.doc_id}: {str(e)}")
+                continue
+            except (OSError, ValueError):
+                journal.discard()
+                continue
+            yield journal, text
+
+def decode_appended(data, encoding=None):
+    # Decodes bytes appended to a text file the way open() in text mode
+    # reads them, with newlines translated. Returns (text, bytes used): an
+    # incomplete character or a '\r' that may start a '\r\n' is left
+    # for the next call.
+    encoding = encoding or locale.getpreferredencoding(False)
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    text = decoder.decode(data, final=False)
+    used = len(data) - len(decoder.getstate()[0])
+    if text.endswith('\r'):
+        text = text[:-1]
+        # Leaves out any byte order mark encode() would add
+        used -= len('\r\r'.encode(encoding)) - len('\r'.encode(encoding))
+    return text.replace('\r\n', '\n').replace('\r', '\n'), used
+
+def line_diff(old_text, new_text, max_lines=20000):
+    # Returns the changes that turn old_text into new_text as hunks
+    # (first line, end line, text): old lines first..end-1 are replaced by
+    # text. Unchanged lines at either end are skipped cheaply; the rest is
+    # matched line by line unless it's too long, then replaced as a whole.
+    def lines(text):
+        parts = text.split('\n')
+        return [part + '\n' for part in parts[:-1]] + ([parts[-1]] if parts[-1] else [])
+    
+    old, new = lines(str(old_text)), lines(str(new_text))
+    prefix = 0
+    limit = min(len(old), len(new))
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    old = old[prefix:len(old) - suffix]
+    new = new[prefix:len(new) - suffix]
+    if not old and not new:
+        return []
+    
+    if len(old) + len(new) > max_lines:
+        return [(prefix, prefix + len(old), ''.join(new))]
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    return [(prefix + i1, prefix + i2, ''.join(new[j1:j2]))
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+
+def utf16_length(text):
+    # Qt positions count UTF-16 code units, so characters outside the
+    # BMP take two
+    return len(text.encode('utf-16-le', 'surrogatepass')) // 2
+
+class TextPiece:
+    # One node of a TextBuffer's treap: source[start:end], plus totals over
+    # the subtree it roots. Never changed once built.
+    __slots__ = ('source', 'start', 'end', 'lines', 'wide', 'priority', 'left', 'right',
+                 'size', 'total_lines', 'total_wide')
+    # Characters outside the BMP, which take two UTF-16 code units
+    ASTRAL = re.compile('[\U00010000-\U0010ffff]')
+    SURROGATE = re.compile('[\ud800-\udfff]')
+    
+    def __init__(self, source, start, end, priority, left=None, right=None, lines=None, wide=None):
+        self.source = source
+        self.start = start
+        self.end = end
+        if lines is None:
+            lines = source.count('\n', start, end)
+        if wide is None:
+            wide = 0 if source.isascii() else len(self.ASTRAL.findall(source, start, end))
+        self.lines = lines
+        self.wide = wide
+        self.priority = priority
+        self.left = left
+        self.right = right
+        self.size = end - start
+        self.total_lines = lines
+        self.total_wide = wide
+        for child in (left, right):
+            if child is not None:
+                self.size += child.size
+                self.total_lines += child.total_lines
+                self.total_wide += child.total_wide
+    
+    def with_children(self, left, right):
+        return TextPiece(self.source, self.start, self.end, self.priority, left, right,
+                         self.lines, self.wide)
+
+class TextBuffer:
+    # Piece table for a tab's text. The text is a sequence of pieces, each
+    # a range of an immutable string (the text as loaded, or a run of
+    # inserted text), held in a treap ordered by position. Subtree totals
+    # of length, newlines and non-BMP characters make edits and line
+    # lookups O(log n), and let positions be given in UTF-16 code units as
+    # Qt reports them. Edits build new nodes instead of changing old ones,
+    # so snapshot() is O(1) and a snapshot can be read from a worker thread
+    # while the buffer keeps being edited.
+    PIECE_SIZE = 4096
+    # Typing extends the piece before the cursor while it is shorter than
+    # this, instead of adding a piece per keystroke
+    MERGE_SIZE = 256
+    
+    def __init__(self, text='', root=None):
+        self.root = root if text == '' else self.build(text)
+    
+    @classmethod
+    def build(cls, text):
+        # A balanced tree of PIECE_SIZE pieces of text; no slices are copied
+        bounds = range(0, len(text), cls.PIECE_SIZE)
+        
+        def subtree(first, last):
+            if first >= last:
+                return None
+            middle = (first + last) // 2
+            left, right = subtree(first, middle), subtree(middle + 1, last)
+            priority = max(random.random(), left.priority if left else 0, right.priority if right else 0)
+            start = bounds[middle]
+            return TextPiece(text, start, min(start + cls.PIECE_SIZE, len(text)), priority, left, right)
+        
+        return subtree(0, len(bounds))
+    
+    @classmethod
+    def merge(cls, left, right):
+        if left is None:
+            return right
+        if right is None:
+            return left
+        if left.priority > right.priority:
+            return left.with_children(left.left, cls.merge(left.right, right))
+        return right.with_children(cls.merge(left, right.left), right.right)
+    
+    @classmethod
+    def split(cls, node, position):
+        # Returns trees holding the first position characters and the rest
+        if node is None:
+            return None, None
+        left_size = node.left.size if node.left else 0
+        if position <= left_size:
+            first, rest = cls.split(node.left, position)
+            return first, node.with_children(rest, node.right)
+        position -= left_size
+        length = node.end - node.start
+        if position >= length:
+            first, rest = cls.split(node.right, position - length)
+            return node.with_children(node.left, first), rest
+        
+        # The cut falls inside this piece
+        cut = node.start + position
+        first = TextPiece(node.source, node.start, cut, random.random())
+        rest = TextPiece(node.source, cut, node.end, random.random())
+        return cls.merge(node.left, first), cls.merge(rest, node.right)
+    
+    def __len__(self):
+        return self.root.size if self.root else 0
+    
+    def __str__(self):
+        return ''.join(self.chunks())
+    
+    def utf16_length(self):
+        return len(self) + (self.root.total_wide if self.root else 0)
+    
+    @property
+    def line_count(self):
+        return (self.root.total_lines if self.root else 0) + 1
+    
+    def snapshot(self):
+        return TextBuffer(root=self.root)
+    
+    def insert(self, position, text):
+        if not text:
+            return
+        first, rest = self.split(self.root, position)
+        last = first
+        while last is not None and last.right is not None:
+            last = last.right
+        if last is not None and last.end - last.start + len(text) <= self.MERGE_SIZE:
+            first, _ = self.split(first, first.size - (last.end - last.start))
+            text = last.source[last.start:last.end] + text
+        self.root = self.merge(self.merge(first, self.build(text)), rest)
+    
+    def delete(self, position, length):
+        if length <= 0:
+            return
+        first, rest = self.split(self.root, position)
+        _, rest = self.split(rest, length)
+        self.root = self.merge(first, rest)
+    
+    def replace(self, position, removed, text):
+        self.delete(position, removed)
+        self.insert(position, text)
+    
+    def replace_utf16(self, position, removed, text):
+        # replace() with position and removed in UTF-16 code units, as in
+        # QTextDocument.contentsChange. Raises ValueError for edits that
+        # split a surrogate pair, which a string of code points can't hold.
+        if TextPiece.SURROGATE.search(text):
+            raise ValueError("edit splits a surrogate pair")
+        end = self.from_utf16(min(position + removed, self.utf16_length()))
+        position = self.from_utf16(position)
+        self.replace(position, end - position, text)
+    
+    def from_utf16(self, units):
+        # Character position of a UTF-16 offset; ValueError if it falls
+        # inside a non-BMP character
+        node, position = self.root, 0
+        while node is not None:
+            left_units = node.left.size + node.left.total_wide if node.left else 0
+            if units < left_units:
+                node = node.left
+                continue
+            units -= left_units
+            position += node.left.size if node.left else 0
+            length = node.end - node.start
+            if units < length + node.wide:
+                if node.wide:
+                    # Each non-BMP character before the offset took two units
+                    for match in TextPiece.ASTRAL.finditer(node.source, node.start, node.end):
+                        index = match.start() - node.start
+                        if index >= units:
+                            break
+                        if index + 1 == units:
+                            raise ValueError("UTF-16 offset inside a surrogate pair")
+                        units -= 1
+                return position + units
+            units -= length + node.wide
+            position += length
+            node = node.right
+        return position
+    
+    def line_start(self, line):
+        # Position of the first character of a line, counted from 0
+        if not 0 <= line < self.line_count:
+            raise IndexError(f"line {line} out of range")
+        node, position = self.root, 0
+        while line:
+            left_lines = node.left.total_lines if node.left else 0
+            if line <= left_lines:
+                node = node.left
+                continue
+            line -= left_lines
+            position += node.left.size if node.left else 0
+            if line <= node.lines:
+                index = node.start - 1
+                for _ in range(line):
+                    index = node.source.find('\n', index + 1)
+                return position + index + 1 - node.start
+            line -= node.lines
+            position += node.end - node.start
+            node = node.right
+        return position
+    
+    def line_at(self, position):
+        # Line number holding a character position
+        node, line = self.root, 0
+        while node is not None:
+            left_size = node.left.size if node.left else 0
+            if position <= left_size:
+                node = node.left
+                continue
+            position -= left_size
+            line += node.left.total_lines if node.left else 0
+            length = node.end - node.start
+            if position <= length:
+                return line + node.source.count('\n', node.start, node.start + position)
+            position -= length
+            line += node.lines
+            node = node.right
+        return line
+    
+    def line(self, line):
+        # Text of a line, without its newline
+        start = self.line_start(line)
+        end = self.line_start(line + 1) - 1 if line + 1 < self.line_count else len(self)
+        return ''.join(self.chunks(start, end))
+    
+    def chunks(self, start=0, end=None):
+        # Yields the text between two positions piece by piece, without
+        # building it as one string
+        end = len(self) if end is None else min(end, len(self))
+        stack = []  # (node, position its subtree starts at)
+        node, offset = self.root, 0
+        while True:
+            # Subtrees entirely outside the range are skipped
+            while node is not None and start < offset + node.size and offset < end:
+                stack.append((node, offset))
+                node = node.left
+            if not stack:
+                return
+            node, offset = stack.pop()
+            offset += node.left.size if node.left else 0
+            first = max(start - offset, 0)
+            last = min(end - offset, node.end - node.start)
+            if first < last:
+                yield node.source[node.start + first:node.start + last]
+            node, offset = node.right, offset + node.end - node.start
+
+class SharedText:
+    # Text handed to a worker process through shared memory instead of
+    # being pickled down a pipe. The creating process releases the block;
+    # workers only read it.
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size  # bytes of UTF-8
+        self.memory = None  # the creator's SharedMemory
+    
+    @classmethod
+    def create(cls, text):
+        # surrogatepass: Qt text may hold unpaired surrogates
+        data = str(text).encode('utf-8', 'surrogatepass')
+        memory = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+        memory.buf[:len(data)] = data
+        shared = cls(memory.name, len(data))
+        shared.memory = memory
+        return shared
+    
+    def __getstate__(self):
+        return {'name': self.name, 'size': self.size, 'memory': None}
+    
+    def read(self):
+        try:
+            memory = shared_memory.SharedMemory(self.name, track=False)
+        except TypeError:
+            # Before Python 3.13 attaching registers the block with the
+            # resource tracker too, but workers share their parent's
+            # tracker, which already has it
+            memory = shared_memory.SharedMemory(self.name)
+        try:
+            with memory.buf[:self.size] as data:
+                return str(data, 'utf-8', 'surrogatepass')
+        finally:
+            memory.close()
+    
+    def release(self):
+        if self.memory is not None:
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+class CompressedText:
+    # A tab's text kept zlib-compressed while the tab is in the background.
+    # Level 1 is several times faster than the default and still shrinks
+    # code and prose to a quarter or so.
+    LEVEL = 1
+    
+    def __init__(self, text, level=LEVEL):
+        # surrogatepass: Qt text may hold unpaired surrogates
+        text = str(text)
+        self.length = len(text)
+        self.data = zlib.compress(text.encode('utf-8', 'surrogatepass'), level)
+    
+    def __len__(self):
+        return self.length
+    
+    def __str__(self):
+        return zlib.decompress(self.data).decode('utf-8', 'surrogatepass')
+    
+    def nbytes(self):
+        return len(self.data)
+
+class MemoryBudget:
+    # Keeps what the open tabs cost within a limit. Background tabs report
+    # their cost in parts they can give back separately, the cheapest to
+    # lose first: layout and highlighting (redone when the tab is shown),
+    # undo history (gone for good, but nothing to wait for) and the text
+    # itself (compressed, unpacked when the tab is selected). Over the
+    # limit, plan() takes one kind of part at a time from the least
+    # recently used tabs until usage is down to TARGET of the limit, so
+    # the next few edits don't go straight over again. Parts smaller than
+    # MIN_PART aren't worth taking.
+    PARTS = ('layout', 'undo', 'text')
+    TARGET = 0.9
+    MIN_PART = 64 * 1024
+    DEFAULT_LIMIT = 1024 * 1024 * 1024
+    
+    def __init__(self, limit=DEFAULT_LIMIT):
+        self.limit = limit
+    
+    def plan(self, usage, tabs):
+        # usage: bytes used by all tabs; tabs: (key, last_active, {part:
+        # bytes}) for those that may give memory back. Returns the (key,
+        # part) pairs to give back, in order.
+        if usage <= self.limit:
+            return []
+        excess = usage - self.limit * self.TARGET
+        tabs = sorted(tabs, key=lambda tab: tab[1])
+        steps = []
+        candidates = ((key, part, parts.get(part, 0))
+                      for part in self.PARTS for key, last_active, parts in tabs)
+        for key, part, size in candidates:
+            if excess <= 0:
+                break
+            if size >= self.MIN_PART:
+                steps.append((key, part))
+                excess -= size
+        return self.without_compressed(steps)
+    
+    @staticmethod
+    def without_compressed(steps):
+        # A compressed tab gives back everything else too
+        compressed = {key for key, part in steps if part == 'text'}
+        return [(key, part) for key, part in steps if part == 'text' or key not in compressed]
+
+def release_free_memory():
+    # glibc keeps memory the process frees for reuse instead of handing it
+    # back, so resident memory stays up after tabs let go of their text
+    # and layout until malloc_trim returns it. Does nothing elsewhere.
+    if not sys.platform.startswith('linux'):
+        return
+    try:
+        ctypes.CDLL(None).malloc_trim(0)
+    except (OSError, AttributeError):
+        pass  # not glibc
+
+def run_pool_job(function, args):
+    # Runs in a worker process of a ProcessPool
+    return function(*(arg.read() if isinstance(arg, SharedText) else arg for arg in args))
+
+class ProcessJob:
+    def __init__(self, pool, function, args, priority, owner):
+        self.pool = pool
+        self.function = function
+        self.args = args
+        self.priority = priority
+        self.owner = owner
+        self.started = False
+        self.cancelled = False
+        self.value = None
+        self.error = None
+        self.done = threading.Event()
+    
+    def result(self, cancel_event=None):
+        # Waits for the job, which setting cancel_event cancels. Raises
+        # CancelledError if the job was cancelled.
+        while not self.done.wait(None if cancel_event is None else 0.05):
+            if cancel_event.is_set():
+                self.pool.cancel(self)
+                break
+        if self.cancelled:
+            raise CancelledError()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+class ProcessPool:
+    # Runs CPU-heavy functions in worker processes, so they use all cores
+    # and don't hold the GIL the GUI thread needs. Functions and arguments
+    # must pickle; texts (str or TextBuffer) of SHARED_SIZE characters or
+    # more travel through shared memory. Waiting jobs start in priority
+    # order (lower first, then oldest); a dispatcher thread only hands
+    # over as many as there are workers, so a later urgent job doesn't
+    # queue behind a backlog. Jobs whose texts are all shorter than
+    # INLINE_SIZE aren't worth the round trip and run in the caller.
+    #
+    # Cancelling a waiting job drops it. A running one can't be stopped
+    # from outside; it finishes in its worker and the result is dropped.
+    INTERACTIVE = 0
+    BACKGROUND = 10
+    SHARED_SIZE = 1024 * 1024
+    INLINE_SIZE = 64 * 1024
+    
+    def __init__(self, max_workers=None, mp_context=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.mp_context = mp_context
+        self.executor = None  # started with the first job
+        self.condition = threading.Condition()
+        self.waiting = []  # heap of (priority, sequence, job)
+        self.sequence = itertools.count()
+        self.jobs = set()  # submitted and not finished
+        self.running = 0
+        self.thread = None
+        self.closed = False
+    
+    @classmethod
+    def text_size(cls, args):
+        return max([len(arg) for arg in args if isinstance(arg, (str, TextBuffer))] or [0])
+    
+    def submit(self, function, *args, priority=INTERACTIVE, owner=None):
+        job = ProcessJob(self, function, args, priority, owner)
+        if self.text_size(args) < self.INLINE_SIZE:
+            job.started = True
+            try:
+                job.value = function(*args)
+            except Exception as e:
+                job.error = e
+            job.done.set()
+            return job
+        
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("the process pool is shut down")
+            heapq.heappush(self.waiting, (priority, next(self.sequence), job))
+            self.jobs.add(job)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.dispatch, name="process-pool", daemon=True)
+                self.thread.start()
+            self.condition.notify_all()
+        return job
+    
+    def run(self, function, *args, priority=INTERACTIVE, owner=None, cancel_event=None):
+        job = self.submit(function, *args, priority=priority, owner=owner)
+        return job.result(cancel_event)
+    
+    def cancel(self, job):
+        with self.condition:
+            if job.done.is_set():
+                return
+            job.cancelled = True
+            if not job.started:
+                # Skipped when the dispatcher gets to it
+                self.jobs.discard(job)
+                job.args = ()
+                job.done.set()
+    
+    def cancel_owner(self, owner):
+        with self.condition:
+            jobs = [job for job in self.jobs if job.owner is owner]
+        for job in jobs:
+            self.cancel(job)
+    
+    def dispatch(self):
+        while True:
+            with self.condition:
+                while not self.closed and (self.running >= self.max_workers or not self.waiting):
+                    self.condition.wait()
+                if self.closed:
+                    return
+                _, _, job = heapq.heappop(self.waiting)
+                if job.cancelled:
+                    continue
+                job.started = True
+                self.running += 1
+                if self.executor is None:
+                    self.executor = ProcessPoolExecutor(self.max_workers, mp_context=self.mp_context)
+                executor = self.executor
+            
+            # Copying texts out may take a while, so it happens unlocked
+            shared = []
+            try:
+                args = []
+                for arg in job.args:
+                    if isinstance(arg, (str, TextBuffer)) and len(arg) >= self.SHARED_SIZE:
+                        arg = SharedText.create(arg)
+                        shared.append(arg)
+                    args.append(arg)
+                future = executor.submit(run_pool_job, job.function, args)
+            except Exception as e:
+                self.finish(job, shared, None, e)
+                continue
+            future.add_done_callback(lambda future, job=job, shared=shared: self.job_done(job, shared, future))
+    
+    def job_done(self, job, shared, future):
+        try:
+            self.finish(job, shared, future.result(), None)
+        except BaseException as e:
+            self.finish(job, shared, None, e)
+    
+    def finish(self, job, shared, value, error):
+        for block in shared:
+            block.release()
+        with self.condition:
+            if isinstance(error, BrokenProcessPool) and self.executor is not None:
+                # A worker died; the next job starts a fresh pool
+                self.executor.shutdown(wait=False)
+                self.executor = None
+            self.running -= 1
+            self.jobs.discard(job)
+            job.args = ()
+            if not job.cancelled:
+                job.value, job.error = value, error
+            job.done.set()
+            self.condition.notify_all()
+    
+    def shutdown(self):
+        with self.condition:
+            self.closed = True
+            jobs = list(self.jobs)
+            self.condition.notify_all()
+        for job in jobs:
+            self.cancel(job)
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+class TextSearch:
+    # A find query, either literal text or a Python regular expression
+    def __init__(self, query, regex=False, case_sensitive=False):
+        flags = re.MULTILINE | (0 if case_sensitive else re.IGNORECASE)
+        self.query = query
+        self.regex = regex
+        self.pattern = re.compile(query if regex else re.escape(query), flags)
+        self.literals = self.required_literals(query) if regex else [query]
+    
+    @staticmethod
+    def required_literals(pattern):
+        # Runs of plain characters that every match must contain, used to
+        # rule out files by trigram. Conservative: nothing is taken from
+        # groups, classes or escapes, and alternation or verbose mode
+        # disables it altogether.
+        if '|' in pattern or re.search(r'\(\?[a-zA-Z]*x', pattern):
+            return []
+        literals = []
+        current = []
+        depth = 0
+        i = 0
+        while i < len(pattern):
+            char = pattern[i]
+            i += 1
+            if char == '\\' and i < len(pattern) and not pattern[i].isalnum():
+                char = pattern[i]
+                i += 1
+            elif char == '\\' or char in '.^$[](){}*+?':
+                # The character before an optional quantifier may not be there
+                if char in '?*{' and current:
+                    current.pop()
+                if current:
+                    literals.append(''.join(current))
+                    current = []
+                if char == '\\':
+                    while i < len(pattern) and pattern[i].isalnum():
+                        i += 1
+                elif char == '[':
+                    close = pattern.find(']', i + 1)
+                    i = len(pattern) if close < 0 else close + 1
+                elif char == '{':
+                    close = pattern.find('}', i)
+                    i = len(pattern) if close < 0 else close + 1
+                elif char == '(':
+                    depth += 1
+                elif char == ')':
+                    depth = max(0, depth - 1)
+                continue
+            if depth == 0:
+                current.append(char)
+        if current:
+            literals.append(''.join(current))
+        return literals
+    
+    def matches(self, text, first_line=0):
+        # Yields (line number, column, matched text, line text); columns
+        # count characters from the start of the line
+        line_number = first_line
+        line_start = 0
+        for match in self.pattern.finditer(text):
+            start = match.start()
+            line_number += text.count('\n', line_start, start)
+            line_start = text.rfind('\n', 0, start) + 1
+            line_end = text.find('\n', start)
+            if line_end < 0:
+                line_end = len(text)
+            yield line_number, start - line_start, match.group(), text[line_start:line_end]
+    
+    def find_all(self, text, limit=None):
+        # The first limit results of matches(), as a list that can be
+        # sent back from a worker process
+        return list(itertools.islice(self.matches(str(text)), limit))
+    
+    def expand(self, match, replacement):
+        return match.expand(replacement) if self.regex else replacement
+    
+    def replace_all(self, text, replacement):
+        # Returns (start, end, new text, count) covering the first to the
+        # last match, so the change can be applied as a single edit, or
+        # None when nothing matches. start and end are Qt positions.
+        text = str(text)
+        spans = []
+        
+        def substitute(match):
+            spans.append(match.span())
+            return self.expand(match, replacement)
+        
+        new_text = self.pattern.sub(substitute, text)
+        if not spans:
+            return None
+        first, last = spans[0][0], spans[-1][1]
+        middle = new_text[first:len(new_text) - (len(text) - last)]
+        start = utf16_length(text[:first])
+        return start, start + utf16_length(text[first:last]), middle, len(spans)
+
+class TrigramIndex:
+    # Records which lowercased byte trigrams every file under a directory
+    # contains, so a search only has to read files that can match. Entries
+    # are refreshed from file sizes and mtimes; the index is kept in the
+    # cache directory between sessions.
+    #
+    # Only ASCII trigrams are looked up, which keeps the filter valid for
+    # case-insensitive searches and for files in any ASCII-compatible
+    # encoding; UTF-16 and UTF-32 files are indexed as UTF-8. Files over
+    # MAX_FILE_SIZE aren't indexed and are always searched; binary files
+    # never are.
+    MAX_FILE_SIZE = 16 * 1024 * 1024
+    VERSION = 2
+    
+    def __init__(self, directory, index_path=None):
+        self.directory = os.path.abspath(directory)
+        if index_path is None:
+            cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+            name = hashlib.sha256(self.directory.encode('utf-8')).hexdigest()[:32] + '.json'
+            index_path = os.path.join(cache_home, 'accurate-notepad', 'search', name)
+        self.index_path = index_path
+        self.lock = threading.Lock()
+        self.files = None  # relative path: [mtime, size, trigrams]
+        # trigrams is a sorted array, None if the file is too big to index
+        # and False for binary files
+    
+    @staticmethod
+    def trigrams(data):
+        data = data.lower()
+        found = {data[i:i + 3] for i in range(len(data) - 2)}
+        return array.array('I', sorted(int.from_bytes(trigram, 'big') for trigram in found))
+    
+    def load(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if saved.get('version') != self.VERSION or saved.get('directory') != self.directory:
+            return {}
+        files = {}
+        for name, (mtime, size, trigrams) in saved['files'].items():
+            if isinstance(trigrams, str):
+                trigrams = array.array('I', base64.b64decode(trigrams))
+            files[name] = [mtime, size, trigrams]
+        return files
+    
+    def save(self):
+        files = {name: [mtime, size, base64.b64encode(trigrams.tobytes()).decode('ascii')
+                        if isinstance(trigrams, array.array) else trigrams]
+                 for name, (mtime, size, trigrams) in self.files.items()}
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.VERSION, 'directory': self.directory, 'files': files}, f)
+        os.replace(temp_path, self.index_path)
+    
+    def index_file(self, path, size):
+        if size > self.MAX_FILE_SIZE:
+            return None
+        with open(path, 'rb') as f:
+            data = f.read()
+        encoding, _ = detect_encoding(data[:64 * 1024])
+        if encoding.startswith(('utf-16', 'utf-32')):
+            # Their zero bytes don't make them binary
+            data = data.decode(encoding, 'replace').encode('utf-8')
+        if b'\0' in data[:8192]:
+            return False
+        return self.trigrams(data)
+    
+    def update(self, cancel_event=None):
+        # Reindexes new and changed files and forgets deleted ones; returns
+        # the number of files that had to be read
+        with self.lock:
+            if self.files is None:
+                self.files = self.load()
+            seen = set()
+            changed = 0
+            for path in LLMBatch.directory_files(self.directory):
+                if cancel_event and cancel_event.is_set():
+                    break
+                name = os.path.relpath(path, self.directory)
+                try:
+                    stat = os.stat(path)
+                    entry = self.files.get(name)
+                    if entry is None or entry[:2] != [stat.st_mtime_ns, stat.st_size]:
+                        self.files[name] = [stat.st_mtime_ns, stat.st_size, self.index_file(path, stat.st_size)]
+                        changed += 1
+                except OSError:
+                    continue
+                seen.add(name)
+            else:
+                for name in set(self.files) - seen:
+                    del self.files[name]
+                    changed += 1
+            if changed:
+                self.save()
+            return changed
+    
+    def candidates(self, search):
+        # Paths of the files that may contain a match, in directory order
+        required = set()
+        for literal in search.literals:
+            data = literal.encode('utf-8').lower()
+            for i in range(len(data) - 2):
+                if data[i:i + 3].isascii():
+                    required.add(int.from_bytes(data[i:i + 3], 'big'))
+        
+        def may_match(trigrams):
+            if trigrams is None:
+                return True
+            if trigrams is False:
+                return False
+            for trigram in required:
+                i = bisect.bisect_left(trigrams, trigram)
+                if i == len(trigrams) or trigrams[i] != trigram:
+                    return False
+            return True
+        
+        with self.lock:
+            return [os.path.join(self.directory, name)
+                    for name, (_, _, trigrams) in sorted(self.files.items()) if may_match(trigrams)]
+
+class EmbeddingIndex:
+    # Chunks of text files and saved tabs as vectors, for finding passages
+    # by meaning and handing the best ones to the LLM as context. Vectors
+    # are made locally with NumPy: each chunk's words and word pairs hashed
+    # into DIMENSIONS signed buckets, weighted by 1 + log(count) and
+    # normalized, so nothing leaves the machine. embed= swaps in another
+    # function from a list of texts to a 2D float32 array, e.g. a model's.
+    #
+    # Vectors, chunk texts and chunk positions are appended to raw files
+    # that are memory-mapped for searching, so a search is one
+    # matrix-vector product. Reindexing a file appends its new chunks and
+    # drops the old ones from the index; the files are rewritten without
+    # dropped chunks once those outnumber the rest.
+    DIMENSIONS = 512
+    CHUNK_CHARS = 1000
+    MAX_FILE_SIZE = 16 * 1024 * 1024
+    # Chunks are embedded this many at a time
+    BATCH_SIZE = 1024
+    # Folder updates write index.json at most this often, and at the end
+    SAVE_INTERVAL = 2.0
+    VERSION = 1
+    WORD = re.compile(r'\w+')
+    STOP_WORDS = frozenset(
+        "a an and are as at be but by for from has have if in is it its of on or that the this "
+        "to was were will with".split())
+    FILES = ('vectors.f32', 'spans.i64', 'text.bin')
+    
+    def __init__(self, directory=None, embed=None):
+        if directory is None:
+            cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+            directory = os.path.join(cache_home, 'accurate-notepad', 'embeddings')
+        self.directory = directory
+        self.embed = embed or self.hash_embed
+        self.lock = threading.RLock()
+        self.meta = None  # read on first use
+        self.maps = None  # (vectors, spans, text, live) while nothing is written
+    
+    @classmethod
+    def hash_embed(cls, texts):
+        import numpy as np
+        
+        # Every (chunk, feature) pair is counted in one go across the batch
+        keys = []
+        for row, text in enumerate(texts):
+            words = [word for word in cls.WORD.findall(text.lower()) if word not in cls.STOP_WORDS]
+            hashes = np.fromiter((zlib.crc32(word.encode('utf-8')) for word in words), np.uint64, len(words))
+            pairs = (hashes[:-1] * 0x9E3779B1 + hashes[1:]) & 0xFFFFFFFF
+            keys.append((np.uint64(row) << np.uint64(32)) | np.concatenate((hashes, pairs)))
+        matrix = np.zeros((len(texts), cls.DIMENSIONS), np.float32)
+        if not keys:
+            return matrix
+        keys, counts = np.unique(np.concatenate(keys), return_counts=True)
+        rows = (keys >> np.uint64(32)).astype(np.int64)
+        features = keys & np.uint64(0xFFFFFFFF)
+        buckets = (features % np.uint64(cls.DIMENSIONS)).astype(np.int64)
+        signs = np.where(features & np.uint64(0x80000000), -1.0, 1.0)
+        matrix += np.bincount(rows * cls.DIMENSIONS + buckets, weights=signs * (1 + np.log(counts)),
+                              minlength=matrix.size).reshape(matrix.shape)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms > 0, norms, 1)
+    
+    @classmethod
+    def chunks(cls, text):
+        # (first line, text) for runs of whole lines of about CHUNK_CHARS
+        chunk, size, first = [], 0, 0
+        for number, line in enumerate(text.splitlines(True)):
+            if size and size + len(line) > cls.CHUNK_CHARS:
+                yield first, ''.join(chunk)
+                chunk, size, first = [], 0, number
+            chunk.append(line)
+            size += len(line)
+        if chunk:
+            yield first, ''.join(chunk)
+    
+    def path(self, name):
+        return os.path.join(self.directory, name)
+    
+    def load(self):
+        # Called with self.lock held
+        if self.meta is not None:
+            return
+        try:
+            with open(self.path('index.json'), 'r', encoding='utf-8') as f:
+                self.meta = json.load(f)
+            if self.meta.get('version') != self.VERSION:
+                raise ValueError("old index version")
+            # Data files shorter than recorded means they were lost or replaced
+            for name, size in zip(self.FILES, self.file_sizes()):
+                if size and os.path.getsize(self.path(name)) < size:
+                    raise ValueError(f"{name} is truncated")
+        except (OSError, ValueError, KeyError, TypeError):
+            self.meta = {'version': self.VERSION, 'dimensions': None, 'rows': 0, 'text_bytes': 0,
+                         'folders': [], 'sources': {}}
+    
+    def file_sizes(self):
+        # What the data files should hold, in the order of FILES
+        rows = self.meta['rows']
+        return rows * (self.meta['dimensions'] or 0) * 4, rows * 3 * 8, self.meta['text_bytes']
+    
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self.path('index.json.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            # dumps encodes in C; dump goes piece by piece in Python
+            f.write(json.dumps(self.meta))
+        os.replace(temp_path, self.path('index.json'))
+    
+    def open_maps(self):
+        # Called with self.lock held; returns (vectors, spans, text, live)
+        import numpy as np
+        
+        if self.maps is None:
+            rows = self.meta['rows']
+            if not rows:
+                return None
+            vectors = np.memmap(self.path('vectors.f32'), np.float32, 'r', shape=(rows, self.meta['dimensions']))
+            spans = np.memmap(self.path('spans.i64'), np.int64, 'r', shape=(rows, 3))
+            text = b''
+            if self.meta['text_bytes']:
+                # The map keeps its own copy of the descriptor
+                with open(self.path('text.bin'), 'rb') as f:
+                    text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            live = np.zeros(rows, bool)
+            for _, _, first, last in self.meta['sources'].values():
+                live[first:last] = True
+            self.maps = (vectors, spans, text, live)
+        return self.maps
+    
+    def close_maps(self):
+        if self.maps is not None and isinstance(self.maps[2], mmap.mmap):
+            self.maps[2].close()
+        self.maps = None
+    
+    def append(self, key, chunks, mtime, size):
+        # Called with self.lock held
+        import numpy as np
+        
+        self.close_maps()
+        first = self.meta['rows']
+        if not chunks:
+            self.meta['sources'][key] = [mtime, size, first, first]
+            return
+        texts = [text for _, text in chunks]
+        vectors = np.concatenate([np.asarray(self.embed(texts[i:i + self.BATCH_SIZE]), np.float32)
+                                  for i in range(0, len(texts), self.BATCH_SIZE)])
+        if self.meta['dimensions'] not in (None, vectors.shape[1]):
+            # A different embedding; everything has to be indexed again
+            self.meta.update(dimensions=None, rows=0, text_bytes=0, sources={})
+            first = 0
+        os.makedirs(self.directory, exist_ok=True)
+        
+        encoded = [text.encode('utf-8') for _, text in chunks]
+        ends = self.meta['text_bytes'] + np.cumsum([len(data) for data in encoded], dtype=np.int64)
+        spans = np.empty((len(chunks), 3), np.int64)
+        spans[:, 1] = ends
+        spans[:, 0] = ends - [len(data) for data in encoded]
+        spans[:, 2] = [line for line, _ in chunks]
+        
+        # Anything past the recorded sizes is left over from a crash
+        for name, size_before, data in zip(self.FILES, self.file_sizes(),
+                                           (vectors.tobytes(), spans.tobytes(), encoded)):
+            with open(self.path(name), 'ab') as f:
+                f.truncate(size_before)
+                f.seek(size_before)
+                if isinstance(data, list):
+                    f.writelines(data)
+                else:
+                    f.write(data)
+        
+        self.meta['dimensions'] = vectors.shape[1]
+        self.meta['rows'] += len(chunks)
+        self.meta['text_bytes'] = int(ends[-1])
+        self.meta['sources'][key] = [mtime, size, first, self.meta['rows']]
+    
+    def compact(self):
+        # Rewrites the files with only the chunks still in use
+        import numpy as np
+        
+        vectors, spans, text, live = self.open_maps()
+        order = sorted(self.meta['sources'].items(), key=lambda item: item[1][2])
+        keep = np.concatenate([np.arange(first, last) for _, (_, _, first, last) in order] or
+                              [np.zeros(0, np.int64)])
+        new_spans = spans[keep].copy()
+        lengths = new_spans[:, 1] - new_spans[:, 0]
+        new_spans[:, 1] = np.cumsum(lengths)
+        new_spans[:, 0] = new_spans[:, 1] - lengths
+        chunks = [text[start:end] for start, end, _ in spans[keep]]
+        for name, data in zip(self.FILES, (np.ascontiguousarray(vectors[keep]).tobytes(),
+                                           new_spans.tobytes(), b''.join(chunks))):
+            with open(self.path(name + '.tmp'), 'wb') as f:
+                f.write(data)
+        self.close_maps()
+        for name in self.FILES:
+            os.replace(self.path(name + '.tmp'), self.path(name))
+        
+        row = 0
+        for key, (mtime, size, first, last) in order:
+            self.meta['sources'][key] = [mtime, size, row, row + last - first]
+            row += last - first
+        self.meta['rows'] = row
+        self.meta['text_bytes'] = int(new_spans[-1, 1]) if row else 0
+    
+    def update_text(self, key, text, mtime=None, size=None, save=True):
+        # Replaces the chunks of one source, a file path or any other key
+        with self.lock:
+            self.load()
+            self.meta['sources'].pop(key, None)
+            self.append(key, list(self.chunks(text)), mtime, size)
+            live = sum(last - first for _, _, first, last in self.meta['sources'].values())
+            if self.meta['rows'] - live > max(live, 1000):
+                self.compact()
+            if save:
+                self.save()
+    
+    def update_file(self, path, save=True):
+        # Indexes a file unless it is unchanged since last time. Returns
+        # True if it was read.
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self.lock:
+            self.load()
+            entry = self.meta['sources'].get(path)
+            if entry is not None and entry[:2] == [stat.st_mtime_ns, stat.st_size]:
+                return False
+            text = ''
+            if stat.st_size <= self.MAX_FILE_SIZE:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                encoding, _ = detect_encoding(data[:64 * 1024])
+                # Binary files are recorded but not indexed
+                if encoding.startswith(('utf-16', 'utf-32')) or b'\0' not in data[:8192]:
+                    text = data.decode(encoding, errors='replace')
+            self.update_text(path, text, stat.st_mtime_ns, stat.st_size, save)
+            return True
+    
+    def remove(self, key):
+        with self.lock:
+            self.load()
+            if self.meta['sources'].pop(key, None) is not None:
+                self.close_maps()
+                self.save()
+    
+    def covers(self, path):
+        # Whether path is inside one of the indexed folders
+        with self.lock:
+            self.load()
+            path = os.path.abspath(path)
+            return any(path.startswith(os.path.join(directory, '')) for directory in self.meta['folders'])
+    
+    def add_folder(self, directory):
+        with self.lock:
+            self.load()
+            directory = os.path.abspath(directory)
+            if directory not in self.meta['folders']:
+                self.meta['folders'].append(directory)
+                self.save()
+    
+    def update_folders(self, cancel_event=None, on_progress=None):
+        # Reindexes new and changed files in the indexed folders and drops
+        # deleted ones; returns the number of files read
+        with self.lock:
+            self.load()
+            folders = list(self.meta['folders'])
+        changed = unsaved = 0
+        last_save = time.monotonic()
+        try:
+            for directory in folders:
+                paths = LLMBatch.directory_files(directory)
+                for done, path in enumerate(paths, 1):
+                    if cancel_event and cancel_event.is_set():
+                        return changed
+                    try:
+                        read = self.update_file(path, save=False)
+                    except OSError:
+                        continue
+                    changed += read
+                    unsaved += read
+                    if unsaved and time.monotonic() - last_save > self.SAVE_INTERVAL:
+                        with self.lock:
+                            self.save()
+                        unsaved, last_save = 0, time.monotonic()
+                    if on_progress:
+                        on_progress(done, len(paths))
+                with self.lock:
+                    prefix = os.path.join(directory, '')
+                    for key in [key for key in self.meta['sources'] if key.startswith(prefix)]:
+                        if not os.path.exists(key):
+                            self.remove(key)
+        finally:
+            if unsaved:
+                with self.lock:
+                    self.save()
+        return changed
+    
+    def search(self, query, k=5):
+        # [(key, first line, text, score)] of the k chunks closest to query,
+        # best first
+        import numpy as np
+        
+        with self.lock:
+            self.load()
+            maps = self.open_maps()
+            if maps is None or k < 1:
+                return []
+            vectors, spans, text, live = maps
+            target = np.asarray(self.embed([query]), np.float32)[0]
+            scores = vectors @ target
+            scores[~live] = -np.inf
+            k = min(k, len(scores))
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            
+            owners = {first: key for key, (_, _, first, last) in self.meta['sources'].items()
+                      if last > first}
+            starts = sorted(owners)
+            results = []
+            for row in best:
+                if not scores[row] > 0:
+                    break
+                key = owners[starts[bisect.bisect_right(starts, row) - 1]]
+                start, end, line = spans[row]
+                results.append((key, int(line), bytes(text[start:end]).decode('utf-8'), float(scores[row])))
+            return results
+
+class Settings:
+    # User settings, kept in memory with DEFAULTS filling in anything
+    # missing. Secrets live in their own file only the user can read,
+    # everything else in settings.json. Assigning a value only marks its
+    # file as changed; save() writes changed files, each atomically.
+    DEFAULTS = {
+        'llm_api_key': '',
+        'telegram_token': '',
+        'telegram_chat_id': '',
+        'theme': 'red',
+        'font_size': 12,
+        'profiling': False,
+        'llm_context': False,
+        'memory_budget_mb': 1024,
+        'undo_limit_mb': 64,
+    }
+    SECRETS = ('llm_api_key', 'telegram_token')
+    SETTINGS_FILE = 'settings.json'
+    SECRETS_FILE = 'secrets.json'
+    # Where older versions kept everything, relative to the working directory
+    LEGACY_FILE = 'notepad_settings.json'
+    
+    def __init__(self, directory=None):
+        self.directory = directory or self.default_directory()
+        self.values = dict(self.DEFAULTS)
+        self.changed = set()  # file names waiting to be written
+        self.load()
+    
+    @staticmethod
+    def default_directory():
+        config_home = os.environ.get('XDG_CONFIG_HOME') or os.path.expanduser('~/.config')
+        return os.path.join(config_home, 'accurate-notepad')
+    
+    def file_for(self, key):
+        return self.SECRETS_FILE if key in self.SECRETS else self.SETTINGS_FILE
+    
+    def load(self):
+        found = False
+        for name in (self.SETTINGS_FILE, self.SECRETS_FILE):
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.merge(json.load(f))
+                found = True
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError) as e:
+                print(f"Error loading settings: {str(e)}")
+                continue
+            if name == self.SECRETS_FILE and os.stat(path).st_mode & 0o077:
+                os.chmod(path, 0o600)
+        
+        if not found and os.path.exists(self.LEGACY_FILE):
+            try:
+                with open(self.LEGACY_FILE, 'r', encoding='utf-8') as f:
+                    self.merge(json.load(f))
+            except (OSError, ValueError) as e:
+                print(f"Error loading settings: {str(e)}")
+            self.changed.update((self.SETTINGS_FILE, self.SECRETS_FILE))
+    
+    def merge(self, data):
+        # Unknown keys and values of the wrong type are ignored
+        if not isinstance(data, dict):
+            return
+        for key, value in data.items():
+            if key in self.DEFAULTS and type(value) is type(self.DEFAULTS[key]):
+                self.values[key] = value
+    
+    def __getitem__(self, key):
+        return self.values[key]
+    
+    def __setitem__(self, key, value):
+        # Raises KeyError for unknown settings and ValueError for values
+        # that don't convert to the default's type
+        value = type(self.DEFAULTS[key])(value)
+        if self.values[key] != value:
+            self.values[key] = value
+            self.changed.add(self.file_for(key))
+    
+    def save(self):
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        for name in sorted(self.changed):
+            data = {key: value for key, value in self.values.items() if self.file_for(key) == name}
+            # mkstemp creates the file readable by the user only
+            fd, temp_path = tempfile.mkstemp(prefix=f".{name}.", dir=self.directory)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, indent=4)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, os.path.join(self.directory, name))
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+        self.changed.clear()
+
+class Session:
+    # The tabs open at the last exit: file, encoding, line ending, cursor
+    # position and first visible line of each, and which one was active.
+    # Entries with missing or mistyped fields get defaults when loaded.
+    FILE = 'session.json'
+    NEWLINES = ('\n', '\r\n', '\r')
+    
+    def __init__(self, directory=None):
+        self.directory = directory or self.default_directory()
+        self.tabs = []  # {'path', 'encoding', 'newline', 'cursor', 'scroll'}
+        self.active = 0
+    
+    @staticmethod
+    def default_directory():
+        state_home = os.environ.get('XDG_STATE_HOME') or os.path.expanduser('~/.local/state')
+        return os.path.join(state_home, 'accurate-notepad')
+    
+    @classmethod
+    def tab(cls, path, encoding=None, newline=None, cursor=0, scroll=0):
+        return {
+            'path': path,
+            'encoding': encoding if isinstance(encoding, str) else None,
+            'newline': newline if newline in cls.NEWLINES else None,
+            'cursor': cursor if type(cursor) is int and cursor >= 0 else 0,
+            'scroll': scroll if type(scroll) is int and scroll >= 0 else 0,
+        }
+    
+    def load(self):
+        # Returns False if there is no session to restore
+        try:
+            with open(os.path.join(self.directory, self.FILE), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            print(f"Error loading session: {str(e)}")
+            return False
+        if not isinstance(data, dict) or not isinstance(data.get('tabs'), list):
+            return False
+        
+        self.tabs, self.active = [], 0
+        for i, entry in enumerate(data['tabs']):
+            if not isinstance(entry, dict) or not isinstance(entry.get('path'), str):
+                continue
+            if i == data.get('active'):
+                self.active = len(self.tabs)
+            self.tabs.append(self.tab(entry['path'], entry.get('encoding'), entry.get('newline'),
+                                      entry.get('cursor'), entry.get('scroll')))
+        return bool(self.tabs)
+    
+    def save(self):
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        path = os.path.join(self.directory, self.FILE)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'active': self.active, 'tabs': self.tabs}, f)
+        os.replace(temp_path, path)
+
+class LLMCache:
+    # On-disk LRU of LLM responses keyed by (model, prompt, max_tokens).
+    # File mtimes record recency, so the order survives restarts.
+    def __init__(self, directory=None, max_bytes=50 * 1024 * 1024):
+        if directory is None:
+            cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+            directory = os.path.join(cache_home, 'accurate-notepad', 'llm')
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = None  # file name: size, least recently used first
+        self.total_bytes = 0
+    
+    def entry_path(self, model, prompt, max_tokens):
+        key = json.dumps([model, prompt, max_tokens])
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.json')
+    
+    def load_entries(self):
+        if self.entries is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        self.entries = OrderedDict((name, size) for _, name, size in sorted(files))
+        self.total_bytes = sum(self.entries.values())
+    
+    def get(self, model, prompt, max_tokens):
+        path = self.entry_path(model, prompt, max_tokens)
+        name = os.path.basename(path)
+        with self.lock:
+            try:
+                self.load_entries()
+                if name not in self.entries:
+                    return None
+                with open(path, 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+                os.utime(path)
+            except (OSError, ValueError):
+                return None
+            if entry.get('key') != [model, prompt, max_tokens]:
+                return None
+            self.entries.move_to_end(name)
+            return entry['response']
+    
+    def put(self, model, prompt, max_tokens, response):
+        path = self.entry_path(model, prompt, max_tokens)
+        name = os.path.basename(path)
+        data = json.dumps({'key': [model, prompt, max_tokens], 'response': response}).encode('utf-8')
+        with self.lock:
+            try:
+                self.load_entries()
+                temp_path = path + '.tmp'
+                with open(temp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+            except OSError:
+                return
+            
+            self.total_bytes += len(data) - self.entries.pop(name, 0)
+            self.entries[name] = len(data)
+            
+            # Evict least recently used entries until back under budget
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                old_name, size = self.entries.popitem(last=False)
+                self.total_bytes -= size
+                try:
+                    os.remove(os.path.join(self.directory, old_name))
+                except OSError:
+                    pass
+
+class LLMIntegration:
+    # Chunks of notes put in front of a prompt asked with context=True
+    CONTEXT_CHUNKS = 4
+    
+    def __init__(self, api_key=None, cache=None, index=None):
+        self.api_key = api_key
+        self.model = "gpt-4"
+        # Overrides the OpenAI endpoint, e.g. for a local server
+        self.api_base = None
+        self.cache = cache if cache is not None else LLMCache()
+        self.index = index  # EmbeddingIndex that context comes from
+    
+    def set_api_key(self, api_key):
+        self.api_key = api_key
+    
+    def request_options(self):
+        if self.api_base:
+            return {'api_base': self.api_base}
+        return {}
+    
+    def add_context(self, prompt):
+        # Puts the indexed chunks closest to the prompt in front of it
+        if self.index is None:
+            return prompt
+        results = self.index.search(prompt, self.CONTEXT_CHUNKS)
+        if not results:
+            return prompt
+        parts = ["Excerpts from my notes that may help:"]
+        for key, line, text, _ in results:
+            parts.append(f"--- {key}, line {line + 1}\n{text.strip()}")
+        parts.append(f"---\n\n{prompt}")
+        return '\n\n'.join(parts)
+    
+    @profiler.timed('llm.complete')
+    def complete(self, prompt, max_tokens=150, context=False):
+        # Like query, but raises instead of returning an error message
+        if not self.api_key:
+            raise ValueError("No API key configured")
+        if context:
+            prompt = self.add_context(prompt)
+        
+        cached = self.cache.get(self.model, prompt, max_tokens)
+        if cached is not None:
+            return cached
+        
+        import openai
+        
+        openai.api_key = self.api_key
+        response = openai.ChatCompletion.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            **self.request_options()
+        )
+        content = response.choices[0].message.content
+        
+        self.cache.put(self.model, prompt, max_tokens, content)
+        return content
+    
+    def query(self, prompt, max_tokens=150, context=False):
+        try:
+            return self.complete(prompt, max_tokens, context)
+        except Exception as e:
+            return f"Error: {str(e)}"
+    
+    @profiler.timed('llm.stream_query')
+    def stream_query(self, prompt, max_tokens=150, context=False):
+        # Yields the response piece by piece as tokens arrive
+        if not self.api_key:
+            yield "Error: No API key configured"
+            return
+        if context:
+            try:
+                prompt = self.add_context(prompt)
+            except Exception as e:
+                yield f"Error: {str(e)}"
+                return
+        
+        cached = self.cache.get(self.model, prompt, max_tokens)
+        if cached is not None:
+            yield cached
+            return
+        
+        parts = []
+        try:
+            import openai
+            
+            openai.api_key = self.api_key
+            response = openai.ChatCompletion.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens,
+                stream=True,
+                **self.request_options()
+            )
+            for chunk in response:
+                content = chunk.choices[0].delta.get('content')
+                if content:
+                    parts.append(content)
+                    yield content
+        except Exception as e:
+            yield f"Error: {str(e)}"
+            return
+        
+        self.cache.put(self.model, prompt, max_tokens, ''.join(parts))
+
+class LLMBatch:
+    # Runs one prompt template over many inputs with a bounded number of
+    # requests in flight. "{text}" in the template marks where each input
+    # goes; without it the input is appended after the template.
+    def __init__(self, llm, template, max_workers=4, max_tokens=150, max_retries=5, backoff=1.0,
+                 context=False):
+        self.llm = llm
+        self.template = template
+        self.max_workers = max_workers
+        self.max_tokens = max_tokens
+        self.context = context  # put matching notes in front of each prompt
+        self.max_retries = max_retries
+        self.backoff = backoff
+    
+    def render(self, text):
+        if '{text}' in self.template:
+            return self.template.replace('{text}', text)
+        return f"{self.template}\n\n{text}"
+    
+    @staticmethod
+    def paragraphs(text):
+        chunks = [chunk.strip() for chunk in re.split(r'\n\s*\n', text)]
+        return [(f"Paragraph {i}", chunk) for i, chunk in enumerate(filter(None, chunks), 1)]
+    
+    @staticmethod
+    def directory_files(directory):
+        paths = []
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+            paths.extend(os.path.join(root, name) for name in sorted(files) if not name.startswith('.'))
+        return paths
+    
+    @staticmethod
+    def read_files(directory, paths):
+        # Files are only read once the scheduler gets to them
+        for path in paths:
+            encoding, _ = sniff_encoding(path)
+            with open(path, 'r', encoding=encoding, errors='replace') as f:
+                yield os.path.relpath(path, directory), f.read()
+    
+    def retry_errors(self):
+        import openai
+        
+        return (openai.error.RateLimitError, openai.error.ServiceUnavailableError)
+    
+    def query_with_retry(self, prompt, cancel_event):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.llm.complete(prompt, self.max_tokens, self.context)
+            except self.retry_errors():
+                if attempt == self.max_retries:
+                    raise
+                # Exponential backoff with jitter so workers don't retry in step
+                delay = self.backoff * 2 ** attempt * (0.5 + random.random())
+                if cancel_event.wait(delay):
+                    raise
+    
+    def run(self, items, on_result, cancel_event=None):
+        # Calls on_result(name, response) from a worker thread as each item
+        # finishes; identical prompts are sent once and shared
+        if cancel_event is None:
+            cancel_event = threading.Event()
+        requests_by_prompt = {}
+        slots = threading.BoundedSemaphore(self.max_workers * 2)
+        
+        def deliver(future, name):
+            if cancel_event.is_set():
+                return
+            try:
+                response = future.result()
+            except Exception as e:
+                response = f"Error: {str(e)}"
+            on_result(name, response)
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for name, text in items:
+                if cancel_event.is_set():
+                    break
+                prompt = self.render(text)
+                future = requests_by_prompt.get(prompt)
+                if future is None:
+                    slots.acquire()
+                    future = executor.submit(self.query_with_retry, prompt, cancel_event)
+                    future.add_done_callback(lambda future: slots.release())
+                    requests_by_prompt[prompt] = future
+                future.add_done_callback(lambda future, name=name: deliver(future, name))
+
+class TelegramIntegration:
+    MAX_MESSAGE_LENGTH = 4096
+    # Bot API limits: about one message per second per chat, 30 overall
+    CHAT_INTERVAL = 1.0
+    GLOBAL_INTERVAL = 1 / 30
+    MAX_RETRIES = 3
+    
+    def __init__(self, token=None, chat_id=None):
+        self.token = token
+        self.chat_id = chat_id
+        self.api_url = "https://api.telegram.org"
+        self.session = None
+        self.lock = threading.Lock()
+        self.last_sent = {}  # chat id: monotonic time of its last message
+        self.last_sent_any = 0.0
+    
+    def get_session(self):
+        # One pooled keep-alive connection, reused for every message
+        if self.session is None:
+            import requests
+            import requests.adapters
+            
+            self.session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=4)
+            self.session.mount('https://', adapter)
+            self.session.mount('http://', adapter)
+        return self.session
+    
+    @classmethod
+    def split_message(cls, text):
+        # Telegram counts the limit in UTF-16 code units; prefer to break
+        # at a newline in the second half of a chunk
+        limit = cls.MAX_MESSAGE_LENGTH
+        chunks = []
+        while text:
+            chunk = text[:limit]
+            excess = utf16_length(chunk) - limit
+            while excess > 0:
+                chunk = chunk[:len(chunk) - (excess + 1) // 2]
+                excess = utf16_length(chunk) - limit
+            if len(chunk) < len(text):
+                newline = chunk.rfind('\n')
+                if newline >= len(chunk) // 2:
+                    chunk = chunk[:newline + 1]
+            chunks.append(chunk)
+            text = text[len(chunk):]
+        return chunks
+    
+    def wait_turn(self, chat_id):
+        with self.lock:
+            now = time.monotonic()
+            turn = max(now,
+                       self.last_sent.get(chat_id, 0.0) + self.CHAT_INTERVAL,
+                       self.last_sent_any + self.GLOBAL_INTERVAL)
+            self.last_sent[chat_id] = self.last_sent_any = turn
+        if turn > now:
+            time.sleep(turn - now)
+    
+    @profiler.timed('telegram.send_chunk')
+    def send_chunk(self, text, chat_id=None):
+        # Returns True once Telegram has accepted the text
+        import requests
+        
+        chat_id = chat_id or self.chat_id
+        url = f"{self.api_url}/bot{self.token}/sendMessage"
+        for attempt in range(self.MAX_RETRIES + 1):
+            self.wait_turn(chat_id)
+            try:
+                response = self.get_session().post(url, data={'chat_id': chat_id, 'text': text}, timeout=30)
+            except requests.RequestException:
+                time.sleep(2 ** attempt)
+                continue
+            
+            if response.status_code == 200:
+                return True
+            if response.status_code == 429:
+                try:
+                    delay = response.json()['parameters']['retry_after']
+                except (ValueError, KeyError, TypeError):
+                    delay = 2 ** attempt
+                time.sleep(delay)
+            elif response.status_code >= 500:
+                time.sleep(2 ** attempt)
+            else:
+                # Bad token, unknown chat and the like won't get better
+                return False
+        return False
+    
+    @profiler.timed('telegram.send_message')
+    def send_message(self, text):
+        if not self.token or not self.chat_id:
+            return False
+        
+        return all(self.send_chunk(chunk) for chunk in self.split_message(text))
+
+class TelegramQueue:
+    # Sends messages from a background thread. Each message stays in a
+    # journal file until Telegram has accepted all of its chunks, so failed
+    # or interrupted sends can be retried later, even after a restart.
+    def __init__(self, telegram, journal_path=None, on_done=None):
+        if journal_path is None:
+            state_home = os.environ.get('XDG_STATE_HOME') or os.path.expanduser('~/.local/state')
+            journal_path = os.path.join(state_home, 'accurate-notepad', 'telegram-journal.json')
+        self.telegram = telegram
+        self.journal_path = journal_path
+        self.on_done = on_done
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.pending = self.load_journal()  # job id: {'chat_id', 'chunks'}
+        self.queued = set()
+        self.thread = None
+    
+    def load_journal(self):
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def save_journal(self):
+        # Called with self.lock held
+        os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+        temp_path = self.journal_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.pending, f)
+        os.replace(temp_path, self.journal_path)
+    
+    def send(self, text):
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            self.pending[job_id] = {
+                'chat_id': self.telegram.chat_id,
+                'chunks': self.telegram.split_message(text),
+            }
+            self.save_journal()
+        self.enqueue(job_id)
+        return job_id
+    
+    def retry_journal(self):
+        with self.lock:
+            job_ids = [job_id for job_id in self.pending if job_id not in self.queued]
+        for job_id in job_ids:
+            self.enqueue(job_id)
+        return len(job_ids)
+    
+    def enqueue(self, job_id):
+        with self.lock:
+            self.queued.add(job_id)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.worker, name="telegram-queue", daemon=True)
+                self.thread.start()
+        self.jobs.put(job_id)
+    
+    def worker(self):
+        while True:
+            job_id = self.jobs.get()
+            with self.lock:
+                job = self.pending.get(job_id)
+            success = job is not None
+            while success and job['chunks']:
+                success = self.telegram.send_chunk(job['chunks'][0], job['chat_id'])
+                if success:
+                    with self.lock:
+                        job['chunks'].pop(0)
+                        self.save_journal()
+            
+            with self.lock:
+                self.queued.discard(job_id)
+                if success:
+                    self.pending.pop(job_id, None)
+                    self.save_journal()
+            if self.on_done and job is not None:
+                self.on_done(success, job_id)
+
+class InvoiceGenerator:
+    @profiler.timed('invoice.generate')
+    def generate_invoice(self, client_name, items, total_amount):
+        header = f"""
+        INVOICE
+        Date: {datetime.now().strftime('%Y-%m-%d')}
+        Client: {client_name}
+        
+        ITEMS:
+        """
+        
+        # Collect the parts and join once instead of growing a string
+        parts = [header]
+        parts.extend(
+            f"{item['name']} - {item['quantity']} x ${item['price']:.2f} = ${item['quantity'] * item['price']:.2f}\n"
+            for item in items
+        )
+        parts.append(f"\nTOTAL AMOUNT: ${total_amount:.2f}")
+        return ''.join(parts)
+
+def write_invoice_batch(output_dir, first_number, invoices):
+    # Runs in a worker process: renders a batch of (client, items) pairs
+    # and writes one file per invoice
+    generator = InvoiceGenerator()
+    for number, (client_name, items) in enumerate(invoices, first_number):
+        total = sum(item['quantity'] * item['price'] for item in items)
+        invoice = generator.generate_invoice(client_name, items, total)
+        safe_name = re.sub(r'[^\w.-]+', '_', client_name)[:100]
+        with open(os.path.join(output_dir, f"{number:07d}_{safe_name}.txt"), 'w') as f:
+            f.write(invoice)
+    return len(invoices)
+
+class BulkInvoiceEngine:
+    # Streams line items from CSV or JSON and writes invoices straight to
+    # disk from a process pool.
+    #
+    # CSV files need a client,name,quantity,price header. JSON Lines files
+    # (.jsonl) hold one object per line, either a line item with those keys
+    # or a whole invoice {"client": ..., "items": [...]}; .json files hold
+    # a list of the same objects. Line items for a client must be adjacent.
+    BATCH_SIZE = 500
+    
+    def __init__(self, output_dir, max_workers=None, batch_size=BATCH_SIZE, mp_context=None, ledger=None):
+        self.output_dir = output_dir
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.mp_context = mp_context
+        self.ledger = ledger  # InvoiceLedger that written invoices are recorded in
+    
+    @staticmethod
+    def read_records(source, path):
+        if path.lower().endswith('.csv'):
+            yield from csv.DictReader(source)
+        elif path.lower().endswith('.json'):
+            yield from json.load(source)
+        else:
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+    
+    @staticmethod
+    def group_invoices(records):
+        client_name, items = None, []
+        for record in records:
+            if 'items' in record:
+                if items:
+                    yield client_name, items
+                    client_name, items = None, []
+                invoice_items = [BulkInvoiceEngine.parse_item(item) for item in record['items']]
+                yield record['client'], invoice_items
+                continue
+            
+            if record['client'] != client_name and items:
+                yield client_name, items
+                items = []
+            client_name = record['client']
+            items.append(BulkInvoiceEngine.parse_item(record))
+        if items:
+            yield client_name, items
+    
+    @staticmethod
+    def parse_item(record):
+        return {
+            'name': str(record['name']).strip(),
+            'quantity': int(record['quantity']),
+            'price': float(record['price'])
+        }
+    
+    @profiler.timed('invoice.bulk_run')
+    def run(self, path, on_progress=None, cancel_event=None):
+        # Returns the number of invoices written
+        os.makedirs(self.output_dir, exist_ok=True)
+        total_bytes = os.path.getsize(path)
+        max_in_flight = self.max_workers * 2
+        written = 0
+        number = 1
+        in_flight = {}  # future: its batch
+        
+        def finish(futures):
+            # Only batches that were written go into the ledger; a failed
+            # one is raised once the others are recorded
+            count, error = 0, None
+            for future in futures:
+                batch = in_flight.pop(future)
+                try:
+                    count += future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                if self.ledger:
+                    self.ledger.record(batch)
+            if error:
+                raise error
+            return count
+        
+        with open(path, 'r', newline='', encoding='utf-8') as source, \
+                ProcessPoolExecutor(self.max_workers, mp_context=self.mp_context) as executor:
+            invoices = self.group_invoices(self.read_records(source, path))
+            try:
+                while not (cancel_event and cancel_event.is_set()):
+                    batch = list(itertools.islice(invoices, self.batch_size))
+                    if not batch:
+                        break
+                    
+                    # Only a few batches are held in memory at any time
+                    if len(in_flight) >= max_in_flight:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        written += finish(done)
+                    
+                    in_flight[executor.submit(write_invoice_batch, self.output_dir, number, batch)] = batch
+                    number += len(batch)
+                    if on_progress:
+                        on_progress(source.buffer.tell(), total_bytes)
+            finally:
+                # Batches already submitted get written either way
+                written += finish(list(in_flight))
+        return written
+
+class InvoiceLedger:
+    # Every generated invoice, kept in SQLite with its line items. Amounts
+    # are whole cents; client and item names are stored once and referred
+    # to by id. Rows are only ever appended.
+    #
+    # Reports don't run GROUP BY in SQLite, which visits rows one at a
+    # time: the integer columns are copied into NumPy arrays, fetching only
+    # rows added since the last report, and totals come from bincount over
+    # masks for the date range and client.
+    FILE = 'ledger.sqlite3'
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS clients (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+        CREATE TABLE IF NOT EXISTS products (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+        CREATE TABLE IF NOT EXISTS invoices (
+            id INTEGER PRIMARY KEY,
+            client INTEGER NOT NULL REFERENCES clients (id),
+            date TEXT NOT NULL,
+            total INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS invoices_client ON invoices (client, date);
+        CREATE INDEX IF NOT EXISTS invoices_date ON invoices (date);
+        CREATE TABLE IF NOT EXISTS items (
+            invoice INTEGER NOT NULL REFERENCES invoices (id),
+            product INTEGER NOT NULL REFERENCES products (id),
+            quantity INTEGER NOT NULL,
+            price INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS items_invoice ON items (invoice);
+    """
+    
+    def __init__(self, path=None):
+        self.path = path or os.path.join(self.default_directory(), self.FILE)
+        self.lock = threading.RLock()
+        self.connection = None
+        # Copies of the tables, one array per column, extended as rows are
+        # added. Invoices: id, client id, days and months since 1970, total;
+        # items: rowid, index of its invoice, product id, quantity, amount.
+        self.invoices = None
+        self.items = None
+    
+    @staticmethod
+    def default_directory():
+        data_home = os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share')
+        return os.path.join(data_home, 'accurate-notepad')
+    
+    def connect(self):
+        # Called with self.lock held. Transactions are begun explicitly.
+        if self.connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            # Commits don't wait for the disk; a crash loses at most the last few
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(self.SCHEMA)
+            self.connection = connection
+        return self.connection
+    
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+    
+    @staticmethod
+    def cents(amount):
+        return round(amount * 100)
+    
+    @staticmethod
+    def name_ids(connection, table, names):
+        # Called inside a transaction; adds names that are new
+        names = list(set(names))
+        connection.executemany(f'INSERT OR IGNORE INTO {table} (name) VALUES (?)', [(name,) for name in names])
+        ids = {}
+        for i in range(0, len(names), 500):
+            part = names[i:i + 500]
+            ids.update(connection.execute(f'SELECT name, id FROM {table} WHERE name IN ({",".join("?" * len(part))})',
+                                          part))
+        return ids
+    
+    @profiler.timed('invoice.record')
+    def record(self, invoices, date=None):
+        # invoices are (client name, items) pairs as InvoiceGenerator takes
+        # them; date is 'YYYY-MM-DD', today by default
+        invoices = [(str(client), items) for client, items in invoices]
+        if not invoices:
+            return
+        date = date or datetime.now().strftime('%Y-%m-%d')
+        with self.lock:
+            connection = self.connect()
+            # IMMEDIATE: the ids below stay ours until the commit
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                clients = self.name_ids(connection, 'clients', (client for client, _ in invoices))
+                products = self.name_ids(connection, 'products',
+                                         (item['name'] for _, items in invoices for item in items))
+                next_id = connection.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM invoices').fetchone()[0]
+                invoice_rows, item_rows = [], []
+                for invoice_id, (client, items) in enumerate(invoices, next_id):
+                    total = 0
+                    for item in items:
+                        price = self.cents(item['price'])
+                        total += item['quantity'] * price
+                        item_rows.append((invoice_id, products[item['name']], item['quantity'], price))
+                    invoice_rows.append((invoice_id, clients[client], date, total))
+                connection.executemany('INSERT INTO invoices VALUES (?, ?, ?, ?)', invoice_rows)
+                connection.executemany('INSERT INTO items VALUES (?, ?, ?, ?)', item_rows)
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+    
+    def load_columns(self):
+        # Called with self.lock held
+        import numpy as np
+        
+        connection = self.connect()
+        if self.invoices is None:
+            self.invoices = np.zeros((5, 0), np.int64)
+            self.items = np.zeros((5, 0), np.int64)
+        last_invoice = int(self.invoices[0, -1]) if self.invoices.shape[1] else 0
+        rows = connection.execute(
+            "SELECT id, client, CAST(julianday(date) - julianday('1970-01-01') AS INTEGER), total "
+            "FROM invoices WHERE id > ? ORDER BY id", (last_invoice,)).fetchall()
+        if rows:
+            ids, clients, days, totals = np.array(rows, np.int64).T
+            months = days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+            self.invoices = np.concatenate((self.invoices, [ids, clients, days, months, totals]), axis=1)
+            last_invoice = int(ids[-1])
+        
+        # Items of invoices added since the query above wait for next time
+        last_item = int(self.items[0, -1]) if self.items.shape[1] else 0
+        rows = connection.execute('SELECT rowid, invoice, product, quantity, price FROM items '
+                                  'WHERE rowid > ? AND invoice <= ? ORDER BY rowid',
+                                  (last_item, last_invoice)).fetchall()
+        if rows:
+            new = np.array(rows, np.int64).T
+            # Invoice ids are sorted, so each item's invoice is found by bisection
+            new[1] = np.searchsorted(self.invoices[0], new[1])
+            new[4] *= new[3]
+            self.items = np.concatenate((self.items, new), axis=1)
+    
+    def names(self, table, ids):
+        # Called with self.lock held
+        ids = [int(i) for i in ids]
+        found = {}
+        for i in range(0, len(ids), 500):
+            part = ids[i:i + 500]
+            found.update(self.connection.execute(
+                f'SELECT id, name FROM {table} WHERE id IN ({",".join("?" * len(part))})', part))
+        return [found[i] for i in ids]
+    
+    @staticmethod
+    def top(totals, counts, limit):
+        # Indexes of the largest nonzero totals, largest first
+        import numpy as np
+        
+        used = np.flatnonzero(counts)
+        order = used[np.argsort(-totals[used], kind='stable')]
+        return order[:limit] if limit else order
+    
+    @profiler.timed('invoice.report')
+    def report(self, start=None, end=None, client=None, limit=20):
+        # Totals over invoices dated start to end inclusive ('YYYY-MM-DD',
+        # either may be None), optionally for one client. Amounts are in
+        # cents. Returns {'invoices', 'revenue', 'clients': [(name,
+        # invoices, total)], 'months': [('YYYY-MM', invoices, total)],
+        # 'items': [(name, quantity, total)]}.
+        import numpy as np
+        
+        with self.lock:
+            self.load_columns()
+            _, clients, days, months, totals = self.invoices
+            mask = np.ones(len(clients), bool)
+            if start:
+                mask &= days >= np.datetime64(start, 'D').astype(np.int64)
+            if end:
+                mask &= days <= np.datetime64(end, 'D').astype(np.int64)
+            if client is not None:
+                row = self.connect().execute('SELECT id FROM clients WHERE name = ?', (client,)).fetchone()
+                mask &= clients == (row[0] if row else -1)
+            
+            result = {'invoices': int(mask.sum()), 'revenue': int(totals[mask].sum()),
+                      'clients': [], 'months': [], 'items': []}
+            if not result['invoices']:
+                return result
+            
+            # Totals are summed as float64, exact to 2**53 cents
+            selected = clients[mask]
+            counts = np.bincount(selected)
+            sums = np.bincount(selected, weights=totals[mask])
+            best = self.top(sums, counts, limit)
+            result['clients'] = list(zip(self.names('clients', best), counts[best].tolist(),
+                                         sums[best].astype(np.int64).tolist()))
+            
+            months = months[mask]
+            first = months.min()
+            counts = np.bincount(months - first)
+            sums = np.bincount(months - first, weights=totals[mask])
+            for month in np.flatnonzero(counts):
+                label = str(np.datetime64(int(first + month), 'M'))
+                result['months'].append((label, int(counts[month]), int(sums[month])))
+            
+            _, item_invoices, products, quantities, amounts = self.items
+            item_mask = mask[item_invoices]
+            selected = products[item_mask]
+            quantity = np.bincount(selected, weights=quantities[item_mask])
+            sums = np.bincount(selected, weights=amounts[item_mask])
+            best = self.top(sums, np.bincount(selected), limit)
+            result['items'] = list(zip(self.names('products', best), quantity[best].astype(np.int64).tolist(),
+                                       sums[best].astype(np.int64).tolist()))
+            return result
+    
+    @staticmethod
+    def money(cents):
+        return f"${cents / 100:,.2f}"
+    
+    @classmethod
+    def format_report(cls, report):
+        money = cls.money
+        lines = [f"{report['invoices']} invoices, {money(report['revenue'])}", "", "TOP CLIENTS"]
+        lines.extend(f"{money(total):>16}  {count:>7} invoices  {name}" for name, count, total in report['clients'])
+        lines += ["", "MONTHLY REVENUE"]
+        lines.extend(f"{money(total):>16}  {count:>7} invoices  {month}" for month, count, total in report['months'])
+        lines += ["", "TOP ITEMS"]
+        lines.extend(f"{money(total):>16}  {quantity:>7} sold      {name}" for name, quantity, total in report['items'])
+        return '\n'.join(lines) + '\n'
+
+@profiler.timed('file.convert')
+def convert_file(source_path, target_path, from_encoding=None, to_encoding='utf-8',
+                 newline=None, chunk_size=1024 * 1024):
+    # Streams source_path into target_path in another encoding and/or with
+    # other line endings ('\n', '\r\n' or None to keep them), replacing the
+    # target atomically. Returns the number of characters written.
+    if from_encoding is None:
+        from_encoding, _ = sniff_encoding(source_path)
+    directory, name = os.path.split(os.path.abspath(target_path))
+    fd, temp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+    written = 0
+    try:
+        with open(source_path, 'r', encoding=from_encoding, newline=None if newline else '') as source, \
+                os.fdopen(fd, 'w', encoding=to_encoding, newline=newline or '') as target:
+            for chunk in iter(lambda: source.read(chunk_size), ''):
+                written += target.write(chunk)
+        os.replace(temp_path, target_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return written
+
+def read_input(path):
+    if path == '-':
+        return sys.stdin.read()
+    encoding, _ = sniff_encoding(path)
+    with open(path, 'r', encoding=encoding) as f:
+        return f.read()
+
+def run_invoices(args):
+    engine = BulkInvoiceEngine(args.output_dir, max_workers=args.workers, batch_size=args.batch_size,
+                               ledger=InvoiceLedger() if args.record else None)
+    count = engine.run(args.input)
+    print(f"Wrote {count} invoices to {args.output_dir}")
+
+def run_ledger(args):
+    ledger = InvoiceLedger()
+    try:
+        report = ledger.report(args.start, args.end, args.client, args.top)
+    except ValueError as e:
+        sys.exit(f"Error: {str(e)}")
+    print(ledger.format_report(report), end='')
+
+def run_llm_batch(args):
+    llm = LLMIntegration(args.api_key or os.environ.get('OPENAI_API_KEY') or Settings()['llm_api_key'])
+    llm.model = args.model
+    llm.api_base = args.api_base
+    if args.context:
+        llm.index = EmbeddingIndex()
+    if not llm.api_key:
+        sys.exit("Error: No API key configured (use --api-key, OPENAI_API_KEY or Settings > Configure LLM)")
+    
+    if args.dir:
+        items = LLMBatch.read_files(args.dir, LLMBatch.directory_files(args.dir))
+    elif args.paragraphs:
+        items = LLMBatch.paragraphs(read_input(args.paragraphs))
+    else:
+        items = [(name, read_input(name)) for name in args.file]
+    
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    lock = threading.Lock()
+    
+    def on_result(name, response):
+        if args.output_dir:
+            safe_name = re.sub(r'[^\w.-]+', '_', name)
+            with open(os.path.join(args.output_dir, safe_name + '.txt'), 'w') as f:
+                f.write(response)
+        else:
+            with lock:
+                print(f"=== {name}\n{response}\n", flush=True)
+    
+    batch = LLMBatch(llm, args.template, max_workers=args.workers, max_tokens=args.max_tokens,
+                     context=args.context)
+    batch.run(items, on_result)
+
+def run_index(args):
+    index = EmbeddingIndex()
+    for directory in args.folders:
+        index.add_folder(directory)
+    changed = index.update_folders()
+    print(f"Indexed {changed} changed files in {len(index.meta['folders'])} folders")
+    if args.query:
+        for key, line, text, score in index.search(args.query, args.top):
+            print(f"=== {key}:{line + 1} ({score:.2f})\n{text.strip()}\n")
+
+def run_telegram(args):
+    settings = Settings()
+    telegram = TelegramIntegration(args.token or os.environ.get('TELEGRAM_BOT_TOKEN') or settings['telegram_token'],
+                                   args.chat_id or os.environ.get('TELEGRAM_CHAT_ID') or settings['telegram_chat_id'])
+    if not telegram.token or not telegram.chat_id:
+        sys.exit("Error: Telegram token and chat ID are required "
+                 "(use --token/--chat-id, TELEGRAM_BOT_TOKEN/TELEGRAM_CHAT_ID or Settings > Configure Telegram)")
+    if not telegram.send_message(read_input(args.input)):
+        sys.exit("Error: Failed to send message to Telegram")
+    print("Message sent to Telegram")
+
+def run_convert(args):
+    newline = {'keep': None, 'lf': '\n', 'crlf': '\r\n'}[args.newline]
+    written = convert_file(args.source, args.target, args.from_encoding, args.to_encoding, newline)
+    print(f"Wrote {written} characters to {args.target}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='notepad_core.py',
+                                     description="Headless Accurate Notepad tools")
+    parser.add_argument('--profile', metavar='TRACE',
+                        help="write a Chrome trace of the run's timings to this file")
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    invoices = commands.add_parser('invoices', help="generate invoices from CSV/JSON line items")
+    invoices.add_argument('input', help="CSV (client,name,quantity,price), JSON or JSON Lines file")
+    invoices.add_argument('output_dir')
+    invoices.add_argument('--workers', type=int, default=None)
+    invoices.add_argument('--batch-size', type=int, default=BulkInvoiceEngine.BATCH_SIZE)
+    invoices.add_argument('--record', action='store_true', help="also add the invoices to the ledger")
+    invoices.set_defaults(run=run_invoices)
+    
+    ledger = commands.add_parser('ledger', help="report totals from the invoice ledger")
+    ledger.add_argument('--from', dest='start', help="first date, YYYY-MM-DD")
+    ledger.add_argument('--to', dest='end', help="last date, YYYY-MM-DD")
+    ledger.add_argument('--client')
+    ledger.add_argument('--top', type=int, default=20, help="clients and items to list")
+    ledger.set_defaults(run=run_ledger)
+    
+    llm_batch = commands.add_parser('llm-batch', help="apply one prompt template to many inputs")
+    llm_batch.add_argument('--template', required=True, help="prompt; {text} marks where each input goes")
+    inputs = llm_batch.add_mutually_exclusive_group(required=True)
+    inputs.add_argument('--file', nargs='+', help="one request per file ('-' for stdin)")
+    inputs.add_argument('--paragraphs', metavar='FILE', help="one request per paragraph")
+    inputs.add_argument('--dir', help="one request per file under this folder")
+    llm_batch.add_argument('--output-dir', help="write one file per result instead of printing")
+    llm_batch.add_argument('--workers', type=int, default=4)
+    llm_batch.add_argument('--max-tokens', type=int, default=150)
+    llm_batch.add_argument('--model', default="gpt-4")
+    llm_batch.add_argument('--api-key')
+    llm_batch.add_argument('--api-base')
+    llm_batch.add_argument('--context', action='store_true',
+                           help="put matching chunks from the notes index in front of each prompt")
+    llm_batch.set_defaults(run=run_llm_batch)
+    
+    index = commands.add_parser('index', help="index folders of notes and search them by meaning")
+    index.add_argument('folders', nargs='*', help="folders to add; indexed folders are always updated")
+    index.add_argument('--query', help="print the chunks that best match this text")
+    index.add_argument('--top', type=int, default=5)
+    index.set_defaults(run=run_index)
+    
+    telegram = commands.add_parser('telegram', help="send a text file to Telegram")
+    telegram.add_argument('input', nargs='?', default='-', help="file to send ('-' for stdin)")
+    telegram.add_argument('--token')
+    telegram.add_argument('--chat-id')
+    telegram.set_defaults(run=run_telegram)
+    
+    convert = commands.add_parser('convert', help="re-encode a text file or change its line endings")
+    convert.add_argument('source')
+    convert.add_argument('target')
+    convert.add_argument('--from-encoding', help="default: detected from the file")
+    convert.add_argument('--to-encoding', default='utf-8')
+    convert.add_argument('--newline', choices=['keep', 'lf', 'crlf'], default='keep')
+    convert.set_defaults(run=run_convert)
+    
+    args = parser.parse_args(argv)
+    profiler.enabled = bool(args.profile)
+    try:
+        args.run(args)
+    finally:
+        if args.profile:
+            profiler.export_chrome_trace(args.profile)
+
+if __name__ == "__main__":
+    main()